@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+S3 访问日志压缩工具
+将某一天投递的大量小日志文件解析后合并为按源 bucket 划分、按时间排序的
+Parquet 列式归档，Web 应用加载时优先读取已压缩的日期，只对未压缩的部分读取原始日志
+"""
+import argparse
+import io
+import json
+import os
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from log_parser import (
+    PipelineStats, list_log_files, log_key_layout, fetch_log_runs, runs_to_dataframe, compact_string_columns, concat_logs
+)
+
+# 每个已压缩日期目录下的清单文件，最后写入，作为该日期压缩完成的标记
+MANIFEST_NAME = '_manifest.json'
+ARCHIVE_COMPRESSION = 'zstd'
+# 每个日志源一个倒排索引：对象键 / request_id -> (归档文件, 行号)
+INDEX_NAME = '_index.sqlite'
+INDEX_TERM_TYPES = ('key', 'request_id')
+# 流式读取归档时同时下载的文件数，内存中最多保留这么多个文件的压缩数据
+ARCHIVE_READ_WORKERS = 16
+
+def split_s3_uri(uri):
+    """拆分 s3://bucket/prefix"""
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key.strip('/')
+
+class LogArchive:
+    """压缩归档存储，位置可以是本地目录或 s3://bucket/prefix"""
+
+    def __init__(self, root, s3_client=None):
+        self.root = root
+        self.is_s3 = root.startswith('s3://')
+        if self.is_s3:
+            self.bucket, self.base_key = split_s3_uri(root)
+            self.s3_client = s3_client or boto3.client('s3')
+
+    @staticmethod
+    def source_dir(log_bucket, prefix):
+        """日志源在归档中的相对目录"""
+        return f"{log_bucket}/{prefix.strip('/') or '_root'}"
+
+    def _location(self, rel_path):
+        if self.is_s3:
+            return f"{self.base_key}/{rel_path}" if self.base_key else rel_path
+        return os.path.join(self.root, *rel_path.split('/'))
+
+    def write(self, rel_path, data):
+        """写入归档文件"""
+        location = self._location(rel_path)
+        if self.is_s3:
+            self.s3_client.put_object(Bucket=self.bucket, Key=location, Body=data)
+        else:
+            os.makedirs(os.path.dirname(location), exist_ok=True)
+            with open(location, 'wb') as f:
+                f.write(data)
+
+    def read(self, rel_path):
+        """读取归档文件，不存在时返回 None"""
+        location = self._location(rel_path)
+        if self.is_s3:
+            try:
+                return self.s3_client.get_object(Bucket=self.bucket, Key=location)['Body'].read()
+            except self.s3_client.exceptions.NoSuchKey:
+                return None
+        if not os.path.exists(location):
+            return None
+        with open(location, 'rb') as f:
+            return f.read()
+
+    def list_dirs(self, rel_dir):
+        """列出归档目录下的子目录名"""
+        location = self._location(rel_dir)
+        if self.is_s3:
+            names = []
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=location.rstrip('/') + '/', Delimiter='/'):
+                names.extend(p['Prefix'].rstrip('/').rsplit('/', 1)[-1] for p in page.get('CommonPrefixes', []))
+            return names
+        if not os.path.isdir(location):
+            return []
+        return [name for name in os.listdir(location) if os.path.isdir(os.path.join(location, name))]
+
+    def list_days(self, log_bucket, prefix, since_day=None):
+        """返回日志源已压缩日期的清单 {日期: manifest}"""
+        source_dir = self.source_dir(log_bucket, prefix)
+        days = sorted(d for d in self.list_dirs(source_dir) if not since_day or d >= since_day)
+
+        def read_manifest(day):
+            data = self.read(f"{source_dir}/{day}/{MANIFEST_NAME}")
+            return day, json.loads(data) if data else None
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            return {day: manifest for day, manifest in executor.map(read_manifest, days) if manifest}
+
+    def index_path(self, log_bucket, prefix):
+        """倒排索引的本地路径，S3 归档会先下载到本地临时目录"""
+        rel_path = f"{self.source_dir(log_bucket, prefix)}/{INDEX_NAME}"
+        if not self.is_s3:
+            path = self._location(rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            return path
+        path = os.path.join(tempfile.gettempdir(), 's3-log-index', self.bucket, *self._location(rel_path).split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = self.read(rel_path)
+        if data:
+            with open(path, 'wb') as f:
+                f.write(data)
+        elif os.path.exists(path):
+            os.remove(path)
+        return path
+
+    def publish_index(self, log_bucket, prefix, path):
+        """将更新后的倒排索引写回 S3 归档（本地归档无需处理）"""
+        if self.is_s3:
+            with open(path, 'rb') as f:
+                self.write(f"{self.source_dir(log_bucket, prefix)}/{INDEX_NAME}", f.read())
+
+class LogIndex:
+    """对象键和 request_id 到归档位置 (文件, 行号) 的持久化倒排索引 (SQLite)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS postings (term_type TEXT, term TEXT, day TEXT, file TEXT, row INTEGER)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_postings_term ON postings (term_type, term)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_postings_day ON postings (day)')
+
+    def add_file(self, day, file_path, df):
+        """为一个归档文件建立索引，行号即文件内的行偏移"""
+        for term_type in INDEX_TERM_TYPES:
+            terms = df[term_type].to_numpy()
+            self.conn.executemany(
+                'INSERT INTO postings VALUES (?, ?, ?, ?, ?)',
+                ((term_type, term, day, file_path, row) for row, term in enumerate(terms) if term and term != '-')
+            )
+
+    def remove_day(self, day):
+        """删除某天的索引（重新压缩前调用）"""
+        self.conn.execute('DELETE FROM postings WHERE day = ?', (day,))
+
+    def lookup(self, term_type, term, since_day=None):
+        """返回 {归档文件: [行号, ...]}"""
+        sql = 'SELECT file, row FROM postings WHERE term_type = ? AND term = ?'
+        params = [term_type, term]
+        if since_day:
+            sql += ' AND day >= ?'
+            params.append(since_day)
+        locations = {}
+        for file_path, row in self.conn.execute(sql + ' ORDER BY file, row', params):
+            locations.setdefault(file_path, []).append(row)
+        return locations
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+def compact_day(s3_client, log_bucket, prefix, day, archive, stats=None, index=None):
+    """压缩一天的原始日志：按源 bucket 写出排序后的 Parquet 文件，最后写清单
+
+    支持 SimplePrefix 和 PartitionedPrefix 两种日志键格式，无法识别时抛出 ValueError。
+    传入 index 时同时为写出的文件建立对象键 / request_id 倒排索引。
+    """
+    stats = stats or PipelineStats()
+    label = f"{log_bucket}/{prefix}"
+
+    # 原始日志键格式: <prefix>YYYY-mm-DD-HH-MM-SS-UniqueString (SimplePrefix)
+    # 或 <prefix>YYYY/mm/DD/YYYY-mm-DD-HH-MM-SS-UniqueString (PartitionedPrefix)
+    layout = log_key_layout(s3_client, log_bucket, prefix)
+    if layout is None:
+        return None
+    if layout == 'mixed':
+        raise ValueError(f"无法识别 s3://{log_bucket}/{prefix} 下的日志键格式，请指定日志所在的前缀")
+    day_prefix = f"{prefix}{day.replace('-', '/')}/" if layout == 'partitioned' else f"{prefix}{day}-"
+    log_files, _ = list_log_files(s3_client, log_bucket, day_prefix, max_files=None)
+    if not log_files:
+        return None
+
+    tasks = [(s3_client, log_bucket, obj['Key'], label, obj['Size']) for obj in log_files]
+    df = runs_to_dataframe(fetch_log_runs(tasks, stats), stats)
+
+    source_dir = archive.source_dir(log_bucket, prefix)
+    manifest = {
+        'day': day,
+        'log_bucket': log_bucket,
+        'prefix': prefix,
+        'raw_keys': sorted(obj['Key'] for obj in log_files),
+        'raw_bytes': sum(obj['Size'] for obj in log_files),
+        'files': {},
+        'compacted_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+    if index is not None:
+        index.remove_day(day)
+
+    if not df.empty:
+        # 日志源标签由加载端按配置填充，不写入归档
+        df = df.drop(columns=['source'])
+        for bucket, part in df.groupby('bucket', sort=True, observed=True):
+            with stats.stage('write_parquet', items=len(part)) as counters:
+                buffer = io.BytesIO()
+                pq.write_table(pa.Table.from_pandas(part, preserve_index=False), buffer, compression=ARCHIVE_COMPRESSION)
+                rel_path = f"{source_dir}/{day}/{bucket}.parquet"
+                archive.write(rel_path, buffer.getvalue())
+                counters['bytes'] = buffer.tell()
+            manifest['files'][bucket] = {'path': rel_path, 'rows': len(part), 'bytes': buffer.tell()}
+            if index is not None:
+                with stats.stage('index', items=len(part)):
+                    index.add_file(day, rel_path, part)
+
+    archive.write(f"{source_dir}/{day}/{MANIFEST_NAME}", json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+    return manifest
+
+def list_compacted(archive, sources, since_day=None):
+    """列出各日志源已压缩的日期，只读取清单，不读取归档数据
+
+    返回 ([(日志源标签, manifest)], {日志源标签: 已压缩的原始日志键集合}, 归档总行数)，
+    加载端据此在读取前规划内存并跳过这些原始日志，清单之外的晚到日志仍按原始文件读取。
+    """
+    days, compacted_keys = [], {}
+    for bucket, prefix, _ in sources:
+        label = f"{bucket}/{prefix}"
+        manifests = archive.list_days(bucket, prefix, since_day)
+        compacted_keys[label] = {key for manifest in manifests.values() for key in manifest['raw_keys']}
+        days.extend((label, manifest) for manifest in manifests.values())
+    rows = sum(info['rows'] for _, manifest in days for info in manifest['files'].values())
+    return days, compacted_keys, rows
+
+def iter_compacted(archive, days, batch_rows=None, stats=None):
+    """按日期顺序流式读取归档，每次产出不超过 batch_rows 行的 DataFrame（None 时每个文件一批）
+
+    每次并发下载 ARCHIVE_READ_WORKERS 个归档文件，逐批解码后即交给调用方，
+    内存中只保留这一组文件的压缩数据和当前一批行。
+    """
+    stats = stats or PipelineStats()
+    files = [(label, info) for label, manifest in days for info in manifest['files'].values()]
+    with ThreadPoolExecutor(max_workers=ARCHIVE_READ_WORKERS) as executor:
+        for start in range(0, len(files), ARCHIVE_READ_WORKERS):
+            group = files[start:start + ARCHIVE_READ_WORKERS]
+            with stats.stage('archive_read') as counters:
+                contents = list(executor.map(lambda file: archive.read(file[1]['path']), group))
+                counters['bytes'] = sum(len(data) for data in contents if data)
+            for (label, _), data in zip(group, contents):
+                if not data:
+                    continue
+                parquet = pq.ParquetFile(io.BytesIO(data))
+                for batch in parquet.iter_batches(batch_size=batch_rows or max(parquet.metadata.num_rows, 1)):
+                    with stats.stage('archive_decode', items=batch.num_rows):
+                        df = pa.Table.from_batches([batch]).to_pandas()
+                        df['source'] = label
+                    yield compact_string_columns(df, stats)
+
+def load_compacted(archive, days, stats=None):
+    """一次读取 list_compacted 列出的全部归档（完整明细模式），返回 DataFrame"""
+    return concat_logs(list(iter_compacted(archive, days, stats=stats)))
+
+def lookup_archive(archive, index, term_type, term, since_day=None):
+    """通过倒排索引点查，只读取包含该对象键 / request_id 的归档文件"""
+    frames = []
+    for file_path, rows in index.lookup(term_type, term, since_day).items():
+        data = archive.read(file_path)
+        if data:
+            frames.append(pd.read_parquet(io.BytesIO(data)).iloc[rows])
+    df = concat_logs(frames)
+    return df.sort_values('time', kind='mergesort') if not df.empty else df
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(
+        description='S3 访问日志压缩工具',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 压缩昨天的日志到本地 archive/ 目录
+  python log_compactor.py --bucket my-log-bucket --prefix s3logs/
+
+  # 压缩最近 7 个完整日期，写回 S3
+  python log_compactor.py --bucket my-log-bucket --prefix s3logs/ --days 7 --output s3://my-log-bucket/s3logs-compacted
+
+  # 压缩指定日期
+  python log_compactor.py --bucket my-log-bucket --prefix s3logs/ --date 2025-11-12
+
+  # 通过倒排索引查询最近 90 天谁访问过某个对象
+  python log_compactor.py --bucket my-log-bucket --prefix s3logs/ --lookup-key path/to/file.bak --since-days 90
+
+  # 按 request_id 查询
+  python log_compactor.py --bucket my-log-bucket --prefix s3logs/ --lookup-request-id 3E57427F3EXAMPLE
+
+注意:
+  - 默认不压缩当天（UTC）的日志，当天日志仍在持续投递
+  - 已压缩的日期会跳过，使用 --force 重新压缩
+        """
+    )
+    parser.add_argument('--bucket', required=True, help='存放访问日志的 bucket')
+    parser.add_argument('--prefix', default='s3logs/', help='日志前缀 (默认: s3logs/)')
+    parser.add_argument('--region', default=None, help='日志 bucket 所在区域')
+    parser.add_argument('--date', action='append', help='要压缩的日期 YYYY-MM-DD，可重复指定')
+    parser.add_argument('--days', type=int, default=1, help='压缩今天之前的最近 N 个完整日期 (默认: 1)')
+    parser.add_argument('--output', default=os.path.join(script_dir, 'archive'),
+                        help='归档位置，本地目录或 s3://bucket/prefix (默认: 脚本目录下的 archive/)')
+    parser.add_argument('--force', action='store_true', help='重新压缩已压缩的日期')
+    parser.add_argument('--lookup-key', help='查询访问过该对象键的日志（不执行压缩）')
+    parser.add_argument('--lookup-request-id', help='查询该 request_id 的日志（不执行压缩）')
+    parser.add_argument('--since-days', type=int, default=None, help='查询时只检索最近 N 天')
+
+    args = parser.parse_args()
+
+    s3_client = boto3.client('s3', region_name=args.region) if args.region else boto3.client('s3')
+    archive = LogArchive(args.output)
+
+    if args.lookup_key or args.lookup_request_id:
+        term_type, term = ('key', args.lookup_key) if args.lookup_key else ('request_id', args.lookup_request_id)
+        since_day = None
+        if args.since_days:
+            since_day = (datetime.now(timezone.utc) - timedelta(days=args.since_days)).strftime('%Y-%m-%d')
+        index = LogIndex(archive.index_path(args.bucket, args.prefix))
+        df = lookup_archive(archive, index, term_type, term, since_day)
+        index.close()
+        if df.empty:
+            print(f"未找到 {term_type}={term} 的日志记录")
+            return 0
+        columns = ['time', 'bucket', 'operation', 'key', 'http_status', 'requester', 'remote_ip', 'request_id']
+        print(df[columns].to_string(index=False))
+        print(f"\n共 {len(df)} 条记录")
+        return 0
+
+    if args.date:
+        days = sorted(args.date)
+    else:
+        today = datetime.now(timezone.utc).date()
+        days = [(today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(args.days, 0, -1)]
+
+    existing = archive.list_days(args.bucket, args.prefix) if not args.force else {}
+
+    print(f"\n{'='*80}")
+    print(f"S3 访问日志压缩")
+    print(f"日志源: s3://{args.bucket}/{args.prefix}")
+    print(f"归档位置: {args.output}")
+    print(f"{'='*80}\n")
+
+    index_path = archive.index_path(args.bucket, args.prefix)
+    index = LogIndex(index_path)
+
+    for day in days:
+        if day in existing:
+            print(f"  ⏭️  {day} 已压缩，跳过")
+            continue
+
+        stats = PipelineStats()
+        manifest = compact_day(s3_client, args.bucket, args.prefix, day, archive, stats, index)
+        index.commit()
+        if manifest is None:
+            print(f"  ⚠️  {day} 没有日志文件")
+            continue
+
+        rows = sum(info['rows'] for info in manifest['files'].values())
+        archive_bytes = sum(info['bytes'] for info in manifest['files'].values())
+        print(f"  ✓ {day}: {len(manifest['raw_keys']):,} 个原始文件 ({manifest['raw_bytes'] / 1024**2:.1f} MB)"
+              f" -> {len(manifest['files'])} 个归档文件 ({archive_bytes / 1024**2:.1f} MB), {rows:,} 条记录")
+
+    index.close()
+    archive.publish_index(args.bucket, args.prefix, index_path)
+
+    print(f"\n完成!")
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
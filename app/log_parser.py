@@ -0,0 +1,737 @@
+#!/usr/bin/env python3
+"""
+S3 Server Access Log 解析与加载
+Web 应用和日志压缩工具共用的解析、并发下载和 DataFrame 构建逻辑
+"""
+import boto3
+import pandas as pd
+import pyarrow as pa
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from itertools import islice
+import hashlib
+import heapq
+import math
+import os
+import re
+import struct
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+# 编译正则表达式提升性能
+LOG_PATTERN = re.compile(r'(\S+) (\S+) \[(.*?)\] (\S+) (\S+) (\S+) (\S+) (\S+) "(\S+) (\S+) (\S+)" (\S+) (\S+) (\S+) (\S+) (\S+) (\S+) "([^"]*)" "([^"]*)" (\S+)')
+
+# 视为成功的 HTTP 状态码，其余计为错误请求
+SUCCESS_STATUSES = ['200', '204', '206', '304']
+
+# 日志时间中的月份缩写，用于生成可直接比较的排序键
+MONTH_NUM = {m: f'{i:02d}' for i, m in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], 1)}
+
+def peak_memory_mb():
+    """进程启动以来的峰值常驻内存 (MB)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def current_memory_mb():
+    """当前进程的常驻内存 (MB)，没有 /proc 时返回 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class PipelineStats:
+    """记录流水线各阶段的耗时、CPU 时间、处理量和内存
+
+    并发阶段（下载、解码、解析）由各工作线程累加，wall_s 为各线程耗时之和。
+    process_peak_mb 是阶段最后一次结束时整个进程的峰值常驻内存（进程启动以来的最大值，
+    不是该阶段自身的占用）；rss_delta_mb 是 stage() 块前后常驻内存的变化之和，只反映
+    该阶段留下的内存增长，由工作线程直接 add() 的并发阶段不统计。
+    """
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+    
+    def add(self, name, wall=0.0, cpu=0.0, items=0, nbytes=0, rss_delta=None):
+        """累加一个阶段的指标（线程安全）"""
+        memory = peak_memory_mb()
+        with self._lock:
+            stage = self.stages.setdefault(name, {
+                'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'items': 0, 'bytes': 0, 'process_peak_mb': None,
+                'rss_delta_mb': None
+            })
+            stage['calls'] += 1
+            stage['wall_s'] += wall
+            stage['cpu_s'] += cpu
+            stage['items'] += items
+            stage['bytes'] += nbytes
+            stage['process_peak_mb'] = memory
+            if rss_delta is not None:
+                stage['rss_delta_mb'] = (stage['rss_delta_mb'] or 0.0) + rss_delta
+    
+    @contextmanager
+    def stage(self, name, items=0, nbytes=0):
+        """计时一个阶段，可在 with 块内更新返回字典中的 items/bytes"""
+        counters = {'items': items, 'bytes': nbytes}
+        wall, cpu, rss = time.perf_counter(), time.process_time(), current_memory_mb()
+        try:
+            yield counters
+        finally:
+            end_rss = current_memory_mb()
+            rss_delta = end_rss - rss if rss is not None and end_rss is not None else None
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu,
+                     counters['items'], counters['bytes'], rss_delta)
+    
+    def to_dict(self):
+        """导出为可 JSON 序列化的字典"""
+        with self._lock:
+            return {name: dict(stage) for name, stage in self.stages.items()}
+
+class StageLap:
+    """在工作线程内按顺序分段计时，CPU 时间使用线程时间"""
+    def __init__(self, stats):
+        self.stats = stats
+        self.wall, self.cpu = time.perf_counter(), time.thread_time()
+    
+    def __call__(self, name, items=0, nbytes=0):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        self.stats.add(name, wall - self.wall, cpu - self.cpu, items, nbytes)
+        self.wall, self.cpu = wall, cpu
+
+def parse_s3_log_line(line):
+    """解析 S3 访问日志行"""
+    match = LOG_PATTERN.match(line)
+    if match:
+        return {
+            'bucket_owner': match.group(1),
+            'bucket': match.group(2),
+            'time': match.group(3),
+            'remote_ip': match.group(4),
+            'requester': match.group(5),
+            'request_id': match.group(6),
+            'operation': match.group(7),
+            'key': match.group(8),
+            'request_uri': match.group(9),
+            'http_status': match.group(12),
+            'error_code': match.group(13),
+            'bytes_sent': match.group(14),
+            'object_size': match.group(15),
+            'total_time': match.group(16),
+            'turn_around_time': match.group(17),
+            'referer': match.group(18),
+            'user_agent': match.group(19),
+            'version_id': match.group(20)
+        }
+    return None
+
+# 日志中的字符串列 (time 会转换为时间戳，bytes_sent 转换为数值)
+STRING_COLUMNS = ['bucket_owner', 'bucket', 'remote_ip', 'requester', 'request_id', 'operation', 'key',
+                  'request_uri', 'http_status', 'error_code', 'object_size', 'total_time', 'turn_around_time',
+                  'referer', 'user_agent', 'version_id', 'source']
+
+# 不同取值占行数比例不超过该值的列使用字典编码 (category)，其余列使用 Arrow 字符串
+DICTIONARY_MAX_RATIO = 0.5
+
+def log_sort_key(row):
+    """生成日志行的时间排序键 (06/Feb/2019:00:00:38 +0000 -> 2019020600:00:38)"""
+    t = row['time']
+    return t[7:11] + MONTH_NUM.get(t[3:6], '00') + t[0:2] + t[12:20]
+
+# 内存预算 (MB)，加载前按列出的日志大小估算内存并据此选择加载模式
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get('S3_LOG_MEMORY_BUDGET_MB', 2048))
+LOG_LINE_BYTES = 400  # 原始日志行的平均字节数
+ROW_PEAK_BYTES = 3 * 1024  # 解析阶段每行的峰值内存 (dict + 字符串对象 + DataFrame 构建)
+ROW_STORED_BYTES = 512  # 列式存储后每行的内存
+SAMPLE_MODE_MAX_RATIO = 10  # 预计内存超过预算该倍数时只保留小时汇总
+SAMPLE_BUDGET_SHARE = 0.25  # 抽样模式下抽样行和每批解析各自可使用的预算比例
+MAX_SAMPLE_ROWS = 100000
+MIN_SAMPLE_ROWS = 1000
+
+# 加载模式: 完整明细 / 汇总 + 抽样 / 仅汇总
+LOAD_MODES = {'full': '完整明细', 'sample': '汇总 + 抽样', 'rollups': '仅汇总'}
+
+def plan_load(total_bytes, budget_mb=DEFAULT_MEMORY_BUDGET_MB, known_rows=0):
+    """按日志总大小估算行数和峰值内存，与内存预算比较后选择加载模式
+
+    known_rows 为行数已知、无需按大小估算的日志（压缩归档清单中的行数、追踪模式下
+    已加载的行数）。返回包含模式、估算值、
+    抽样行数和每批解析行数的字典。
+    """
+    budget = budget_mb * 1024**2
+    rows = int(total_bytes / LOG_LINE_BYTES) + known_rows
+    peak = rows * ROW_PEAK_BYTES
+    sample_rows = min(MAX_SAMPLE_ROWS, int(budget * SAMPLE_BUDGET_SHARE / ROW_STORED_BYTES))
+    if peak <= budget:
+        mode = 'full'
+    elif peak <= budget * SAMPLE_MODE_MAX_RATIO and sample_rows >= MIN_SAMPLE_ROWS:
+        mode = 'sample'
+    else:
+        mode, sample_rows = 'rollups', 0
+    return {
+        'mode': mode,
+        'estimated_rows': rows,
+        'estimated_mb': round(peak / 1024**2, 1),
+        'budget_mb': budget_mb,
+        'sample_rows': sample_rows if mode == 'sample' else 0,
+        'batch_rows': max(int(budget * SAMPLE_BUDGET_SHARE / ROW_PEAK_BYTES), 1),
+    }
+
+# 布隆过滤器覆盖的检索字段
+BLOOM_FIELDS = ('key', 'requester', 'remote_ip')
+DEFAULT_BLOOM_FP_RATE = 0.01
+DEFAULT_CACHE_DIR = os.environ.get('S3_LOG_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache'))
+
+class BloomFilter:
+    """布隆过滤器，位数和哈希次数由容量和误判率计算，可序列化为 bytes"""
+    def __init__(self, capacity, fp_rate=DEFAULT_BLOOM_FP_RATE, size=None, hash_count=None, bits=None):
+        capacity = max(capacity, 1)
+        self.size = size or max(64, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hash_count = hash_count or max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+    
+    def _positions(self, item):
+        # 双重哈希: h1 + i * h2
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+    
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+    
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+    
+    def to_bytes(self):
+        return struct.pack('<QI', self.size, self.hash_count) + bytes(self.bits)
+    
+    @classmethod
+    def from_bytes(cls, data):
+        size, hash_count = struct.unpack_from('<QI', data)
+        return cls(1, size=size, hash_count=hash_count, bits=bytearray(data[12:]))
+
+def bloom_item(field, value):
+    """布隆过滤器中的条目，按字段区分"""
+    return f"{field}\x00{value}"
+
+class BloomCache:
+    """已解析日志文件的布隆过滤器缓存，每个日志文件一个 sidecar 文件"""
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, fp_rate=DEFAULT_BLOOM_FP_RATE):
+        self.root = os.path.join(cache_dir, 'bloom')
+        self.fp_rate = fp_rate
+    
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/')) + '.bloom'
+    
+    def get(self, bucket, key):
+        """读取日志文件的布隆过滤器，未缓存时返回 None"""
+        try:
+            with open(self._path(bucket, key), 'rb') as f:
+                return BloomFilter.from_bytes(f.read())
+        except (OSError, struct.error):
+            return None
+    
+    def put(self, bucket, key, logs):
+        """根据解析结果为日志文件生成布隆过滤器并写入缓存"""
+        items = {bloom_item(field, row[field]) for row in logs for field in BLOOM_FIELDS}
+        bloom = BloomFilter(len(items), self.fp_rate)
+        for item in items:
+            bloom.add(item)
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，避免并发读到半个文件
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(bloom.to_bytes())
+        os.replace(tmp_path, path)
+
+def process_log_file(s3_client, bucket, key, source=None, stats=None, bloom_cache=None):
+    """处理单个日志文件（返回按时间排序的记录）"""
+    lap = StageLap(stats or PipelineStats())
+    try:
+        log_obj = s3_client.get_object(Bucket=bucket, Key=key)
+        lap('get_object', items=1)
+        body = log_obj['Body'].read()
+        lap('read_body', items=1, nbytes=len(body))
+        content = body.decode('utf-8')
+        lap('decode', nbytes=len(body))
+        
+        logs = []
+        lines = 0
+        for line in content.strip().split('\n'):
+            if line:
+                lines += 1
+                parsed = parse_s3_log_line(line)
+                if parsed:
+                    parsed['source'] = source or bucket
+                    logs.append(parsed)
+        # 单个文件内基本有序，排序代价接近 O(n)，供后续 k 路归并使用
+        logs.sort(key=log_sort_key)
+        lap('parse', items=lines)
+        if bloom_cache is not None:
+            bloom_cache.put(bucket, key, logs)
+            lap('bloom', items=len(logs))
+        return logs
+    except Exception:
+        # 读取或解析失败的文件跳过，失败数计入 failed_files 阶段，显示在诊断面板中
+        lap('failed_files', items=1)
+        return []
+
+# 日志前缀之后的键格式，两种格式的键都按投递时间字典序递增
+SIMPLE_KEY_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2}-')  # YYYY-mm-DD-HH-MM-SS-UniqueString
+PARTITIONED_KEY_PATTERN = re.compile(r'\d{4}/\d{2}/\d{2}/\d{4}-\d{2}-\d{2}-')  # YYYY/mm/DD/YYYY-mm-DD-...
+YEAR_DIR_PATTERN = re.compile(r'\d{4}/')
+# 由 cutoff_time 推算起始键时提前的时间，覆盖投递延迟和按事件时间分区的日志
+LOG_KEY_MARGIN = timedelta(days=1)
+# 从最新的日志往前按时间窗口列出时第一个窗口的长度，之后每个窗口加倍
+LOG_LIST_WINDOW = timedelta(hours=1)
+
+def log_key_layout(s3_client, bucket, prefix):
+    """探测日志前缀下的键格式
+
+    前缀下一级只有 SimplePrefix 日志键时返回 'simple'，只有 YYYY/ 年份目录且其中是
+    PartitionedPrefix 日志键时返回 'partitioned'，没有对象时返回 None；其余情况（上级前缀、
+    两种格式混在一起、其他对象）返回 'mixed'，此时不能按键推算投递时间。
+    """
+    page = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix, Delimiter='/')
+    names = [obj['Key'][len(prefix):] for obj in page.get('Contents', [])]
+    dirs = [p['Prefix'][len(prefix):] for p in page.get('CommonPrefixes', [])]
+    if not names and not dirs:
+        return None
+    if names and not dirs and all(SIMPLE_KEY_PATTERN.match(name) for name in names):
+        return 'simple'
+    if dirs and not names and all(YEAR_DIR_PATTERN.fullmatch(d) for d in dirs):
+        first = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix, MaxKeys=1).get('Contents', [])
+        if first and PARTITIONED_KEY_PATTERN.match(first[0]['Key'][len(prefix):]):
+            return 'partitioned'
+    return 'mixed'
+
+def log_key_start(prefix, layout, when):
+    """早于 when 投递的日志键都不大于该键，用作列出日志的 StartAfter"""
+    stamp = when.strftime('%Y-%m-%d-%H-%M-%S')
+    if layout == 'partitioned':
+        return f"{prefix}{when:%Y/%m/%d}/{stamp}"
+    return f"{prefix}{stamp}"
+
+def iter_log_objects(s3_client, bucket, prefix, start_after=None, end_before=None):
+    """按键的字典序列出 (start_after, end_before) 区间内的对象"""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    params = {'Bucket': bucket, 'Prefix': prefix}
+    if start_after:
+        params['StartAfter'] = start_after
+    for page in paginator.paginate(**params, PaginationConfig={'PageSize': 1000}):
+        for obj in page.get('Contents', []):
+            if end_before and obj['Key'] >= end_before:
+                return
+            yield obj
+
+def list_log_files(s3_client, bucket, prefix, max_files, cutoff_time=None, start_after=None, exclude_keys=None):
+    """列出单个日志源下的日志文件，返回 (文件列表, 最大日志键)
+
+    日志键以投递时间开头，按字典序即按时间递增。键格式可识别时，指定 max_files 返回时间范围内
+    最新的 max_files 个文件：从当前时间往前按时间窗口（每次加倍）推算键区间逐段列出，够数即停，
+    不会列出全部历史日志；指定 cutoff_time 时不列出早于它对应的键。最大日志键为列出的最新的键，
+    追踪模式从这里继续。
+
+    键格式无法识别（上级前缀、混合格式）时不推算起始键，从头列出并按修改时间过滤，指定 max_files
+    时列够即停。传入 start_after（追踪模式）时列出该键之后的全部新文件，超过 max_files 时保留最新的。
+    exclude_keys 中的文件（如已压缩归档的原始日志）不计入 max_files。
+    """
+    exclude_keys = exclude_keys or set()
+    
+    def eligible(obj):
+        return obj['Size'] > 0 and obj['Key'] not in exclude_keys and (
+            not cutoff_time or obj['LastModified'] >= cutoff_time)
+    
+    if start_after:
+        log_files, last_key = deque(maxlen=max_files or None), start_after
+        for obj in iter_log_objects(s3_client, bucket, prefix, start_after):
+            last_key = obj['Key']
+            if eligible(obj):
+                log_files.append(obj)
+        return list(log_files), last_key
+    
+    layout = log_key_layout(s3_client, bucket, prefix) if cutoff_time or max_files else None
+    if layout not in ('simple', 'partitioned'):
+        log_files, last_key = [], None
+        for obj in iter_log_objects(s3_client, bucket, prefix):
+            last_key = obj['Key']
+            if eligible(obj):
+                log_files.append(obj)
+                if max_files and len(log_files) >= max_files:
+                    break
+        return log_files, last_key
+    
+    lower_key = log_key_start(prefix, layout, cutoff_time - LOG_KEY_MARGIN) if cutoff_time else None
+    first = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix, MaxKeys=1)['Contents'][0]['Key']
+    now = datetime.now(timezone.utc)
+    window, end_key, last_key, chunks, count = LOG_LIST_WINDOW, None, None, [], 0
+    while True:
+        # 不限文件数时直接从下界列出；否则从最新的窗口开始，每次往前推一个加倍的窗口
+        start_key = log_key_start(prefix, layout, now - window) if max_files else lower_key
+        final = not max_files or start_key <= first
+        if lower_key and (start_key is None or start_key <= lower_key):
+            start_key, final = lower_key, True
+        chunk = []
+        for obj in iter_log_objects(s3_client, bucket, prefix, start_key, end_key):
+            if last_key is None or obj['Key'] > last_key:
+                last_key = obj['Key']
+            if eligible(obj):
+                chunk.append(obj)
+        chunks.append(chunk)
+        count += len(chunk)
+        if final or count >= max_files:
+            break
+        end_key, window = start_key, window * 2
+    
+    log_files = [obj for chunk in reversed(chunks) for obj in chunk]
+    return log_files[-max_files:] if max_files else log_files, last_key or lower_key
+
+def get_s3_clients(sources):
+    """按区域创建 S3 客户端"""
+    clients = {}
+    for _, _, region in sources:
+        if region not in clients:
+            clients[region] = boto3.client('s3', region_name=region) if region else boto3.client('s3')
+    return clients
+
+# 发现日志配置时的并发数
+DISCOVERY_WORKERS = 32
+
+def bucket_region(s3_client, bucket):
+    """查询 bucket 所在区域（us-east-1 和旧版 EU 的 LocationConstraint 需要转换）"""
+    location = s3_client.get_bucket_location(Bucket=bucket)['LocationConstraint']
+    return {None: 'us-east-1', '': 'us-east-1', 'EU': 'eu-west-1'}.get(location, location)
+
+def discover_log_targets(max_workers=DISCOVERY_WORKERS):
+    """并发查询账户内所有 bucket 的服务器访问日志配置
+
+    每个 bucket 使用所在区域的客户端调用 get_bucket_logging，返回
+    {源 bucket: {'bucket': 日志 bucket, 'prefix': 日志前缀, 'region': 区域}}。
+    未开启访问日志或没有权限读取配置的 bucket 不包含在内。使用分区前缀格式
+    (PartitionedPrefix) 时，日志前缀包含 账户 ID/区域/源 bucket 一级。
+    """
+    s3 = boto3.client('s3')
+    buckets = s3.list_buckets()['Buckets']
+    clients = {}
+    lock = threading.Lock()
+    account = []
+    
+    def regional_client(region):
+        with lock:
+            if region not in clients:
+                clients[region] = boto3.client('s3', region_name=region)
+            return clients[region]
+    
+    def account_id():
+        with lock:
+            if not account:
+                account.append(boto3.client('sts').get_caller_identity()['Account'])
+            return account[0]
+    
+    def lookup(bucket):
+        name = bucket['Name']
+        try:
+            region = bucket.get('BucketRegion') or bucket_region(s3, name)
+            logging = regional_client(region).get_bucket_logging(Bucket=name).get('LoggingEnabled')
+            if not logging:
+                return name, None
+            prefix = logging.get('TargetPrefix', '')
+            if 'PartitionedPrefix' in logging.get('TargetObjectKeyFormat', {}):
+                prefix += f"{account_id()}/{region}/{name}/"
+        except Exception:
+            return name, None
+        # 日志 bucket 必须与源 bucket 位于同一区域
+        return name, {'bucket': logging['TargetBucket'], 'prefix': prefix, 'region': region}
+    
+    with ThreadPoolExecutor(max_workers=min(len(buckets), max_workers) or 1) as executor:
+        return {name: target for name, target in executor.map(lookup, buckets) if target}
+
+def list_sources(clients, sources, max_files, cutoff_time=None, last_keys=None, stats=None, exclude_keys=None):
+    """并发列出所有日志源，返回 (下载任务列表, 各日志源最大日志键)
+
+    下载任务为 (客户端, bucket, 日志键, 日志源标签, 文件大小)。
+    last_keys 和 exclude_keys 均以日志源标签 ("bucket/prefix") 为键。
+    """
+    stats = stats or PipelineStats()
+    last_keys = last_keys or {}
+    exclude_keys = exclude_keys or {}
+    with stats.stage('list') as counters:
+        with ThreadPoolExecutor(max_workers=min(len(sources), 16) or 1) as executor:
+            listings = list(executor.map(
+                lambda src: list_log_files(clients[src[2]], src[0], src[1], max_files, cutoff_time,
+                                           last_keys.get(f"{src[0]}/{src[1]}"),
+                                           exclude_keys.get(f"{src[0]}/{src[1]}")),
+                sources
+            ))
+        
+        tasks = []
+        new_last_keys = dict(last_keys)
+        for (bucket, prefix, region), (log_files, last_key) in zip(sources, listings):
+            label = f"{bucket}/{prefix}"
+            tasks.extend((clients[region], bucket, obj['Key'], label, obj['Size']) for obj in log_files)
+            counters['bytes'] += sum(obj['Size'] for obj in log_files)
+            if last_key:
+                new_last_keys[label] = last_key
+        counters['items'] = len(tasks)
+    return tasks, new_last_keys
+
+# 进程级解析缓存的容量 (MB)
+# 共享解析缓存可占用的内存预算比例，加载计划只使用剩余的预算
+INGEST_CACHE_BUDGET_SHARE = 0.25
+DEFAULT_INGEST_CACHE_MB = int(os.environ.get('S3_LOG_INGEST_CACHE_MB',
+                                             DEFAULT_MEMORY_BUDGET_MB * INGEST_CACHE_BUDGET_SHARE))
+
+def ingest_cache_mb(budget_mb):
+    """从内存预算中划给共享解析缓存的容量，不超过 DEFAULT_INGEST_CACHE_MB"""
+    return min(DEFAULT_INGEST_CACHE_MB, int(budget_mb * INGEST_CACHE_BUDGET_SHARE))
+
+class _Flight:
+    """一次进行中的下载解析，等待者阻塞到领头线程写入结果"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.table = None
+
+class IngestCache:
+    """进程级的日志解析缓存，由所有会话共享
+
+    访问日志对象投递后不再修改，按 (bucket, 日志键, 日志源标签) 缓存解析结果，
+    缓存的是不可变的 Arrow 表，各会话只读取、不修改。同一对象的并发请求只由
+    第一个请求下载解析，其余请求等待其结果 (single-flight)。按字节数 LRU 淘汰，
+    超过容量的单个表不缓存。
+    """
+    def __init__(self, max_mb=DEFAULT_INGEST_CACHE_MB):
+        self.max_bytes = max_mb * 1024**2
+        self.nbytes = 0
+        self._tables = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+    
+    def resize(self, max_mb):
+        """调整缓存容量，超出新容量的部分立即按 LRU 淘汰"""
+        with self._lock:
+            self.max_bytes = max_mb * 1024**2
+            self._evict()
+    
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self._tables:
+            self.nbytes -= self._tables.popitem(last=False)[1].nbytes
+    
+    def get(self, task, stats=None, bloom_cache=None):
+        """返回一个日志文件解析后的 Arrow 表，文件为空或读取失败时返回 None"""
+        stats = stats or PipelineStats()
+        client, bucket, key, source = task[:4]
+        cache_key = (bucket, key, source or bucket)
+        with self._lock:
+            table = self._tables.get(cache_key)
+            if table is not None:
+                self._tables.move_to_end(cache_key)
+                stats.add('cache_hit', items=1, nbytes=table.nbytes)
+                return table
+            flight = self._inflight.get(cache_key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[cache_key] = _Flight()
+        
+        if not leader:
+            wall = time.perf_counter()
+            flight.done.wait()
+            stats.add('cache_wait', time.perf_counter() - wall, items=1)
+            return flight.table
+        
+        try:
+            logs = process_log_file(client, bucket, key, source, stats, bloom_cache)
+            flight.table = pa.Table.from_pylist(logs) if logs else None
+        finally:
+            with self._lock:
+                del self._inflight[cache_key]
+                # 失败或空文件不缓存，下次请求重新读取
+                if flight.table is not None and flight.table.nbytes <= self.max_bytes:
+                    self._tables[cache_key] = flight.table
+                    self.nbytes += flight.table.nbytes
+                    self._evict()
+            flight.done.set()
+        return flight.table
+    
+    def load(self, tasks, stats=None, bloom_cache=None):
+        """并发获取所有日志文件的 Arrow 表，已缓存的文件不再下载"""
+        stats = stats or PipelineStats()
+        get = partial(self.get, stats=stats, bloom_cache=bloom_cache)
+        with stats.stage('fetch', items=len(tasks)):
+            with ThreadPoolExecutor(max_workers=50) as executor:
+                batches = executor.map(lambda batch: [get(task) for task in batch], schedule_tasks(tasks))
+                return [table for tables in batches for table in tables if table is not None]
+
+# 小于该大小的日志文件合并为一批，由同一线程顺序处理，减少任务调度和请求排队的开销
+SMALL_OBJECT_BYTES = 64 * 1024
+SMALL_BATCH_BYTES = 1024 * 1024
+
+def schedule_tasks(tasks, workers=50, small_bytes=SMALL_OBJECT_BYTES, batch_bytes=SMALL_BATCH_BYTES):
+    """按文件大小安排下载顺序，返回任务批次列表
+
+    最长处理时间优先 (LPT)：批次按总大小降序排列，线程池按顺序取任务时最大的文件
+    最先开始，避免列表末尾的大文件拉长整体耗时；小文件按大小依次合批，
+    批次大小不超过小文件总量的 1/workers，保证小文件仍能分散到所有线程。
+    """
+    small_total = sum(task[4] for task in tasks if task[4] < small_bytes)
+    batch_bytes = max(min(batch_bytes, small_total // workers), 1)
+    batches, batch, batch_size = [], [], 0
+    for task in sorted(tasks, key=lambda task: task[4], reverse=True):
+        if task[4] >= small_bytes:
+            batches.append(([task], task[4]))
+            continue
+        batch.append(task)
+        batch_size += task[4]
+        if batch_size >= batch_bytes:
+            batches.append((batch, batch_size))
+            batch, batch_size = [], 0
+    if batch:
+        batches.append((batch, batch_size))
+    batches.sort(key=lambda item: item[1], reverse=True)
+    return [batch for batch, _ in batches]
+
+def iter_log_runs(tasks, stats=None, bloom_cache=None, max_workers=50):
+    """并发下载并解析日志文件，按完成顺序逐个产出有序片段
+
+    任务按 schedule_tasks 的顺序提交（大文件优先，小文件合批）。在途批次数限制为
+    线程数的两倍，调用方逐个消费片段时内存占用与总文件数无关。
+    """
+    stats = stats or PipelineStats()
+    fetch = partial(process_log_file, stats=stats, bloom_cache=bloom_cache)
+    batches = iter(schedule_tasks(tasks, max_workers))
+    
+    def fetch_batch(batch):
+        return [fetch(*task[:4]) for task in batch]
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(fetch_batch, batch) for batch in islice(batches, max_workers * 2)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            pending |= {executor.submit(fetch_batch, batch) for batch in islice(batches, len(done))}
+            for future in done:
+                for logs in future.result():
+                    if logs:
+                        yield logs
+
+def fetch_log_runs(tasks, stats=None, bloom_cache=None):
+    """并发下载并解析日志文件，每个文件返回一个有序片段
+
+    传入 bloom_cache 时为每个解析过的日志文件生成布隆过滤器。
+    """
+    stats = stats or PipelineStats()
+    with stats.stage('fetch', items=len(tasks)):
+        return list(iter_log_runs(tasks, stats, bloom_cache))
+
+def search_log_files(tasks, field, value, bloom_cache, stats=None):
+    """按字段精确检索日志文件
+
+    先用布隆过滤器排除一定不包含目标的文件，只下载解析剩余文件（未缓存过滤器的文件
+    解析后补建过滤器）。返回 (匹配记录列表, 被跳过的文件数)。
+    """
+    stats = stats or PipelineStats()
+    item = bloom_item(field, value)
+    candidates = []
+    with stats.stage('bloom_check', items=len(tasks)):
+        for task in tasks:
+            bloom = bloom_cache.get(task[1], task[2])
+            if bloom is None or item in bloom:
+                candidates.append(task)
+    
+    matches = []
+    for logs in fetch_log_runs(candidates, stats, bloom_cache):
+        matches.extend(row for row in logs if row[field] == value)
+    return matches, len(tasks) - len(candidates)
+
+def runs_to_dataframe(runs, stats=None):
+    """k 路归并有序片段，得到跨日志源的统一时间线"""
+    stats = stats or PipelineStats()
+    if not runs:
+        return pd.DataFrame()
+    with stats.stage('merge') as counters:
+        rows = list(heapq.merge(*runs, key=log_sort_key))
+        counters['items'] = len(rows)
+    with stats.stage('dataframe', items=len(rows)):
+        df = pd.DataFrame(rows)
+        del rows
+    return finish_dataframe(df, stats)
+
+def tables_to_dataframe(tables, stats=None):
+    """合并共享缓存中各日志文件的 Arrow 表，按时间排序得到统一时间线"""
+    stats = stats or PipelineStats()
+    if not tables:
+        return pd.DataFrame()
+    with stats.stage('dataframe') as counters:
+        df = pa.concat_tables(tables, promote_options='default').to_pandas()
+        counters['items'] = len(df)
+    df = finish_dataframe(df, stats)
+    with stats.stage('sort', items=len(df)):
+        # 各表内部已有序，稳定排序保持同一时刻日志的原有顺序
+        return df.sort_values('time', kind='mergesort', ignore_index=True)
+
+def finish_dataframe(df, stats):
+    """解析时间、转换数值列并压缩字符串列"""
+    with stats.stage('to_datetime', items=len(df)):
+        df['time'] = pd.to_datetime(df['time'], format='%d/%b/%Y:%H:%M:%S %z', errors='coerce')
+    with stats.stage('convert', items=len(df)):
+        df['bytes_sent'] = pd.to_numeric(df['bytes_sent'], errors='coerce').fillna(0)
+        df['http_status'] = df['http_status'].astype(str)
+    return compact_string_columns(df, stats)
+
+def compact_string_columns(df, stats=None):
+    """将字符串列从 Python 对象转换为列式存储
+
+    低基数列 (操作类型、状态码、存储桶等) 字典编码为 category，高基数列 (对象键、request_id 等)
+    使用 Arrow 字符串，数据存放在连续缓冲区中，不再为每个值保留一个 Python 对象。
+    """
+    stats = stats or PipelineStats()
+    with stats.stage('compact_strings', items=len(df)) as counters:
+        for col in STRING_COLUMNS:
+            if col not in df or isinstance(df[col].dtype, pd.CategoricalDtype) or df[col].dtype == 'string[pyarrow]':
+                continue
+            if df[col].nunique() <= len(df) * DICTIONARY_MAX_RATIO:
+                df[col] = df[col].astype('category')
+            else:
+                df[col] = df[col].astype('string[pyarrow]')
+        counters['bytes'] = int(df.memory_usage(deep=True).sum())
+    return df
+
+def concat_logs(frames):
+    """拼接日志 DataFrame
+
+    各部分都字典编码的列先统一为合并后的类别再拼接，结果保持 category；
+    编码方式不一致的列统一为 Arrow 字符串，避免 pd.concat 退化为逐值的 Python 对象。
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    frames = [frame.copy(deep=False) for frame in frames]
+    for col in STRING_COLUMNS:
+        if not all(col in frame for frame in frames):
+            continue
+        dtypes = [frame[col].dtype for frame in frames]
+        if all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes):
+            categories = dtypes[0].categories
+            for dtype in dtypes[1:]:
+                categories = categories.union(dtype.categories)
+            target = pd.CategoricalDtype(categories)
+        elif any(dtype != dtypes[0] for dtype in dtypes):
+            target = 'string[pyarrow]'
+        else:
+            continue
+        for frame in frames:
+            frame[col] = frame[col].astype(target)
+    return pd.concat(frames, ignore_index=True)
@@ -4,13 +4,21 @@ S3 Server Access Log 分析 Web 应用
 """
 import streamlit as st
 import boto3
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from collections import Counter
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import re
+import json
+import time
+
+from log_parser import (
+    SUCCESS_STATUSES, DEFAULT_BLOOM_FP_RATE, DEFAULT_CACHE_DIR, DEFAULT_MEMORY_BUDGET_MB, LOAD_MODES,
+    PipelineStats, BloomCache, IngestCache, discover_log_targets, get_s3_clients, list_sources, iter_log_runs, plan_load,
+    ingest_cache_mb, runs_to_dataframe, tables_to_dataframe, search_log_files, concat_logs
+)
+from log_compactor import LogArchive, list_compacted, iter_compacted, load_compacted
 
 # 页面配置
 st.set_page_config(
@@ -20,103 +28,345 @@ st.set_page_config(
     initial_sidebar_state="expanded"  # 默认展开侧边栏
 )
 
-# 编译正则表达式提升性能
-LOG_PATTERN = re.compile(r'(\S+) (\S+) \[(.*?)\] (\S+) (\S+) (\S+) (\S+) (\S+) "(\S+) (\S+) (\S+)" (\S+) (\S+) (\S+) (\S+) (\S+) (\S+) "([^"]*)" "([^"]*)" (\S+)')
-
-def parse_s3_log_line(line):
-    """解析 S3 访问日志行"""
-    match = LOG_PATTERN.match(line)
-    if match:
-        return {
-            'bucket_owner': match.group(1),
-            'bucket': match.group(2),
-            'time': match.group(3),
-            'remote_ip': match.group(4),
-            'requester': match.group(5),
-            'request_id': match.group(6),
-            'operation': match.group(7),
-            'key': match.group(8),
-            'request_uri': match.group(9),
-            'http_status': match.group(12),
-            'error_code': match.group(13),
-            'bytes_sent': match.group(14),
-            'object_size': match.group(15),
-            'total_time': match.group(16),
-            'turn_around_time': match.group(17),
-            'referer': match.group(18),
-            'user_agent': match.group(19),
-            'version_id': match.group(20)
-        }
-    return None
+def parse_log_sources(text, default_region=None):
+    """解析日志源配置，每行格式: bucket,prefix[,region]"""
+    sources = []
+    for line in text.strip().splitlines():
+        parts = [p.strip() for p in line.split(',')]
+        if not parts or not parts[0]:
+            continue
+        prefix = parts[1] if len(parts) > 1 else ''
+        region = parts[2] if len(parts) > 2 and parts[2] else default_region
+        sources.append((parts[0], prefix, region))
+    return sources
 
-def process_log_file(s3_client, bucket, key):
-    """处理单个日志文件"""
-    try:
-        log_obj = s3_client.get_object(Bucket=bucket, Key=key)
-        content = log_obj['Body'].read().decode('utf-8')
-        
-        logs = []
-        for line in content.strip().split('\n'):
-            if line:
-                parsed = parse_s3_log_line(line)
-                if parsed:
-                    logs.append(parsed)
-        return logs
-    except:
-        return []
+@st.cache_resource
+def get_ingest_cache():
+    """进程级日志解析缓存，所有会话共享同一实例"""
+    return IngestCache()
 
-@st.cache_data(ttl=300)
-def load_s3_logs(bucket, prefix, max_files=100, days_back=None):
-    """从 S3 加载日志"""
-    s3 = boto3.client('s3')
+@st.cache_resource(ttl=300)
+def load_s3_logs(sources, max_files=100, days_back=None, archive_root=None, bloom_fp_rate=DEFAULT_BLOOM_FP_RATE,
+                 memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """从 S3 加载日志
+
+    sources 为 (日志 bucket, 前缀, 区域) 列表，多个日志源并发加载，
+    每个区域使用独立客户端，最终按时间 k 路归并为一个有序结果。
+    max_files 为每个日志源的最大原始文件数。指定 archive_root 时优先读取
+    log_compactor.py 生成的压缩归档，只对未压缩的原始日志逐个下载；归档的行数
+    从清单读取，在读取归档前与原始日志一起规划内存。
+    各日志源已读取的最大日志键保存在 df.attrs['last_keys'] 中，供追踪模式
+    增量加载；各阶段耗时和资源使用保存在 df.attrs['pipeline_stats'] 中。
+    解析过的原始日志文件会在本地缓存中生成布隆过滤器，供日志检索跳过文件。
+    
+    下载前按列出的日志大小估算内存，超出 memory_budget_mb（扣除共享解析缓存的
+    容量后）时降级为汇总 + 抽样或仅汇总模式，加载计划保存在 df.attrs['load_plan'] 中。返回 (DataFrame, 汇总)，
+    完整明细模式下汇总为 None，由调用方从明细构建。
+    
+    结果按参数在进程内共享给所有会话，调用方不得原地修改；原始日志的解析结果
+    按文件缓存在进程级 IngestCache 中，参数不同的请求也只下载尚未缓存的文件。
+    """
+    stats = PipelineStats()
+    clients = get_s3_clients(sources)
+    bloom_cache = BloomCache(DEFAULT_CACHE_DIR, bloom_fp_rate)
     
     try:
-        # 使用分页器支持超过 1000 个文件
-        paginator = s3.get_paginator('list_objects_v2')
-        page_iterator = paginator.paginate(
-            Bucket=bucket,
-            Prefix=prefix,
-            PaginationConfig={'MaxItems': max_files, 'PageSize': 1000}
-        )
-        
-        # 收集所有文件
-        log_files = []
-        for page in page_iterator:
-            if 'Contents' in page:
-                log_files.extend([obj for obj in page['Contents'] if obj['Size'] > 0])
-        
-        if not log_files:
-            return pd.DataFrame()
-        
-        # 按文件时间过滤
-        
-        if days_back:
-            from datetime import datetime, timedelta, timezone
-            cutoff_time = datetime.now(timezone.utc) - timedelta(days=days_back)
-            log_files = [obj for obj in log_files if obj['LastModified'] >= cutoff_time]
-        
-        if not log_files:
-            return pd.DataFrame()
-        
-        all_logs = []
-        
-        with ThreadPoolExecutor(max_workers=50) as executor:
-            futures = [executor.submit(process_log_file, s3, bucket, obj['Key']) for obj in log_files]
-            for future in as_completed(futures):
-                all_logs.extend(future.result())
-        
-        if all_logs:
-            df = pd.DataFrame(all_logs)
-            df['time'] = pd.to_datetime(df['time'], format='%d/%b/%Y:%H:%M:%S %z', errors='coerce')
-            df['bytes_sent'] = pd.to_numeric(df['bytes_sent'], errors='coerce').fillna(0)
-            df['http_status'] = df['http_status'].astype(str)
-            return df
+        with stats.stage('load_total') as counters:
+            cutoff_time = None
+            if days_back:
+                cutoff_time = datetime.now(timezone.utc) - timedelta(days=days_back)
+            
+            archive, archive_days, compacted_keys, archived_rows = None, [], {}, 0
+            if archive_root:
+                since_day = cutoff_time.strftime('%Y-%m-%d') if cutoff_time else None
+                archive = LogArchive(archive_root)
+                archive_days, compacted_keys, archived_rows = list_compacted(archive, sources, since_day)
+            
+            tasks, last_keys = list_sources(clients, sources, max_files, cutoff_time, stats=stats,
+                                            exclude_keys=compacted_keys)
+            # 共享解析缓存计入内存预算，加载计划只使用剩余部分
+            cache_mb = ingest_cache_mb(memory_budget_mb)
+            get_ingest_cache().resize(cache_mb)
+            plan = plan_load(sum(task[4] for task in tasks), memory_budget_mb - cache_mb, archived_rows)
+            
+            aggregates = None
+            if plan['mode'] != 'full':
+                archived = iter_compacted(archive, archive_days, plan['batch_rows'], stats) if archive_days else ()
+                df, rollups, prefix_trie = load_aggregates(iter_log_runs(tasks, stats, bloom_cache), plan, stats,
+                                                           archived)
+                aggregates = {'rollups': rollups, 'prefix_trie': prefix_trie}
+            else:
+                df = tables_to_dataframe(get_ingest_cache().load(tasks, stats, bloom_cache), stats)
+                if archive_days:
+                    compacted_df = load_compacted(archive, archive_days, stats)
+                    with stats.stage('archive_merge', items=len(compacted_df) + len(df)):
+                        df = concat_logs([compacted_df, df]).sort_values(
+                            'time', kind='mergesort', ignore_index=True)
+            counters['items'] = len(df)
         
-        return pd.DataFrame()
+        df.attrs['last_keys'] = last_keys
+        df.attrs['pipeline_stats'] = stats.to_dict()
+        df.attrs['load_plan'] = plan
+        return df, aggregates
     
     except Exception as e:
         st.error(f"加载日志失败: {str(e)}")
-        return pd.DataFrame()
+        return pd.DataFrame(), None
+
+def load_aggregates(runs, plan, stats, archived=()):
+    """汇总 + 抽样 / 仅汇总模式：分批解析日志，每批并入小时汇总和前缀树后释放
+
+    抽样模式为每行分配随机优先级，只保留优先级最小的 sample_rows 行 (bottom-k)，
+    结果是全部日志的均匀无放回抽样。archived 为逐批产出的已解析日志（如流式读取的
+    压缩归档），同样计入汇总和抽样。返回 (按时间排序的抽样 DataFrame, 小时汇总, 前缀树)。
+    """
+    rng = np.random.default_rng()
+    rollups, prefix_trie, sample = {}, new_trie_node(), pd.DataFrame()
+    
+    def absorb(batch):
+        nonlocal rollups, prefix_trie, sample
+        with stats.stage('aggregate', items=len(batch)):
+            rollups = merge_rollups(rollups, build_rollups(batch))
+            prefix_trie = merge_prefix_trie(prefix_trie, build_prefix_trie(batch))
+        if plan['sample_rows']:
+            with stats.stage('sample', items=len(batch)):
+                sample = concat_logs([sample, batch.assign(priority=rng.random(len(batch)))])
+                if len(sample) > plan['sample_rows']:
+                    sample = sample.nsmallest(plan['sample_rows'], 'priority')
+    
+    for frame in archived:
+        absorb(frame)
+    batch, batch_rows = [], 0
+    for logs in runs:
+        batch.append(logs)
+        batch_rows += len(logs)
+        if batch_rows >= plan['batch_rows']:
+            absorb(runs_to_dataframe(batch, stats))
+            batch, batch_rows = [], 0
+    if batch:
+        absorb(runs_to_dataframe(batch, stats))
+    
+    prune_prefix_trie(prefix_trie)
+    if not sample.empty:
+        sample = sample.drop(columns='priority').sort_values('time', kind='mergesort', ignore_index=True)
+    return sample, rollups, prefix_trie
+
+def fetch_new_logs(sources, last_keys, max_files=None, stats=None, bloom_fp_rate=DEFAULT_BLOOM_FP_RATE):
+    """追踪模式：从上次读取的最大日志键之后列出并加载新投递的日志
+
+    只处理新文件，开销与新增数据量成正比；默认不限制文件数，超过 max_files 时只加载最新的部分。
+    返回 (新日志 DataFrame, 更新后的最大日志键)。
+    """
+    clients = get_s3_clients(sources)
+    tasks, new_last_keys = list_sources(clients, sources, max_files, last_keys=last_keys, stats=stats)
+    if not tasks:
+        return pd.DataFrame(), new_last_keys
+    bloom_cache = BloomCache(DEFAULT_CACHE_DIR, bloom_fp_rate)
+    return tables_to_dataframe(get_ingest_cache().load(tasks, stats, bloom_cache), stats), new_last_keys
+
+# 日志检索字段
+SEARCH_FIELDS = {'对象键': 'key', '用户': 'requester', 'IP 地址': 'remote_ip'}
+
+def search_s3_logs(sources, field, value, max_files=100, days_back=None, bloom_fp_rate=DEFAULT_BLOOM_FP_RATE):
+    """在日志源中按对象键 / 用户 / IP 精确检索，布隆过滤器判定不包含目标的文件不下载
+
+    返回 (匹配记录 DataFrame, 检查的文件数, 跳过的文件数)。
+    """
+    stats = PipelineStats()
+    clients = get_s3_clients(sources)
+    cutoff_time = datetime.now(timezone.utc) - timedelta(days=days_back) if days_back else None
+    tasks, _ = list_sources(clients, sources, max_files, cutoff_time, stats=stats)
+    matches, skipped = search_log_files(tasks, field, value, BloomCache(DEFAULT_CACHE_DIR, bloom_fp_rate), stats)
+    df = runs_to_dataframe([matches], stats) if matches else pd.DataFrame()
+    return df, len(tasks), skipped
+
+def append_within_budget(df, new_df, plan):
+    """追踪模式：在完整明细中追加新日志，追加后超出内存预算时按 plan_load 降级
+
+    返回 (DataFrame, 加载计划)。降级为汇总 + 抽样时明细改为全部日志的均匀无放回抽样
+    （不先拼接完整数据），降级为仅汇总时不再保留明细。
+    """
+    rows = len(df) + len(new_df)
+    new_plan = plan_load(0, plan.get('budget_mb', DEFAULT_MEMORY_BUDGET_MB), rows)
+    if new_plan['mode'] == 'full':
+        return append_logs(df, new_df), plan
+    picks = np.sort(np.random.default_rng().choice(rows, new_plan['sample_rows'], replace=False))
+    split = np.searchsorted(picks, len(df))
+    sample = append_logs(df.iloc[picks[:split]], new_df.iloc[picks[split:] - len(df)])
+    return sample.reset_index(drop=True), new_plan
+
+def append_logs(df, new_df):
+    """将新日志追加到已加载数据中，保持时间有序"""
+    if new_df.empty:
+        return df
+    if df.empty:
+        return new_df
+    merged = concat_logs([df, new_df])
+    # 新投递的日志通常整体更新，只有时间交叠时才需要重新排序
+    if new_df['time'].min() < df['time'].max():
+        merged = merged.sort_values('time', kind='mergesort', ignore_index=True)
+    return merged
+
+def count_values(values):
+    """value_counts，去掉字典编码列中过滤后已不存在的类别"""
+    counts = values.value_counts()
+    return counts[counts > 0]
+
+# 汇总维度（按小时预聚合，追踪模式下增量合并）
+ROLLUP_DIMENSIONS = ['operation', 'requester', 'remote_ip', 'http_status', 'error_code', 'bucket']
+ROLLUP_PREFIX_DEPTH = 2  # 前缀维度按对象键前两级汇总
+
+def key_prefixes(keys, depth):
+    """截取对象键的前 depth 级 '/' 分段（'-' 视为空键）
+
+    先转换为普通字符串：字典编码的列不能直接写入类别之外的值 ('')。
+    """
+    keys = keys.astype(str).replace('-', '')
+    return keys.str.split('/', n=depth).str[:depth].str.join('/')
+
+# 错误热点分析的维度，错误汇总按这些维度的组合分组
+ERROR_DIMENSIONS = {
+    'error_code': '错误码', 'http_status': 'HTTP 状态码', 'operation': '操作类型', 'prefix': '对象键前缀', 'requester': '用户',
+}
+
+def build_rollups(df):
+    """按小时汇总各维度（含对象键前缀）的请求数和传输字节数
+
+    另外对错误请求按 ERROR_DIMENSIONS 的组合做一份小时汇总 ('errors')，供错误热点分析使用。
+    """
+    if df.empty:
+        return {}
+    hour = df['time'].dt.floor('h').rename('hour')
+    columns = {dim: df[dim] for dim in ROLLUP_DIMENSIONS}
+    columns['prefix'] = key_prefixes(df['key'], ROLLUP_PREFIX_DEPTH).rename('prefix')
+    rollups = {}
+    for dim, values in columns.items():
+        rollups[dim] = df.groupby([hour, values], observed=True)['bytes_sent'].agg(['size', 'sum']).rename(
+            columns={'size': 'requests', 'sum': 'bytes'})
+    
+    is_error = ~df['http_status'].isin(SUCCESS_STATUSES)
+    if is_error.any():
+        keys = [hour[is_error]] + [columns[dim][is_error] for dim in ERROR_DIMENSIONS]
+        rollups['errors'] = df.loc[is_error, 'bytes_sent'].groupby(keys, observed=True).agg(['size', 'sum']).rename(
+            columns={'size': 'requests', 'sum': 'bytes'})
+    return rollups
+
+# 时间窗口对比的基准窗口偏移，以及按变化率排名时要求的最小请求数（过滤低基数噪声）
+COMPARE_OFFSETS = {'1 天前': pd.Timedelta(days=1), '7 天前': pd.Timedelta(days=7), '前一个相邻窗口': None}
+COMPARE_MIN_REQUESTS = 20
+COMPARE_DIMENSIONS = {
+    'operation': '操作类型', 'requester': '用户', 'remote_ip': 'IP 地址',
+    'error_code': '错误码', 'http_status': 'HTTP 状态码', 'prefix': '对象键前缀',
+}
+
+def compare_windows(rollups, current, baseline, metric='requests'):
+    """基于小时汇总对比两个时间窗口 [start, end)
+
+    每个维度只扫描一遍汇总：按所属窗口给各小时打标签后一次分组，
+    返回 {维度: DataFrame(baseline, current, delta, ratio)}，按绝对变化降序。
+    ratio 为相对变化，基准为 0 时为 NaN（新出现的取值）。
+    """
+    result = {}
+    for dim in COMPARE_DIMENSIONS:
+        rollup = rollups.get(dim)
+        if rollup is None or rollup.empty:
+            continue
+        hours = rollup.index.get_level_values('hour')
+        window = np.select(
+            [(hours >= current[0]) & (hours < current[1]), (hours >= baseline[0]) & (hours < baseline[1])],
+            ['current', 'baseline'], default='')
+        in_window = window != ''
+        values = rollup.index.get_level_values(1)[in_window]
+        totals = rollup[metric][in_window].groupby([np.asarray(values), window[in_window]]).sum().unstack(fill_value=0)
+        compared = totals.reindex(columns=['baseline', 'current'], fill_value=0)
+        compared.index.name = dim
+        compared['delta'] = compared['current'] - compared['baseline']
+        compared['ratio'] = compared['delta'] / compared['baseline'].where(compared['baseline'] > 0)
+        result[dim] = compared.reindex(compared['delta'].abs().sort_values(ascending=False).index)
+    return result
+
+# 对象键前缀树：深度上限，以及低于阈值或超出子节点数量上限的分支合并为"其他"
+PREFIX_TRIE_MAX_DEPTH = 4
+PREFIX_TRIE_MIN_REQUESTS = 10
+PREFIX_TRIE_MAX_CHILDREN = 200
+PREFIX_TRIE_OTHER = '(其他)'
+
+def new_trie_node():
+    """创建前缀树节点"""
+    return {'requests': 0, 'bytes': 0, 'errors': 0, 'children': {}}
+
+def build_prefix_trie(df, max_depth=PREFIX_TRIE_MAX_DEPTH, min_requests=PREFIX_TRIE_MIN_REQUESTS):
+    """按 '/' 分段构建对象键前缀树，汇总每个节点的请求数、字节数和错误数"""
+    root = new_trie_node()
+    if df.empty:
+        return root
+    
+    # 先按截断后的前缀分组，插入次数只与不同前缀数相关，与行数无关
+    prefixes = key_prefixes(df['key'], max_depth)
+    is_error = ~df['http_status'].isin(SUCCESS_STATUSES)
+    grouped = pd.DataFrame({'prefix': prefixes, 'bytes': df['bytes_sent'], 'errors': is_error}).groupby('prefix').agg(
+        requests=('bytes', 'size'), bytes=('bytes', 'sum'), errors=('errors', 'sum'))
+    
+    for prefix, row in grouped.iterrows():
+        node = root
+        segments = prefix.split('/') if prefix else []
+        for segment in [None] + segments:
+            if segment is not None:
+                node = node['children'].setdefault(segment, new_trie_node())
+            node['requests'] += int(row['requests'])
+            node['bytes'] += int(row['bytes'])
+            node['errors'] += int(row['errors'])
+    
+    prune_prefix_trie(root, min_requests)
+    return root
+
+def prune_prefix_trie(node, min_requests=PREFIX_TRIE_MIN_REQUESTS, max_children=PREFIX_TRIE_MAX_CHILDREN):
+    """剪枝：低频分支合并为"其他"节点，父节点汇总值保持不变"""
+    children = sorted(node['children'].items(), key=lambda kv: kv[1]['requests'], reverse=True)
+    kept = {}
+    other = node['children'].get(PREFIX_TRIE_OTHER) or new_trie_node()
+    for name, child in children:
+        if name == PREFIX_TRIE_OTHER:
+            continue
+        if child['requests'] >= min_requests and len(kept) < max_children:
+            prune_prefix_trie(child, min_requests, max_children)
+            kept[name] = child
+        else:
+            for field in ('requests', 'bytes', 'errors'):
+                other[field] += child[field]
+    if other['requests']:
+        other['children'] = {}
+        kept[PREFIX_TRIE_OTHER] = other
+    node['children'] = kept
+
+def merge_prefix_trie(trie, new_trie):
+    """合并两棵前缀树，返回新的前缀树
+
+    不修改输入：已有前缀树可能是 load_s3_logs 在所有会话间共享的缓存结果。
+    未变化的子树与输入共享，结果同样不得原地修改。
+    """
+    merged = {field: trie[field] + new_trie[field] for field in ('requests', 'bytes', 'errors')}
+    merged['children'] = dict(trie['children'])
+    for name, child in new_trie['children'].items():
+        if name in merged['children']:
+            child = merge_prefix_trie(merged['children'][name], child)
+        merged['children'][name] = child
+    return merged
+
+def merge_rollups(rollups, new_rollups):
+    """合并两份小时汇总，返回新的汇总（不修改输入）"""
+    if not rollups:
+        return new_rollups
+    if not new_rollups:
+        return rollups
+    merged = {}
+    for dim in rollups.keys() | new_rollups.keys():
+        if dim not in rollups or dim not in new_rollups:
+            merged[dim] = rollups.get(dim, new_rollups.get(dim))
+            continue
+        combined = pd.concat([rollups[dim], new_rollups[dim]])
+        merged[dim] = combined.groupby(level=list(range(combined.index.nlevels)), observed=True).sum()
+    return merged
 
 @st.cache_data
 def get_bucket_list():
@@ -128,23 +378,432 @@ def get_bucket_list():
     except:
         return []
 
+@st.cache_data(ttl=3600)
+def get_log_targets():
+    """各 bucket 的访问日志位置（并发查询所有 bucket 的日志配置，缓存 1 小时）"""
+    try:
+        return discover_log_targets()
+    except Exception as e:
+        st.error(f"发现日志配置失败: {str(e)}")
+        return {}
+
+# 趋势图可选的时间粒度 (秒)
+TREND_BIN_WIDTHS = [
+    (1, '1秒'), (5, '5秒'), (10, '10秒'), (30, '30秒'),
+    (60, '1分钟'), (300, '5分钟'), (900, '15分钟'), (1800, '30分钟'),
+    (3600, '1小时'), (3 * 3600, '3小时'), (6 * 3600, '6小时'), (12 * 3600, '12小时'), (86400, '1天'),
+]
+TREND_TARGET_BINS = 1500  # 自动粒度下的目标分桶数
+TREND_MAX_BINS = 200000  # 手动粒度下的分桶数上限，超过则自动放宽粒度
+TREND_MAX_POINTS = 2000  # 每条曲线发送到浏览器的最大点数
+
+def choose_bin_width(span_seconds, min_width=1, target_bins=TREND_TARGET_BINS):
+    """根据可见时间跨度选择分桶宽度，返回 (秒数, 名称)"""
+    for width, label in TREND_BIN_WIDTHS:
+        if width >= min_width and span_seconds / width <= target_bins:
+            return width, label
+    return TREND_BIN_WIDTHS[-1]
+
+def lttb_downsample(x, y, threshold):
+    """Largest-Triangle-Three-Buckets 降采样，在保留曲线形状的前提下减少点数"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+    
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        # 下一个桶的平均点作为三角形的第三个顶点
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return x[indices], y[indices]
+
+def build_trend_series(times, operations, width, max_points=TREND_MAX_POINTS):
+    """按固定宽度分桶统计各操作的请求数，返回 {操作: (时间, 请求数)}
+
+    使用 epoch 秒整数运算分桶，bincount 一次统计所有操作，空桶补零后做 LTTB 降采样。
+    """
+    valid = times.notna().to_numpy()
+    epoch = times[valid].dt.as_unit('s').astype('int64').to_numpy()
+    if len(epoch) == 0:
+        return {}
+    op_codes, op_names = pd.factorize(operations[valid], sort=True)
+    
+    origin = epoch.min() // width * width
+    bins = (epoch - origin) // width
+    n_bins = int(bins.max()) + 1
+    counts = np.bincount(op_codes * n_bins + bins, minlength=len(op_names) * n_bins).reshape(len(op_names), n_bins)
+    
+    x = (origin + np.arange(n_bins, dtype=np.int64) * width).astype(np.float64)
+    series = {}
+    for code, name in enumerate(op_names):
+        sx, sy = lttb_downsample(x, counts[code].astype(np.float64), max_points)
+        series[name] = (pd.to_datetime(sx.astype(np.int64), unit='s', utc=True), sy)
+    return series
+
+def poll_new_logs(interval):
+    """追踪模式：到达刷新间隔时增量拉取新日志，有新数据时刷新页面"""
+    last_poll = st.session_state.get('last_tail_poll', 0)
+    if time.time() - last_poll >= interval:
+        last_poll = st.session_state.last_tail_poll = time.time()
+        stats = PipelineStats()
+        new_df, last_keys = fetch_new_logs(st.session_state.sources, st.session_state.last_keys, stats=stats,
+                                           bloom_fp_rate=st.session_state.get('bloom_fp_rate', DEFAULT_BLOOM_FP_RATE))
+        st.session_state.last_keys = last_keys
+        st.session_state.tail_appended = len(new_df)
+        if not new_df.empty:
+            # 降级模式下新日志只并入汇总，明细（抽样）保持加载时的结果
+            load_plan = st.session_state.get('load_plan', {})
+            if load_plan.get('mode', 'full') == 'full':
+                with stats.stage('append', items=len(new_df)):
+                    st.session_state.df, st.session_state.load_plan = append_within_budget(
+                        st.session_state.df, new_df, load_plan)
+            with stats.stage('rollups', items=len(new_df)):
+                st.session_state.rollups = merge_rollups(st.session_state.rollups, build_rollups(new_df))
+            with stats.stage('prefix_trie', items=len(new_df)):
+                st.session_state.prefix_trie = merge_prefix_trie(st.session_state.prefix_trie, build_prefix_trie(new_df))
+        st.session_state.tail_stats = stats.to_dict()
+        if not new_df.empty:
+            st.rerun()
+    
+    latest_hour = 0
+    rollups = st.session_state.get('rollups')
+    if rollups:
+        op_rollup = rollups['operation']
+        latest_hour = int(op_rollup.xs(op_rollup.index.get_level_values('hour').max(), level='hour')['requests'].sum())
+    st.caption(
+        f"📡 追踪中: 每 {interval} 秒检查新日志 | 上次检查 {datetime.fromtimestamp(last_poll).strftime('%H:%M:%S')}"
+        f" | 本次新增 {st.session_state.get('tail_appended', 0)} 条 | 最近一小时 {latest_hour} 条"
+    )
+
+def render_diagnostics(panel, render_stats):
+    """在侧边栏诊断面板中展示各阶段耗时，并提供 JSON 导出"""
+    report = {
+        'load': st.session_state.get('load_stats', {}),
+        'tail': st.session_state.get('tail_stats', {}),
+        'render': render_stats.to_dict(),
+        'load_plan': st.session_state.get('load_plan', {}),
+    }
+    with panel:
+        for section, title in [('load', '加载'), ('tail', '追踪增量'), ('render', '页面渲染')]:
+            if not report[section]:
+                continue
+            st.markdown(f"**{title}**")
+            failed = report[section].get('failed_files', {}).get('items', 0)
+            if failed:
+                st.warning(f"{failed:,} 个日志文件读取或解析失败，已跳过")
+            stage_df = pd.DataFrame.from_dict(report[section], orient='index')
+            stage_df['MB'] = stage_df.pop('bytes') / (1024**2)
+            st.dataframe(stage_df.round(3), use_container_width=True)
+        st.caption("并发阶段 (get_object / read_body / decode / parse) 的耗时为各线程累计值；"
+                   "process_peak_mb 为进程启动以来的峰值内存，rss_delta_mb 为阶段前后常驻内存的变化（并发阶段不统计）")
+        st.download_button(
+            label="📥 导出诊断 JSON",
+            data=json.dumps(report, ensure_ascii=False, indent=2),
+            file_name=f"s3_log_pipeline_stats_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json"
+        )
+
+def render_load_plan(plan):
+    """降级加载时提示当前模式和内存估算"""
+    if not plan or plan['mode'] == 'full':
+        return
+    message = (f"⚠️ 预计 {plan['estimated_rows']:,} 行、峰值约 {plan['estimated_mb']:,.0f} MB，"
+               f"超出内存预算 {plan['budget_mb']:,} MB，当前为 **{LOAD_MODES[plan['mode']]}** 模式：")
+    if plan['mode'] == 'sample':
+        message += "统计图表和详细列表基于全部日志的均匀抽样，前缀分析基于全部日志。"
+    else:
+        message += "仅展示全部日志的小时汇总和前缀分析，不保留明细记录。"
+    st.warning(message)
+
+def rollup_totals(rollup):
+    """将小时汇总按维度取值合计，按请求数降序"""
+    return rollup.groupby(level=1, observed=True).sum().sort_values('requests', ascending=False)
+
+def render_rollup_summary(rollups, render_stats):
+    """仅汇总模式：基于小时汇总展示统计概览、各维度 Top 10 和操作趋势"""
+    st.markdown("### 📈 统计概览")
+    statuses = rollup_totals(rollups['http_status'])
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("总请求数", f"{int(statuses['requests'].sum()):,}")
+    with col2:
+        st.metric("唯一用户数", rollups['requester'].index.get_level_values(1).nunique())
+    with col3:
+        st.metric("错误请求数", f"{int(statuses.loc[~statuses.index.isin(SUCCESS_STATUSES), 'requests'].sum()):,}")
+    with col4:
+        st.metric("数据传输", f"{statuses['bytes'].sum() / (1024**3):.2f} GB")
+    
+    st.markdown("---")
+    
+    tab1, tab2, tab3, tab6, tab4, tab5 = st.tabs(
+        ["📊 操作类型", "👤 用户统计", "🌐 IP 分布", "🚨 错误分析", "🗂️ 前缀分析", "🔀 窗口对比"])
+    
+    for tab, dim, title in [(tab1, 'operation', '操作类型'), (tab2, 'requester', '用户'), (tab3, 'remote_ip', 'IP 地址')]:
+        with tab, render_stats.stage(f'render_{dim}_rollup'):
+            top = rollup_totals(rollups[dim]).head(10)
+            fig = go.Figure(data=[go.Bar(x=top.index.astype(str), y=top['requests'])])
+            fig.update_layout(title=f"Top 10 {title}", xaxis_title=title, yaxis_title="请求数", xaxis_tickangle=-45)
+            st.plotly_chart(fig, use_container_width=True)
+    
+    with tab1:
+        st.markdown("#### 操作时间趋势 (每小时)")
+        hourly = rollups['operation']['requests'].unstack(fill_value=0)
+        fig = go.Figure()
+        for operation in hourly.columns:
+            fig.add_trace(go.Scattergl(x=hourly.index, y=hourly[operation], mode='lines', name=str(operation)))
+        fig.update_layout(xaxis_title="时间", yaxis_title="请求数 / 小时")
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with tab3:
+        st.markdown("#### HTTP 状态码分布")
+        fig = go.Figure(data=[go.Bar(x=statuses.index.astype(str), y=statuses['requests'], text=statuses['requests'],
+                                     textposition='auto')])
+        fig.update_layout(title="HTTP 状态码统计", xaxis_title="状态码", yaxis_title="请求数")
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with tab6, render_stats.stage('render_errors'):
+        render_error_analysis(rollups)
+    
+    with tab4, render_stats.stage('render_prefixes'):
+        render_prefix_analysis()
+    
+    with tab5, render_stats.stage('render_comparison'):
+        render_window_comparison(rollups)
+
+def format_comparison(compared, metric):
+    """格式化窗口对比结果表"""
+    if metric == 'bytes':
+        values = {col: compared[col].map(lambda v: f"{v / (1024**2):,.1f} MB") for col in ('baseline', 'current', 'delta')}
+    else:
+        values = {col: compared[col].map(lambda v: f"{int(v):,}") for col in ('baseline', 'current', 'delta')}
+    return pd.DataFrame({
+        compared.index.name: compared.index.astype(str),
+        '基准窗口': values['baseline'],
+        '对比窗口': values['current'],
+        '变化': values['delta'],
+        '变化率': compared['ratio'].map(lambda r: '新增' if pd.isna(r) else f"{r * 100:+.1f}%"),
+    })
+
+def render_window_comparison(rollups):
+    """窗口对比标签页：两个窗口的各维度聚合都来自小时汇总，不读取明细记录"""
+    st.markdown("### 时间窗口对比")
+    st.caption("基于加载时构建的小时汇总（UTC，按小时对齐，不受上方筛选条件影响）")
+    if not rollups:
+        st.info("没有可用的小时汇总")
+        return
+    
+    hours = rollups['operation'].index.get_level_values('hour')
+    first, last = hours.min(), hours.max()
+    
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        day = st.date_input("对比日期", value=last.date(), min_value=first.date(), max_value=last.date(), key='compare_day')
+    with col2:
+        start_hour = st.number_input("开始小时", min_value=0, max_value=23, value=max(last.hour - 1, 0), key='compare_start')
+    with col3:
+        end_hour = st.number_input("结束小时", min_value=1, max_value=24, value=last.hour + 1, key='compare_end')
+    with col4:
+        offset_label = st.selectbox("基准窗口", list(COMPARE_OFFSETS), key='compare_offset')
+    with col5:
+        metric_label = st.radio("指标", ['请求数', '字节数'], key='compare_metric')
+    
+    if end_hour <= start_hour:
+        st.warning("结束小时需晚于开始小时")
+        return
+    
+    day_start = pd.Timestamp(day).tz_localize('UTC')
+    current = (day_start + pd.Timedelta(hours=start_hour), day_start + pd.Timedelta(hours=end_hour))
+    offset = COMPARE_OFFSETS[offset_label] or (current[1] - current[0])
+    baseline = (current[0] - offset, current[1] - offset)
+    
+    fmt = '%Y-%m-%d %H:%M'
+    st.markdown(f"**对比窗口:** {current[0].strftime(fmt)} – {current[1].strftime(fmt)} | "
+                f"**基准窗口:** {baseline[0].strftime(fmt)} – {baseline[1].strftime(fmt)}")
+    if baseline[0] < first:
+        st.warning("⚠️ 基准窗口早于已加载的数据，缺失的小时按 0 计算，请扩大加载的时间范围")
+    
+    metric = 'bytes' if metric_label == '字节数' else 'requests'
+    comparison = compare_windows(rollups, current, baseline, metric)
+    if not comparison:
+        st.info("两个窗口内都没有数据")
+        return
+    
+    tabs = st.tabs([COMPARE_DIMENSIONS[dim] for dim in comparison])
+    for tab, (dim, compared) in zip(tabs, comparison.items()):
+        with tab:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("**绝对变化 Top 20**")
+                st.dataframe(format_comparison(compared.head(20), metric), use_container_width=True, hide_index=True)
+            with col2:
+                st.markdown("**相对变化 Top 20**")
+                if metric == 'requests':
+                    compared = compared[compared[['baseline', 'current']].max(axis=1) >= COMPARE_MIN_REQUESTS]
+                    st.caption(f"只统计任一窗口请求数不少于 {COMPARE_MIN_REQUESTS} 的取值")
+                ranked = compared.reindex(compared['ratio'].fillna(np.inf).abs().sort_values(ascending=False).index)
+                st.dataframe(format_comparison(ranked.head(20), metric), use_container_width=True, hide_index=True)
+
+def render_error_analysis(rollups):
+    """错误分析标签页：基于错误请求的小时汇总展示趋势和主要来源"""
+    st.markdown("### 错误热点分析")
+    st.caption(f"基于加载时构建的错误请求小时汇总（HTTP 状态码不属于 {', '.join(SUCCESS_STATUSES)} 的请求，不受上方筛选条件影响）")
+    errors = (rollups or {}).get('errors')
+    if errors is None or errors.empty:
+        st.success("✅ 没有错误请求")
+        return
+    
+    codes = errors['requests'].groupby(level='error_code', observed=True).sum().sort_values(ascending=False)
+    selected_code = st.selectbox("错误码", ['全部'] + codes.index.astype(str).tolist(), key='error_code_filter')
+    if selected_code != '全部':
+        errors = errors[errors.index.get_level_values('error_code') == selected_code]
+    
+    total_requests = int(rollups['operation']['requests'].sum())
+    error_requests = int(errors['requests'].sum())
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("错误请求数", f"{error_requests:,}")
+    with col2:
+        st.metric("错误率", f"{error_requests / total_requests * 100:.2f}%" if total_requests else "0.00%")
+    with col3:
+        st.metric("涉及对象键前缀", errors.index.get_level_values('prefix').nunique())
+    
+    # 按错误码的小时趋势
+    hourly = errors['requests'].groupby(level=['hour', 'error_code'], observed=True).sum().unstack(fill_value=0)
+    fig = go.Figure()
+    for code in hourly.columns:
+        fig.add_trace(go.Scattergl(x=hourly.index, y=hourly[code], mode='lines+markers', name=str(code)))
+    fig.update_layout(title="错误趋势 (每小时)", xaxis_title="时间", yaxis_title="错误请求数 / 小时")
+    st.plotly_chart(fig, use_container_width=True)
+    
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        dim_label = st.radio("主要来源", list(ERROR_DIMENSIONS.values()), horizontal=True, key='error_dimension')
+        dim = {label: name for name, label in ERROR_DIMENSIONS.items()}[dim_label]
+        top = errors['requests'].groupby(level=dim, observed=True).sum().sort_values(ascending=False).head(10)
+        fig = go.Figure(data=[go.Bar(x=top.index.astype(str), y=top.values)])
+        fig.update_layout(title=f"Top 10 {dim_label}", xaxis_title=dim_label, yaxis_title="错误请求数", xaxis_tickangle=-45)
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        st.dataframe(pd.DataFrame({
+            dim_label: top.index.astype(str),
+            '错误请求数': top.values,
+            '占比': [f"{v / error_requests * 100:.1f}%" for v in top.values],
+        }), use_container_width=True, height=400, hide_index=True)
+    
+    st.markdown("#### Top 20 错误组合")
+    combos = errors['requests'].groupby(level=list(ERROR_DIMENSIONS), observed=True).sum().nlargest(20)
+    combo_df = combos.reset_index().rename(columns={**ERROR_DIMENSIONS, 'requests': '错误请求数'})
+    st.dataframe(combo_df, use_container_width=True, hide_index=True)
+
+def render_prefix_analysis():
+    """前缀分析标签页：基于加载时构建的前缀树逐级下钻"""
+    st.markdown("### 对象键前缀分析")
+    st.caption("基于加载时构建的前缀树（不受上方筛选条件影响），逐级下钻无需重新扫描日志")
+    
+    trie = st.session_state.get('prefix_trie') or new_trie_node()
+    path = st.session_state.get('prefix_path', [])
+    
+    # 定位当前节点（路径失效时回到根节点）
+    node = trie
+    for segment in path:
+        if segment not in node['children']:
+            node, path = trie, []
+            break
+        node = node['children'][segment]
+    
+    st.markdown(f"**当前前缀:** `/{'/'.join(path)}`")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("请求数", f"{node['requests']:,}")
+    with col2:
+        st.metric("数据传输", f"{node['bytes'] / (1024**3):.2f} GB")
+    with col3:
+        st.metric("错误请求数", f"{node['errors']:,}")
+    
+    if node['children']:
+        prefix_df = pd.DataFrame([
+            {'前缀': name, '请求数': child['requests'], '字节数': child['bytes'], '错误数': child['errors'],
+             '错误率': f"{child['errors'] / child['requests'] * 100:.1f}%" if child['requests'] else '0.0%'}
+            for name, child in node['children'].items()
+        ]).sort_values('请求数', ascending=False)
+        
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            metric = st.radio("排序指标", ['请求数', '字节数', '错误数'], horizontal=True, key='prefix_metric')
+            top_df = prefix_df.sort_values(metric, ascending=False).head(20)
+            fig = go.Figure(data=[go.Bar(x=top_df['前缀'], y=top_df[metric])])
+            fig.update_layout(title=f"Top 20 子前缀 ({metric})", xaxis_title="前缀", yaxis_title=metric, xaxis_tickangle=-45)
+            st.plotly_chart(fig, use_container_width=True)
+        with col2:
+            st.dataframe(prefix_df, use_container_width=True, height=400, hide_index=True)
+        
+        drillable = [name for name in prefix_df['前缀'] if node['children'][name]['children']]
+        if drillable:
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                next_segment = st.selectbox("下钻到子前缀", drillable, key='prefix_drill_select')
+            with col2:
+                if st.button('⬇️ 下钻', use_container_width=True):
+                    st.session_state.prefix_path = path + [next_segment]
+                    st.rerun()
+    else:
+        st.info("当前前缀没有更深一级的统计（已到达深度上限或分支已被剪枝）")
+    
+    if path:
+        if st.button('⬆️ 返回上级'):
+            st.session_state.prefix_path = path[:-1]
+            st.rerun()
+
 # 主应用
 def main():
     st.title("📊 S3 Server Access Log 分析器")
     st.markdown("---")
     
+    render_stats = PipelineStats()
+    
     # 侧边栏配置
     with st.sidebar:
         st.header("⚙️ 配置")
         
+        # 按源 bucket 选择日志位置（需要先发现日志配置）
+        if st.button("🔍 发现访问日志配置", help="并发查询账户内所有 bucket 的访问日志配置，之后可直接按 bucket 选择日志位置"):
+            with st.spinner('查询日志配置...'):
+                st.session_state.log_targets = get_log_targets()
+        log_targets = st.session_state.get('log_targets', {})
+        target = {'bucket': 'mylabdemo1', 'prefix': 's3logs/', 'region': ''}
+        if log_targets:
+            source_bucket = st.selectbox(
+                "查看 Bucket 的访问日志", ['（手动配置）'] + sorted(log_targets),
+                help=f"已发现 {len(log_targets)} 个开启访问日志的 bucket，选择后自动填充下面的日志位置"
+            )
+            target = log_targets.get(source_bucket, target)
+        
         # Bucket 选择
         buckets = get_bucket_list()
         if buckets:
-            selected_bucket = st.selectbox("选择 Bucket", buckets, index=buckets.index('mylabdemo1') if 'mylabdemo1' in buckets else 0)
+            selected_bucket = st.selectbox("选择 Bucket", buckets, index=buckets.index(target['bucket']) if target['bucket'] in buckets else 0)
         else:
-            selected_bucket = st.text_input("Bucket 名称", value="mylabdemo1")
+            selected_bucket = st.text_input("Bucket 名称", value=target['bucket'])
+        
+        log_prefix = st.text_input("日志前缀", value=target['prefix'])
+        log_region = st.text_input("日志 Bucket 区域", value=target['region'], help="留空使用默认区域")
         
-        log_prefix = st.text_input("日志前缀", value="s3logs/")
+        extra_sources_text = st.text_area(
+            "附加日志源",
+            value="",
+            help="每行一个日志源，格式: bucket,prefix[,region]，与上面的日志源一起按时间合并加载"
+        )
         
         # 时间范围选择
         time_filter = st.selectbox(
@@ -162,28 +821,114 @@ def main():
         }
         days_back = days_map[time_filter]
         
-        max_files = st.slider("最大日志文件数", 10, 20000, 200)
+        max_files = st.slider("最大日志文件数 (每个日志源)", 10, 20000, 200)
+        
+        archive_root = st.text_input(
+            "压缩归档位置",
+            value="",
+            help="log_compactor.py 的输出位置（本地目录或 s3://bucket/prefix），已压缩的日期直接读取归档"
+        )
+        
+        bloom_fp_rate = st.select_slider(
+            "布隆过滤器误判率",
+            options=[0.001, 0.005, 0.01, 0.05, 0.1],
+            value=DEFAULT_BLOOM_FP_RATE,
+            help="解析日志文件时生成的布隆过滤器的目标误判率，越低过滤器越大、检索时跳过的文件越准确"
+        )
+        
+        memory_budget_mb = st.number_input(
+            "内存预算 (MB)", min_value=64, max_value=65536, value=DEFAULT_MEMORY_BUDGET_MB, step=256,
+            help="加载前按日志大小估算内存，超出预算时只保留汇总和均匀抽样，或仅保留汇总"
+        )
+        
+        tail_mode = st.toggle("📡 追踪模式", value=False, help="加载后按间隔只拉取新投递的日志文件并增量合并")
+        tail_interval = st.number_input("追踪刷新间隔 (秒)", min_value=10, max_value=3600, value=60, step=10, disabled=not tail_mode)
         
         load_button = st.button("🔄 加载日志", type="primary")
         
         st.markdown("---")
         
+        sources = [(selected_bucket, log_prefix, log_region or None)]
+        sources += parse_log_sources(extra_sources_text, log_region or None)
+        
+        # 日志检索（不需要先加载日志）
+        with st.expander("🔎 日志检索", expanded=False):
+            search_field = st.selectbox("检索字段", list(SEARCH_FIELDS))
+            search_value = st.text_input("检索值（精确匹配）", value="")
+            if st.button("🔎 检索", disabled=not search_value.strip()):
+                with st.spinner('检索中...'):
+                    result_df, checked, skipped = search_s3_logs(
+                        tuple(sources), SEARCH_FIELDS[search_field], search_value.strip(), max_files, days_back, bloom_fp_rate)
+                st.session_state.search_result = {
+                    'df': result_df, 'checked': checked, 'skipped': skipped,
+                    'field': search_field, 'value': search_value.strip()
+                }
+        
         # 加载数据
         if load_button:
             with st.spinner('加载中...'):
-                df = load_s3_logs(selected_bucket, log_prefix, max_files, days_back)
+                df, aggregates = load_s3_logs(tuple(sources), max_files, days_back, archive_root.strip() or None,
+                                              bloom_fp_rate, memory_budget_mb)
             st.session_state.df = df
-            st.session_state.bucket = selected_bucket
+            st.session_state.bucket = selected_bucket if len(sources) == 1 else f"{len(sources)} 个日志源"
             st.session_state.time_filter = time_filter
             st.session_state.current_page = 1
+            st.session_state.sources = tuple(sources)
+            st.session_state.bloom_fp_rate = bloom_fp_rate
+            st.session_state.last_keys = df.attrs.get('last_keys', {})
+            st.session_state.load_stats = df.attrs.get('pipeline_stats', {})
+            st.session_state.tail_stats = {}
+            st.session_state.load_plan = load_plan = df.attrs.get('load_plan', {})
+            if aggregates:
+                st.session_state.rollups = aggregates['rollups']
+                st.session_state.prefix_trie = aggregates['prefix_trie']
+            else:
+                with render_stats.stage('rollups', items=len(df)):
+                    st.session_state.rollups = build_rollups(df)
+                with render_stats.stage('prefix_trie', items=len(df)):
+                    st.session_state.prefix_trie = build_prefix_trie(df)
+            st.session_state.prefix_path = []
+            st.session_state.last_tail_poll = time.time()
+            st.session_state.tail_appended = 0
             
-            if not df.empty:
-                st.success(f"✅ 已加载 {len(df)} 条日志记录 (Bucket: {selected_bucket}, 时间: {time_filter})")
+            if aggregates and st.session_state.rollups:
+                st.success(f"✅ 已加载 {LOAD_MODES[load_plan['mode']]} (Bucket: {st.session_state.bucket}, 时间: {time_filter})")
+            elif not df.empty:
+                st.success(f"✅ 已加载 {len(df)} 条日志记录 (Bucket: {st.session_state.bucket}, 时间: {time_filter})")
             else:
                 st.warning("⚠️ 未找到日志数据")
+        
+        if tail_mode and 'sources' in st.session_state:
+            st.fragment(run_every=tail_interval)(poll_new_logs)(tail_interval)
+        
+        # 内容在页面渲染完成后填充
+        diagnostics_panel = st.expander("🩺 性能诊断", expanded=False)
+    
+    if 'search_result' in st.session_state:
+        result = st.session_state.search_result
+        st.markdown(f"### 🔎 检索结果: {result['field']} = `{result['value']}`")
+        st.caption(f"检查 {result['checked']} 个日志文件，其中 {result['skipped']} 个被布隆过滤器跳过，"
+                   f"下载解析 {result['checked'] - result['skipped']} 个")
+        if result['df'].empty:
+            st.warning("⚠️ 未找到匹配的日志记录")
+        else:
+            search_cols = ['time', 'source', 'bucket', 'operation', 'key', 'http_status', 'requester', 'remote_ip', 'request_id']
+            st.dataframe(result['df'][search_cols], use_container_width=True, hide_index=True)
+        if st.button("关闭检索结果"):
+            del st.session_state.search_result
+            st.rerun()
+        st.markdown("---")
+    
+    load_plan = st.session_state.get('load_plan', {})
+    if load_plan.get('mode') == 'rollups' and st.session_state.get('rollups'):
+        render_load_plan(load_plan)
+        render_rollup_summary(st.session_state.rollups, render_stats)
+        render_diagnostics(diagnostics_panel, render_stats)
+        return
     
     if 'df' not in st.session_state or st.session_state.df.empty:
         st.info("👈 请在左侧配置并加载日志")
+        render_diagnostics(diagnostics_panel, render_stats)
         return
     
     df = st.session_state.df
@@ -191,6 +936,7 @@ def main():
     # 显示基本信息
     time_info = st.session_state.get('time_filter', '全部')
     st.info(f"📊 当前数据: {len(df)} 条记录 | Bucket: {st.session_state.bucket} | 时间: {time_info}")
+    render_load_plan(load_plan)
     
     # 筛选器
     st.markdown("### 🔍 筛选条件")
@@ -220,21 +966,23 @@ def main():
         selected_status = st.selectbox("HTTP 状态码", status_codes)
     
     # 应用筛选
-    filtered_df = df.copy()
-    
-    if date_range and len(date_range) == 2:
-        start_date = pd.Timestamp(date_range[0]).tz_localize('UTC')
-        end_date = (pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)).tz_localize('UTC')
-        filtered_df = filtered_df[(filtered_df['time'] >= start_date) & (filtered_df['time'] < end_date)]
-    
-    if selected_bucket_filter != '全部':
-        filtered_df = filtered_df[filtered_df['bucket'] == selected_bucket_filter]
-    
-    if selected_operation != '全部':
-        filtered_df = filtered_df[filtered_df['operation'] == selected_operation]
-    
-    if selected_status != '全部':
-        filtered_df = filtered_df[filtered_df['http_status'] == selected_status]
+    with render_stats.stage('filter', items=len(df)) as counters:
+        filtered_df = df.copy()
+        
+        if date_range and len(date_range) == 2:
+            start_date = pd.Timestamp(date_range[0]).tz_localize('UTC')
+            end_date = (pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)).tz_localize('UTC')
+            filtered_df = filtered_df[(filtered_df['time'] >= start_date) & (filtered_df['time'] < end_date)]
+        
+        if selected_bucket_filter != '全部':
+            filtered_df = filtered_df[filtered_df['bucket'] == selected_bucket_filter]
+        
+        if selected_operation != '全部':
+            filtered_df = filtered_df[filtered_df['operation'] == selected_operation]
+        
+        if selected_status != '全部':
+            filtered_df = filtered_df[filtered_df['http_status'] == selected_status]
+        counters['bytes'] = int(filtered_df.memory_usage(deep=False).sum())
     
     if len(filtered_df) != len(df):
         st.info(f"筛选后: {len(filtered_df)} 条记录 (从 {len(df)} 条中筛选)")
@@ -255,7 +1003,7 @@ def main():
         st.metric("唯一用户数", unique_users)
     
     with col3:
-        error_count = len(filtered_df[~filtered_df['http_status'].isin(['200', '204', '206', '304'])])
+        error_count = len(filtered_df[~filtered_df['http_status'].isin(SUCCESS_STATUSES)])
         st.metric("错误请求数", error_count)
     
     with col4:
@@ -265,16 +1013,17 @@ def main():
     # 图表展示
     st.markdown("---")
     
-    tab1, tab2, tab3, tab4 = st.tabs(["📊 操作类型", "👤 用户统计", "🌐 IP 分布", "📋 详细列表"])
+    tab1, tab2, tab3, tab7, tab5, tab6, tab4 = st.tabs(
+        ["📊 操作类型", "👤 用户统计", "🌐 IP 分布", "🚨 错误分析", "🗂️ 前缀分析", "🔀 窗口对比", "📋 详细列表"])
     
-    with tab1:
+    with tab1, render_stats.stage('render_operations'):
         st.markdown("### 操作类型分布")
         
         col1, col2 = st.columns([2, 1])
         
         with col1:
             # 饼图
-            op_counts = filtered_df['operation'].value_counts()
+            op_counts = count_values(filtered_df['operation'])
             fig = px.pie(
                 values=op_counts.values,
                 names=op_counts.index,
@@ -294,26 +1043,38 @@ def main():
         # 时间趋势
         if not filtered_df['time'].isna().all():
             st.markdown("#### 操作时间趋势")
-            time_df = filtered_df.groupby([filtered_df['time'].dt.date, 'operation']).size().reset_index(name='count')
-            time_df.columns = ['date', 'operation', 'count']
             
-            fig = px.line(
-                time_df,
-                x='date',
-                y='count',
-                color='operation',
-                title="每日操作趋势"
+            bin_labels = ['自动'] + [label for _, label in TREND_BIN_WIDTHS]
+            selected_bin = st.selectbox("时间粒度", bin_labels, key='trend_bin')
+            span = (filtered_df['time'].max() - filtered_df['time'].min()).total_seconds()
+            if selected_bin == '自动':
+                width, width_label = choose_bin_width(span)
+            else:
+                width = dict((label, w) for w, label in TREND_BIN_WIDTHS)[selected_bin]
+                width, width_label = choose_bin_width(span, min_width=width, target_bins=TREND_MAX_BINS)
+                if width_label != selected_bin:
+                    st.caption(f"所选粒度过细，已调整为 {width_label}")
+            
+            series = build_trend_series(filtered_df['time'], filtered_df['operation'], width)
+            
+            fig = go.Figure()
+            for operation, (x, y) in series.items():
+                fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', name=operation))
+            fig.update_layout(
+                title=f"操作趋势 (粒度: {width_label})",
+                xaxis_title="时间",
+                yaxis_title=f"请求数 / {width_label}"
             )
             st.plotly_chart(fig, use_container_width=True)
     
-    with tab2:
+    with tab2, render_stats.stage('render_users'):
         st.markdown("### 用户访问统计")
         
         col1, col2 = st.columns([2, 1])
         
         with col1:
             # 柱状图
-            user_counts = filtered_df['requester'].value_counts().head(10)
+            user_counts = count_values(filtered_df['requester']).head(10)
             fig = go.Figure(data=[go.Bar(x=user_counts.index, y=user_counts.values)])
             fig.update_layout(title="Top 10 活跃用户", xaxis_title="用户", yaxis_title="请求数", xaxis_tickangle=-45)
             st.plotly_chart(fig, use_container_width=True)
@@ -327,14 +1088,14 @@ def main():
             })
             st.dataframe(user_df, use_container_width=True, height=400)
     
-    with tab3:
+    with tab3, render_stats.stage('render_ips'):
         st.markdown("### IP 地址分布")
         
         col1, col2 = st.columns([2, 1])
         
         with col1:
             # 饼图
-            ip_counts = filtered_df['remote_ip'].value_counts().head(10)
+            ip_counts = count_values(filtered_df['remote_ip']).head(10)
             fig = px.pie(
                 values=ip_counts.values,
                 names=ip_counts.index,
@@ -353,7 +1114,7 @@ def main():
         
         # HTTP 状态码分布
         st.markdown("#### HTTP 状态码分布")
-        status_counts = filtered_df['http_status'].value_counts()
+        status_counts = count_values(filtered_df['http_status'])
         
         fig = go.Figure(data=[go.Bar(
             x=status_counts.index,
@@ -368,11 +1129,20 @@ def main():
         )
         st.plotly_chart(fig, use_container_width=True)
     
-    with tab4:
+    with tab7, render_stats.stage('render_errors'):
+        render_error_analysis(st.session_state.get('rollups'))
+    
+    with tab5, render_stats.stage('render_prefixes'):
+        render_prefix_analysis()
+    
+    with tab6, render_stats.stage('render_comparison'):
+        render_window_comparison(st.session_state.get('rollups'))
+    
+    with tab4, render_stats.stage('render_details'):
         st.markdown("### 详细访问记录")
         
         # 显示列选择
-        display_cols = ['time', 'bucket', 'operation', 'key', 'http_status', 'requester', 'remote_ip', 'bytes_sent']
+        display_cols = ['time', 'source', 'bucket', 'operation', 'key', 'http_status', 'requester', 'remote_ip', 'bytes_sent']
         
         # 格式化显示
         display_df = filtered_df[display_cols].copy()
@@ -387,7 +1157,7 @@ def main():
         display_df['bytes_sent'] = display_df['bytes_sent'].apply(lambda x: f"{int(x):,}" if pd.notna(x) else '0')
         
         # 重命名列
-        display_df.columns = ['时间', '目标Bucket', '操作类型', '对象键', 'HTTP状态', '用户', 'IP地址', '字节数']
+        display_df.columns = ['时间', '日志源', '目标Bucket', '操作类型', '对象键', 'HTTP状态', '用户', 'IP地址', '字节数']
         
         # 显示记录数和性能提示
         delete_count = len(display_df[display_df['操作类型'].str.contains('DELETE', na=False)])
@@ -476,6 +1246,8 @@ def main():
             st.caption(f"共 {len(display_df)} 条")
         with col3:
             st.caption("💡 删除操作红色高亮")
+    
+    render_diagnostics(diagnostics_panel, render_stats)
 
 if __name__ == "__main__":
     main()
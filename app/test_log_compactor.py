@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+测试日志压缩归档的写入、流式读取和点查
+"""
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from log_compactor import LogArchive, LogIndex, compact_day, lookup_archive, iter_compacted, list_compacted, load_compacted
+from log_parser import plan_load
+
+LOG_BUCKET = 'access-log-bucket'
+PREFIX = 's3logs/'
+DAY = '2026-10-18'
+
+
+def log_line(i, bucket='data-bucket'):
+    """生成一行原始访问日志"""
+    key = f'data/{i % 7}/obj.csv'
+    return (f'owner {bucket} [18/Oct/2026:{i // 60 % 24:02d}:{i % 60:02d}:00 +0000] 10.0.0.{i % 3} '
+            f'arn:aws:iam::123456789012:user/app REQ{i:08d} REST.GET.OBJECT {key} "GET /{key} HTTP/1.1" '
+            f'200 - 100 100 10 5 "-" "aws-cli" -')
+
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=LOG_BUCKET)
+        yield client
+
+
+def put_raw_logs(s3_client, files=6, per_file=50, partitioned=False):
+    """按 SimplePrefix（或 PartitionedPrefix）格式投递原始日志，一半来自另一个源 bucket"""
+    day_dir = DAY.replace('-', '/') + '/' if partitioned else ''
+    for f in range(files):
+        lines = [log_line(f * per_file + i, 'data-bucket' if f % 2 else 'other-bucket') for i in range(per_file)]
+        s3_client.put_object(Bucket=LOG_BUCKET, Key=f'{PREFIX}{day_dir}{DAY}-{f:02d}-00-00-ABCDEF{f}',
+                             Body='\n'.join(lines).encode('utf-8'))
+    return files * per_file
+
+
+def test_list_compacted_plans_without_reading(s3_client, tmp_path):
+    """清单给出归档行数，加载端可以在读取归档前规划内存"""
+    rows = put_raw_logs(s3_client)
+    archive = LogArchive(str(tmp_path))
+    compact_day(s3_client, LOG_BUCKET, PREFIX, DAY, archive)
+
+    days, compacted_keys, archived_rows = list_compacted(archive, [(LOG_BUCKET, PREFIX, None)])
+    assert archived_rows == rows
+    assert len(compacted_keys[f'{LOG_BUCKET}/{PREFIX}']) == 6
+    assert plan_load(0, budget_mb=1, known_rows=archived_rows)['estimated_rows'] == rows
+
+
+def test_iter_compacted_streams_batches(s3_client, tmp_path):
+    """流式读取按批产出，拼接后与一次读取全部归档的结果相同"""
+    rows = put_raw_logs(s3_client)
+    archive = LogArchive(str(tmp_path))
+    compact_day(s3_client, LOG_BUCKET, PREFIX, DAY, archive)
+    days, _, _ = list_compacted(archive, [(LOG_BUCKET, PREFIX, None)])
+
+    batches = list(iter_compacted(archive, days, batch_rows=40))
+    assert all(len(batch) <= 40 for batch in batches)
+    assert sum(len(batch) for batch in batches) == rows
+    assert (batches[0]['source'] == f'{LOG_BUCKET}/{PREFIX}').all()
+
+    df = load_compacted(archive, days)
+    assert len(df) == rows
+    assert sorted(df['request_id'].astype(str)) == [f'REQ{i:08d}' for i in range(rows)]
+
+
+@pytest.mark.parametrize('partitioned', [False, True])
+def test_compact_day_and_lookup(s3_client, tmp_path, partitioned):
+    """两种日志键格式都按天压缩，倒排索引点查只返回目标对象的记录"""
+    rows = put_raw_logs(s3_client, partitioned=partitioned)
+    archive = LogArchive(str(tmp_path))
+    index = LogIndex(archive.index_path(LOG_BUCKET, PREFIX))
+    manifest = compact_day(s3_client, LOG_BUCKET, PREFIX, DAY, archive, index=index)
+    index.commit()
+
+    assert len(manifest['raw_keys']) == 6
+    assert sorted(manifest['files']) == ['data-bucket', 'other-bucket']
+    assert sum(info['rows'] for info in manifest['files'].values()) == rows
+    assert compact_day(s3_client, LOG_BUCKET, PREFIX, '2026-10-17', archive) is None
+
+    df = lookup_archive(archive, index, 'key', 'data/0/obj.csv')
+    assert sorted(df['request_id'].astype(str)) == [f'REQ{i:08d}' for i in range(0, rows, 7)]
+    assert df['time'].is_monotonic_increasing
+    assert lookup_archive(archive, index, 'request_id', 'REQ00000299')['key'].astype(str).tolist() == [
+        'data/5/obj.csv']
+    assert lookup_archive(archive, index, 'key', 'missing.csv').empty
+    index.close()
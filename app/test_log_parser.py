@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+测试日志列出、布隆过滤器检索与流水线统计
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import log_parser
+from log_parser import (
+    SMALL_OBJECT_BYTES, BloomCache, BloomFilter, IngestCache, PipelineStats, bloom_item, discover_log_targets,
+    list_log_files, list_sources, log_key_layout, log_key_start, parse_s3_log_line, process_log_file, runs_to_dataframe,
+    schedule_tasks, search_log_files
+)
+
+LOG_BUCKET = 'access-log-bucket'
+
+
+@pytest.fixture
+def s3_client():
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=LOG_BUCKET)
+        yield client
+
+
+def put_logs(s3_client, prefix, stamps, partitioned=False):
+    """按投递时间写入日志对象，返回按字典序排列的键"""
+    keys = []
+    for i, stamp in enumerate(stamps):
+        name = f"{stamp:%Y-%m-%d-%H-%M-%S}-{i:04X}"
+        key = f"{prefix}{stamp:%Y/%m/%d}/{name}" if partitioned else f"{prefix}{name}"
+        s3_client.put_object(Bucket=LOG_BUCKET, Key=key, Body=b'line')
+        keys.append(key)
+    return sorted(keys)
+
+
+def count_listed(s3_client):
+    """统计 list_objects_v2 分页返回的对象数"""
+    listed = []
+    original = s3_client.get_paginator
+
+    class Paginator:
+        def __init__(self, paginator):
+            self.paginator = paginator
+
+        def paginate(self, **params):
+            for page in self.paginator.paginate(**params):
+                listed.extend(page.get('Contents', []))
+                yield page
+
+    s3_client.get_paginator = lambda name: Paginator(original(name))
+    return listed
+
+
+@pytest.mark.parametrize('partitioned', [False, True])
+def test_list_log_files_keeps_newest_window(s3_client, partitioned):
+    """超过 max_files 时返回最新的文件，只列出最近的时间窗口而不是全部历史；最大日志键是最新的键"""
+    now = datetime.now(timezone.utc)
+    history = put_logs(s3_client, 'logs/', [now - timedelta(days=30 + i * 2) for i in range(300)], partitioned)
+    keys = put_logs(s3_client, 'logs/', [now - timedelta(hours=i, minutes=30) for i in range(30)], partitioned)
+    listed = count_listed(s3_client)
+
+    log_files, last_key = list_log_files(s3_client, LOG_BUCKET, 'logs/', max_files=10)
+    assert [obj['Key'] for obj in log_files] == keys[-10:]
+    assert last_key == keys[-1]
+    # 历史日志一个都没有列出
+    assert not set(obj['Key'] for obj in listed) & set(history)
+
+    # 不够数时继续往前，直到最早的日志
+    log_files, _ = list_log_files(s3_client, LOG_BUCKET, 'logs/', max_files=1000)
+    assert [obj['Key'] for obj in log_files] == sorted(history + keys)
+
+    new_keys = put_logs(s3_client, 'logs/', [now + timedelta(minutes=5)], partitioned)
+    log_files, last_key = list_log_files(s3_client, LOG_BUCKET, 'logs/', None, start_after=keys[-1])
+    assert [obj['Key'] for obj in log_files] == new_keys
+    assert last_key == new_keys[-1]
+
+
+@pytest.mark.parametrize('partitioned', [False, True])
+def test_list_log_files_starts_from_cutoff(s3_client, partitioned):
+    """按键格式从 cutoff_time 推算起始键，两种前缀格式都能识别"""
+    now = datetime.now(timezone.utc)
+    stamps = [now - timedelta(days=days) for days in (30, 20, 10, 0.5, 0.1)]
+    keys = put_logs(s3_client, 'logs/', stamps, partitioned)
+    assert log_key_layout(s3_client, LOG_BUCKET, 'logs/') == ('partitioned' if partitioned else 'simple')
+    # 早于起始键的日志不会被列出
+    assert log_key_start('logs/', 'partitioned' if partitioned else 'simple', now - timedelta(days=15)) > keys[1]
+
+    log_files, last_key = list_log_files(s3_client, LOG_BUCKET, 'logs/', max_files=100,
+                                         cutoff_time=now - timedelta(days=2))
+    # moto 中对象的修改时间都是写入时间，时间过滤不会排除任何文件，更早的键是按起始键跳过的
+    assert [obj['Key'] for obj in log_files] == keys[3:]
+    assert last_key == keys[-1]
+
+
+def test_log_key_layout_unknown_keys(s3_client):
+    """前缀下有非日志对象时无法按键推算时间，没有对象时返回 None"""
+    s3_client.put_object(Bucket=LOG_BUCKET, Key='logs/not-a-log.txt', Body=b'x')
+    assert log_key_layout(s3_client, LOG_BUCKET, 'logs/') == 'mixed'
+    assert log_key_layout(s3_client, LOG_BUCKET, 'empty/') is None
+
+
+def test_list_log_files_parent_prefix(s3_client):
+    """从 PartitionedPrefix 的上级前缀（账户 ID/区域/源 bucket 之上）加载时按修改时间过滤，不报错"""
+    now = datetime.now(timezone.utc)
+    keys = put_logs(s3_client, 's3logs/123456789012/us-east-1/src-a/', [now - timedelta(days=d) for d in (1, 2)], True)
+    keys += put_logs(s3_client, 's3logs/123456789012/us-east-1/src-b/', [now - timedelta(days=3)], True)
+    assert log_key_layout(s3_client, LOG_BUCKET, 's3logs/') == 'mixed'
+
+    log_files, last_key = list_log_files(s3_client, LOG_BUCKET, 's3logs/', max_files=100,
+                                         cutoff_time=now - timedelta(days=7))
+    assert [obj['Key'] for obj in log_files] == sorted(keys)
+    assert last_key == max(keys)
+
+
+def test_list_log_files_mixed_prefix(s3_client):
+    """SimplePrefix 日志和 PartitionedPrefix 子目录混在一个前缀下时不推算起始键，两种日志都能列出"""
+    now = datetime.now(timezone.utc)
+    keys = put_logs(s3_client, 'logs/', [now - timedelta(days=d) for d in (1, 2, 40)])
+    keys += put_logs(s3_client, 'logs/123456789012/us-east-1/src/', [now - timedelta(days=1)], True)
+    assert log_key_layout(s3_client, LOG_BUCKET, 'logs/') == 'mixed'
+
+    log_files, _ = list_log_files(s3_client, LOG_BUCKET, 'logs/', max_files=100, cutoff_time=now - timedelta(days=7))
+    # moto 的修改时间都是写入时间，40 天前投递的键也在时间范围内
+    assert [obj['Key'] for obj in log_files] == sorted(keys)
+
+
+def parsed_run(source, minutes):
+    """一个日志源内按时间排序的解析结果，request_id 标明来源和分钟"""
+    run = []
+    for minute in minutes:
+        parsed = parse_s3_log_line(
+            f'owner data-bucket [18/Oct/2026:{minute // 60:02d}:{minute % 60:02d}:00 +0000] 10.0.0.1 - '
+            f'{source.upper()}{minute:04d} REST.GET.OBJECT a.csv "GET /a.csv HTTP/1.1" 200 - 1 1 1 1 "-" "aws-cli" -')
+        parsed['source'] = source
+        run.append(parsed)
+    return run
+
+
+def test_runs_to_dataframe_merges_sources():
+    """两个日志源的有序片段 k 路归并为全局时间线，保留各行的来源，同一时刻先来的片段在前"""
+    east = parsed_run('east', [0, 5, 30, 61, 120])
+    west = parsed_run('west', [1, 5, 29, 90])
+    df = runs_to_dataframe([east, west])
+
+    assert len(df) == 9
+    assert df['time'].is_monotonic_increasing
+    assert df['request_id'].astype(str).tolist() == [
+        'EAST0000', 'WEST0001', 'EAST0005', 'WEST0005', 'WEST0029', 'EAST0030', 'EAST0061', 'WEST0090', 'EAST0120']
+    assert df['source'].astype(str).tolist() == [request_id[:4].lower() for request_id in df['request_id']]
+    assert runs_to_dataframe([]).empty
+
+
+def test_process_log_file_counts_failures(s3_client):
+    """读取或解码失败的文件返回空列表，失败数记入 failed_files 阶段"""
+    s3_client.put_object(Bucket=LOG_BUCKET, Key='logs/binary', Body=b'\xff\xfe\x00')
+    stats = PipelineStats()
+    assert process_log_file(s3_client, LOG_BUCKET, 'logs/missing', stats=stats) == []
+    assert process_log_file(s3_client, LOG_BUCKET, 'logs/binary', stats=stats) == []
+    assert stats.to_dict()['failed_files']['items'] == 2
+
+
+def test_pipeline_stats_memory_per_stage():
+    """阶段内存为块前后常驻内存的变化，进程峰值单独标注"""
+    stats = PipelineStats()
+    with stats.stage('allocate'):
+        block = bytearray(64 * 1024 * 1024)
+        block[::4096] = b'x' * len(block[::4096])
+    with stats.stage('idle'):
+        pass
+    stats.add('threaded', wall=0.1)
+
+    result = stats.to_dict()
+    if result['allocate']['rss_delta_mb'] is None:
+        pytest.skip('没有 /proc/self/statm')
+    assert result['allocate']['rss_delta_mb'] > 48
+    assert abs(result['idle']['rss_delta_mb']) < 16
+    assert result['threaded']['rss_delta_mb'] is None
+    assert result['idle']['process_peak_mb'] >= result['allocate']['rss_delta_mb']
+    del block
+
+
+def test_discover_log_targets(s3_client, monkeypatch):
+    """按各 bucket 的访问日志配置返回日志位置，分区前缀包含 账户 ID/区域/源 bucket 一级"""
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    s3_client.put_bucket_acl(Bucket=LOG_BUCKET, GrantWrite='uri=http://acs.amazonaws.com/groups/s3/LogDelivery',
+                             GrantReadACP='uri=http://acs.amazonaws.com/groups/s3/LogDelivery')
+    for name in ('simple-src', 'partitioned-src', 'quiet-src'):
+        s3_client.create_bucket(Bucket=name)
+    s3_client.put_bucket_logging(Bucket='simple-src', BucketLoggingStatus={'LoggingEnabled': {
+        'TargetBucket': LOG_BUCKET, 'TargetPrefix': 'simple/'}})
+    s3_client.put_bucket_logging(Bucket='partitioned-src', BucketLoggingStatus={'LoggingEnabled': {
+        'TargetBucket': LOG_BUCKET, 'TargetPrefix': 'logs/',
+        'TargetObjectKeyFormat': {'PartitionedPrefix': {'PartitionDateSource': 'EventTime'}}}})
+    account = boto3.client('sts').get_caller_identity()['Account']
+
+    def add_key_format(parsed, **kwargs):
+        # moto 不保存 TargetObjectKeyFormat，按目标前缀补上
+        logging = parsed.get('LoggingEnabled', {})
+        if logging.get('TargetPrefix') == 'logs/':
+            logging['TargetObjectKeyFormat'] = {'PartitionedPrefix': {'PartitionDateSource': 'EventTime'}}
+
+    events = boto3.DEFAULT_SESSION.events
+    events.register('after-call.s3.GetBucketLogging', add_key_format)
+    try:
+        targets = discover_log_targets()
+    finally:
+        events.unregister('after-call.s3.GetBucketLogging', add_key_format)
+    assert targets == {
+        'simple-src': {'bucket': LOG_BUCKET, 'prefix': 'simple/', 'region': 'us-east-1'},
+        'partitioned-src': {'bucket': LOG_BUCKET, 'prefix': f'logs/{account}/us-east-1/partitioned-src/',
+                            'region': 'us-east-1'},
+    }
+
+
+def make_tasks(sizes):
+    """按文件大小生成下载任务 (client, bucket, key, source, size)"""
+    return [(None, LOG_BUCKET, f'logs/{i:04d}', None, size) for i, size in enumerate(sizes)]
+
+
+def test_schedule_tasks_largest_first():
+    """批次按总大小降序排列，不小于 64 KB 的文件单独成批，小文件按 1/workers 的上限合批"""
+    tasks = make_tasks([100 * 1024, SMALL_OBJECT_BYTES, 300 * 1024] + [1024] * 100)
+    batches = schedule_tasks(tasks, workers=4)
+
+    sizes = [sum(task[4] for task in batch) for batch in batches]
+    assert sizes == sorted(sizes, reverse=True)
+    assert sorted(task[2] for batch in batches for task in batch) == [task[2] for task in tasks]
+    assert [batch for batch in batches if any(task[4] >= SMALL_OBJECT_BYTES for task in batch)] == [
+        [tasks[2]], [tasks[0]], [tasks[1]]]
+    # 100 KB 小文件分给 4 个线程，每批不超过 25 KB
+    small = [batch for batch in batches if batch[0][4] < SMALL_OBJECT_BYTES]
+    assert [len(batch) for batch in small] == [25] * 4
+
+
+def test_schedule_tasks_spreads_tiny_logs():
+    """小文件总量很少时不会合成一批，仍分散到各个线程"""
+    tasks = make_tasks([100] * 10)
+    assert schedule_tasks(tasks, workers=50) == [[task] for task in tasks]
+    assert len(schedule_tasks(tasks, workers=2)) == 2
+
+
+def fake_process_log_file(calls, rows=1, delay=0):
+    """替换 process_log_file，记录每次调用的日志键，返回 rows 行固定大小的记录"""
+    lock = threading.Lock()
+
+    def process(client, bucket, key, source, stats=None, bloom_cache=None):
+        with lock:
+            calls.append(key)
+        time.sleep(delay)
+        return [{'key': key, 'payload': 'x' * 1024} for _ in range(rows)]
+    return process
+
+
+def test_ingest_cache_single_flight(monkeypatch):
+    """多个线程同时请求同一文件时只下载解析一次，其余请求等待并得到同一个表"""
+    calls = []
+    monkeypatch.setattr(log_parser, 'process_log_file', fake_process_log_file(calls, delay=0.2))
+    cache = IngestCache()
+    stats = PipelineStats()
+    task = (None, LOG_BUCKET, 'logs/2026-10-18-00-00-00-ABCDEF', None, 100)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tables = list(executor.map(lambda _: cache.get(task, stats), range(8)))
+    assert calls == [task[2]]
+    assert all(table is tables[0] for table in tables)
+    assert stats.to_dict()['cache_wait']['items'] == 7
+
+    assert cache.get(task, stats) is tables[0]
+    assert calls == [task[2]]
+
+
+def test_ingest_cache_evicts_by_bytes(monkeypatch):
+    """缓存总字节数不超过容量，按最近使用淘汰，超过容量的单个表不缓存"""
+    calls = []
+    monkeypatch.setattr(log_parser, 'process_log_file', fake_process_log_file(calls, rows=256))
+    tasks = [(None, LOG_BUCKET, f'logs/{i}', None, 100) for i in range(4)]
+    table_bytes = IngestCache().get(tasks[0]).nbytes
+    cache = IngestCache(max_mb=table_bytes * 2.5 / 1024**2)
+
+    cache.get(tasks[0])
+    cache.get(tasks[1])
+    cache.get(tasks[0])  # 命中，tasks[1] 变为最久未使用
+    cache.get(tasks[2])
+    assert cache.nbytes == table_bytes * 2 <= cache.max_bytes
+    calls.clear()
+    cache.get(tasks[0])
+    cache.get(tasks[2])
+    assert calls == []
+    cache.get(tasks[1])
+    assert calls == [tasks[1][2]]
+
+    cache.resize(table_bytes * 1.5 / 1024**2)
+    assert cache.nbytes == table_bytes
+    cache.resize(table_bytes / 2 / 1024**2)
+    assert cache.nbytes == 0
+    cache.get(tasks[3])
+    assert cache.nbytes == 0
+
+
+def test_bloom_filter_has_no_false_negatives():
+    """加入的条目都能查到，序列化后不变，误判率接近目标"""
+    bloom = BloomFilter(5000, fp_rate=0.01)
+    items = [bloom_item('key', f'data/{i}/obj.csv') for i in range(5000)]
+    for item in items:
+        bloom.add(item)
+    restored = BloomFilter.from_bytes(bloom.to_bytes())
+
+    assert all(item in bloom and item in restored for item in items)
+    false_positives = sum(bloom_item('key', f'other/{i}') in restored for i in range(20000))
+    assert false_positives / 20000 < 0.02
+
+
+def test_search_skips_files_by_bloom_filter(s3_client, tmp_path):
+    """首次检索解析所有文件并建立过滤器，再次检索只下载可能包含目标的文件"""
+    for f in range(4):
+        lines = [f'owner data-bucket [18/Oct/2026:00:{i:02d}:00 +0000] 10.0.0.1 arn:aws:iam::1:user/app REQ{f}{i:03d} '
+                 f'REST.GET.OBJECT data/{f}/obj{i}.csv "GET /data/{f}/obj{i}.csv HTTP/1.1" 200 - 100 100 10 5 "-" '
+                 f'"aws-cli" -' for i in range(20)]
+        s3_client.put_object(Bucket=LOG_BUCKET, Key=f'logs/2026-10-18-00-00-0{f}-ABCDEF',
+                             Body='\n'.join(lines).encode('utf-8'))
+    tasks, _ = list_sources({None: s3_client}, [(LOG_BUCKET, 'logs/', None)], None)
+    bloom_cache = BloomCache(str(tmp_path))
+
+    matches, skipped = search_log_files(tasks, 'key', 'data/2/obj7.csv', bloom_cache)
+    assert [row['request_id'] for row in matches] == ['REQ2007'] and skipped == 0
+
+    for f in range(4):
+        for i in range(20):
+            assert bloom_item('key', f'data/{f}/obj{i}.csv') in bloom_cache.get(LOG_BUCKET, tasks[f][2])
+    matches, skipped = search_log_files(tasks, 'key', 'data/2/obj7.csv', bloom_cache)
+    assert [row['request_id'] for row in matches] == ['REQ2007'] and skipped >= 2
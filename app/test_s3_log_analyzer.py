@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+测试日志分析应用的汇总与前缀树
+"""
+
+import copy
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from log_parser import PipelineStats, runs_to_dataframe
+from s3_log_analyzer import (
+    append_within_budget, build_prefix_trie, build_rollups, build_trend_series, compare_windows, key_prefixes,
+    load_aggregates, lttb_downsample, merge_prefix_trie, merge_rollups
+)
+
+
+def make_log(i, key, status='200', operation='REST.GET.OBJECT'):
+    """生成一行解析后的访问日志"""
+    return {
+        'bucket_owner': 'owner', 'bucket': 'data-bucket', 'time': f'19/Oct/2026:{i // 60 % 24:02d}:{i % 60:02d}:00 +0000',
+        'remote_ip': f'10.0.0.{i % 3}', 'requester': 'arn:aws:iam::123456789012:user/app', 'request_id': f'REQ{i:08d}',
+        'operation': operation, 'key': key, 'request_uri': f'GET /{key} HTTP/1.1', 'http_status': status,
+        'error_code': '-' if status == '200' else 'NoSuchKey', 'bytes_sent': '100', 'object_size': '100',
+        'total_time': '10', 'turn_around_time': '5', 'referer': '-', 'user_agent': 'aws-cli', 'version_id': '-',
+    }
+
+
+def make_logs():
+    """带 '-' 键（ListBucket 等无对象键的请求）的日志，key 列会被字典编码"""
+    keys = ['data/2026/a.csv', 'data/2026/b.csv', 'logs/app/c.log', '-']
+    return runs_to_dataframe([[make_log(i, keys[i % len(keys)], '404' if i % 5 == 0 else '200') for i in range(200)]])
+
+
+def test_key_prefixes_categorical():
+    """字典编码的 key 列中含 '-' 时截取前缀"""
+    keys = pd.Series(['data/2026/a.csv', '-', 'top.txt', '-'], dtype='category')
+    assert key_prefixes(keys, 2).tolist() == ['data/2026', '', 'top.txt', '']
+
+
+def test_build_rollups_categorical_key():
+    """从压缩后的日志构建小时汇总和前缀树"""
+    df = make_logs()
+    assert isinstance(df['key'].dtype, pd.CategoricalDtype)
+
+    rollups = build_rollups(df)
+    prefixes = rollups['prefix'].groupby(level='prefix').sum()['requests']
+    assert prefixes.to_dict() == {'': 50, 'data/2026': 100, 'logs/app': 50}
+    assert rollups['errors']['requests'].sum() == 40
+
+    trie = build_prefix_trie(df)
+    assert trie['requests'] == 200
+    assert trie['children']['data']['children']['2026']['requests'] == 100
+    assert trie['errors'] == 40
+
+
+def test_merge_does_not_modify_cached_aggregates():
+    """追踪模式合并新日志时不修改 load_s3_logs 缓存（所有会话共享）中的汇总和前缀树"""
+    df = make_logs()
+    cached_trie, cached_rollups = build_prefix_trie(df), build_rollups(df)
+    trie_snapshot = copy.deepcopy(cached_trie)
+    rollup_snapshot = {dim: rollup.copy() for dim, rollup in cached_rollups.items()}
+
+    new_df = runs_to_dataframe([[make_log(i, 'data/2026/new.csv') for i in range(300, 320)]])
+    trie = merge_prefix_trie(cached_trie, build_prefix_trie(new_df, min_requests=1))
+    rollups = merge_rollups(cached_rollups, build_rollups(new_df))
+
+    assert trie['requests'] == 220
+    assert trie['children']['data']['children']['2026']['requests'] == 120
+    assert rollups['prefix']['requests'].sum() == 220
+    assert cached_trie == trie_snapshot
+    for dim, rollup in cached_rollups.items():
+        pd.testing.assert_frame_equal(rollup, rollup_snapshot[dim])
+
+
+def test_load_aggregates_streams_archived_batches():
+    """压缩归档逐批并入汇总和抽样，与原始日志一起计数"""
+    df = make_logs()
+    archived = (df.iloc[start:start + 30] for start in range(0, len(df), 30))
+    runs = [[make_log(i, 'data/2026/raw.csv') for i in range(300, 350)]]
+    plan = {'sample_rows': 100, 'batch_rows': 30}
+
+    sample, rollups, trie = load_aggregates(runs, plan, PipelineStats(), archived)
+    assert trie['requests'] == 250
+    assert rollups['prefix']['requests'].sum() == 250
+    assert len(sample) == 100
+
+
+def test_append_within_budget_downgrades():
+    """追踪模式追加后超出内存预算时降级为均匀抽样，预算内照常追加"""
+    df = make_logs()
+    new_df = runs_to_dataframe([[make_log(i, 'data/2026/new.csv') for i in range(300, 320)]])
+
+    appended, plan = append_within_budget(df, new_df, {'mode': 'full', 'budget_mb': 64})
+    assert len(appended) == 220 and plan['mode'] == 'full'
+
+    with patch('s3_log_analyzer.plan_load', return_value={'mode': 'sample', 'sample_rows': 50, 'budget_mb': 1}):
+        sample, plan = append_within_budget(df, new_df, {'mode': 'full', 'budget_mb': 1})
+    assert plan['mode'] == 'sample' and len(sample) == 50
+    assert set(sample['request_id']) <= set(df['request_id']) | set(new_df['request_id'])
+    assert sample['time'].is_monotonic_increasing
+
+
+def test_compare_windows_by_hour():
+    """按小时汇总对比两个窗口：基准窗口为 00:00，当前窗口为 01:00，窗口外的小时不计入"""
+    operations = (['REST.GET.OBJECT'] * 20 + ['REST.DELETE.OBJECT'] * 30 + ['REST.HEAD.OBJECT'] * 10 +  # 00:00
+                  ['REST.GET.OBJECT'] * 45 + ['REST.PUT.OBJECT'] * 10 + ['REST.HEAD.OBJECT'] * 5 +  # 01:00
+                  ['REST.PUT.OBJECT'] * 60)  # 02:00
+    df = runs_to_dataframe([[make_log(i, 'data/a.csv', operation=op) for i, op in enumerate(operations)]])
+    day = pd.Timestamp('2026-10-19', tz='UTC')
+    hour = pd.Timedelta(hours=1)
+
+    result = compare_windows(build_rollups(df), (day + hour, day + 2 * hour), (day, day + hour))
+    compared = result['operation']
+    assert compared.index.name == 'operation'
+    assert compared.index.tolist() == ['REST.DELETE.OBJECT', 'REST.GET.OBJECT', 'REST.PUT.OBJECT', 'REST.HEAD.OBJECT']
+    assert compared['baseline'].tolist() == [30, 20, 0, 10]
+    assert compared['current'].tolist() == [0, 45, 10, 5]
+    assert compared['delta'].tolist() == [-30, 25, 10, -5]
+    assert compared['ratio'].tolist()[:2] == [-1.0, 1.25] and compared['ratio'].iloc[3] == -0.5
+    # 基准为 0 的新取值没有相对变化
+    assert np.isnan(compared.loc['REST.PUT.OBJECT', 'ratio'])
+
+    # 可按字节数对比；没有汇总的维度不出现在结果中
+    by_bytes = compare_windows(build_rollups(df), (day + hour, day + 2 * hour), (day, day + hour), metric='bytes')
+    assert by_bytes['operation'].loc['REST.GET.OBJECT', 'delta'] == 2500
+    assert compare_windows({}, (day, day + hour), (day - hour, day)) == {}
+
+
+def test_lttb_downsample_keeps_shape():
+    """降采样到目标点数，保留首尾点和孤立的尖峰，横坐标保持递增"""
+    x = np.arange(10000, dtype=np.float64)
+    y = np.sin(x / 500)
+    y[6543] = 50
+    sx, sy = lttb_downsample(x, y, 200)
+
+    assert len(sx) == 200
+    assert sx[0] == 0 and sx[-1] == 9999
+    assert np.all(np.diff(sx) > 0)
+    assert 50 in sy
+    np.testing.assert_array_equal(sy, y[sx.astype(np.int64)])
+    short_x, _ = lttb_downsample(x[:100], y[:100], 200)
+    assert len(short_x) == 100
+
+
+def test_build_trend_series_counts():
+    """分桶计数覆盖所有请求，空桶补零"""
+    df = make_logs()
+    # 日志每分钟一条，按 30 秒分桶时每隔一个桶为空
+    series = build_trend_series(df['time'], df['operation'], width=30)
+    times, counts = series['REST.GET.OBJECT']
+    assert counts.sum() == 200
+    assert len(times) == 399 and (counts == 0).sum() == 199
+    assert times.is_monotonic_increasing
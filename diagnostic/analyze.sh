@@ -26,6 +26,19 @@ show_help() {
     echo "  --region REGION      AWS 区域 (默认: us-east-1)"
     echo "  --days DAYS          分析天数 (默认: 90天)"
     echo "  --skip-listing       跳过对象列表统计 (加快分析速度)"
+    echo "  --workers N          版本扫描并发线程数 (默认: 8)"
+    echo "  --inventory PATH     使用 S3 Inventory manifest.json (s3://... 或本地目录) 代替实时列出"
+    echo "  --resume             从上次中断的版本扫描断点继续"
+    echo "  --progress-interval N 扫描进度最短输出间隔秒数 (默认: 10)"
+    echo "  --progress-file PATH 把扫描进度以 NDJSON 格式写入文件"
+    echo "  --verbose            输出每页的调试信息"
+    echo "  --sample-margin E    --skip-listing 采样验证的目标误差 (默认: 0.005)"
+    echo ""
+    echo "批量模式 (代替 bucket-name):"
+    echo "  --buckets LIST       逗号分隔的 bucket 名称"
+    echo "  --bucket-file FILE   每行一个 bucket 名称的文件"
+    echo "  --all-buckets        分析账号下的所有 bucket"
+    echo "  --max-concurrent-buckets N 同时分析的 bucket 数 (默认: 4)"
     echo "  --background, -b     后台运行"
     echo "  -h, --help           显示此帮助信息"
     echo ""
@@ -106,6 +119,30 @@ while [ $i -le $# ]; do
         --skip-listing)
             ARGS+=("--skip-listing")
             ;;
+        --resume)
+            ARGS+=("--resume")
+            ;;
+        --verbose)
+            ARGS+=("--verbose")
+            ;;
+        --progress-interval|--progress-file|--buckets|--bucket-file|--max-concurrent-buckets|--sample-margin)
+            i=$((i + 1))
+            if [ $i -le $# ]; then
+                ARGS+=("$arg" "${!i}")
+            fi
+            ;;
+        --workers)
+            i=$((i + 1))
+            if [ $i -le $# ]; then
+                ARGS+=("--workers" "${!i}")
+            fi
+            ;;
+        --inventory)
+            i=$((i + 1))
+            if [ $i -le $# ]; then
+                ARGS+=("--inventory" "${!i}")
+            fi
+            ;;
         --*)
             # 其他选项直接传递
             ARGS+=("$arg")
@@ -122,6 +159,11 @@ while [ $i -le $# ]; do
     i=$((i + 1))
 done
 
+# 批量模式没有单个 bucket 名称，日志文件使用 fleet
+if [ -z "$BUCKET_NAME" ]; then
+    BUCKET_NAME="fleet"
+fi
+
 # 执行分析
 if [ "$BACKGROUND" = true ]; then
     LOG_FILE="$SCRIPT_DIR/logs/analyze_${BUCKET_NAME}.log"
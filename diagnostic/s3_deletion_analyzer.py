@@ -6,81 +6,1174 @@ S3 数据丢失分析工具
 
 import boto3
 import argparse
+import bisect
 import json
 import os
+import sys
+import heapq
+import math
+import random
+import string
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from botocore.config import Config
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime, timedelta, timezone
-from collections import defaultdict
+from collections import deque
+from urllib.parse import unquote_plus
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # 仅 --inventory 需要 pyarrow
+    pa = None
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+# 版本扫描的详细信息上限（控制内存）
+MAX_DELETE_MARKERS = 5000  # 报告中保留的最新删除标记详情条数（计数始终精确）
+MAX_NONCURRENT_KEYS = 5000  # 报告中列出的非当前版本对象数（按非当前版本字节数取前 N，统计始终精确）
+NONCURRENT_MEMORY_KEYS = 200000  # 非当前版本按键聚合时内存中最多保留的键数（所有分片合计），超出后溢出到 SQLite
+
+# 前缀分片并发扫描
+DEFAULT_SCAN_WORKERS = 8  # 默认并发扫描线程数（--workers）
+SHARDS_PER_WORKER = 4  # 目标分片数 = 线程数 × 4，分片越细负载越均衡
+MAX_SHARD_DEPTH = 4  # 前缀最多递归拆分的层数
+SHARD_PROBE_PAGES = 5  # 发现分片时每个前缀最多列出的页数
+
+# 断点续扫（--resume）
+CHECKPOINT_INTERVAL = 60  # 每个分片至少每隔多少秒保存一次断点（秒）
+SHARD_RETRIES = 3  # 分片列出失败后从断点重试的次数
+
+DEFAULT_PROGRESS_INTERVAL = 10  # 扫描进度最多每隔多少秒输出一次（--progress-interval）
+
+DEFAULT_FLEET_CONCURRENCY = 4  # 批量模式下同时分析的 bucket 数（--max-concurrent-buckets）
+
+# --skip-listing 时的键空间采样验证
+DEFAULT_SAMPLE_MARGIN = 0.005  # 目标误差：比例 95% 置信区间的半宽（--sample-margin，0.005 即 ±0.5 个百分点）
+SAMPLE_CONFIDENCE_Z = 1.96  # 95% 置信水平
+SAMPLE_PILOT_PROBES = 40  # 先取的随机样本数（各层至少 2 个），用于估计各层大小和方差
+MAX_SAMPLE_PROBES = 400  # 随机样本数上限（每个样本一次 list_object_versions 请求）
+SAMPLE_PROBE_KEYS = 1000  # 每个样本从随机 KeyMarker 起连续取的条目数
+SAMPLE_CENSUS_PAGES = 3  # 不超过该页数即可列完的层直接精确计数
+SAMPLE_EXPLORE = 0.5  # 键模型中取值会变化的位分给同类未见字符的概率，使第一页之后的键也能取到
+SAMPLE_EXPLORE_FIXED = 0.05  # 已见取值固定的位（如固定的目录名）分给同类未见字符的概率
+
+MAX_PREFIXES = 1000  # 当前对象按前缀统计的前缀数量上限（节省内存）
+
+# S3 Inventory 字段：CSV 使用 fileSchema 中的驼峰名，ORC/Parquet 使用下划线名
+INVENTORY_FIELDS = {
+    'Key': 'key',
+    'VersionId': 'version_id',
+    'IsLatest': 'is_latest',
+    'IsDeleteMarker': 'is_delete_marker',
+    'Size': 'size',
+    'LastModifiedDate': 'last_modified_date'
+}
+
+
+class ScanAccumulator(ABC):
+    """统一版本扫描的累加器：每个分片一个实例，扫描结束后按分片合并"""
+    
+    name = None
+    
+    def __init__(self, analyzer, store=None):
+        self.analyzer = analyzer
+        self.store = store  # 断点续扫时分片的 SQLite 连接，见 ScanCheckpoint
+    
+    @abstractmethod
+    def add_page(self, page):
+        """处理一页 list_object_versions 结果"""
+    
+    @abstractmethod
+    def add_table(self, table):
+        """处理一批 S3 Inventory 记录（见 _normalize_inventory_table 的列定义）"""
+    
+    @abstractmethod
+    def merge(self, other):
+        """合并另一个分片或清单文件的累加器"""
+    
+    @abstractmethod
+    def result(self):
+        """返回扫描结束后的汇总结果"""
+    
+    @abstractmethod
+    def state(self):
+        """返回可写入断点的部分状态（JSON 可序列化）"""
+    
+    @abstractmethod
+    def load_state(self, state):
+        """从断点恢复 state() 保存的部分状态"""
+
+
+class NoncurrentAggregator:
+    """按对象键聚合非当前版本（数量、字节数、最近修改时间）
+    
+    键数在内存预算以内时只用字典；超过预算后把字典批量合并进临时 SQLite 文件再清空，
+    因此无论 bucket 有多少对象，统计都是精确的，内存占用保持在预算以内。
+    
+    传入 db 时直接使用断点文件中的表：溢出不单独提交，由 ScanCheckpoint 与扫描位置一起提交，
+    文件也由断点负责删除。
+    """
+    
+    def __init__(self, memory_keys=NONCURRENT_MEMORY_KEYS, spill_dir=None, db=None):
+        self.memory_keys = max(1, memory_keys)
+        self.spill_dir = spill_dir
+        self.entries = {}  # key -> [count, total_size, latest_modified]
+        self.db = db
+        self.db_path = None
+        self.persistent = db is not None
+        self.spills = 0
+        if self.persistent:
+            self._create_table()
+    
+    def add(self, key, count, size, latest_modified):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.entries[key] = [count, size, latest_modified]
+            if len(self.entries) >= self.memory_keys:
+                self.spill()
+            return
+        entry[0] += count
+        entry[1] += size
+        if latest_modified > entry[2]:
+            entry[2] = latest_modified
+    
+    def _open(self):
+        if self.db is None:
+            fd, self.db_path = tempfile.mkstemp(prefix='s3-noncurrent-', suffix='.sqlite', dir=self.spill_dir)
+            os.close(fd)
+            # 分片线程中创建，扫描结束后在主线程合并，同一时刻只有一个线程使用
+            self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=OFF')
+            self.db.execute('PRAGMA synchronous=OFF')
+            self._create_table()
+        return self.db
+    
+    def _create_table(self):
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS noncurrent ('
+            'key TEXT PRIMARY KEY, count INTEGER, total_size INTEGER, latest REAL)'
+        )
+    
+    def spill(self):
+        """把内存中的聚合结果合并进 SQLite 并清空字典"""
+        if not self.entries:
+            return
+        db = self._open()
+        db.executemany(
+            'INSERT INTO noncurrent VALUES (?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET '
+            'count = count + excluded.count, total_size = total_size + excluded.total_size, '
+            'latest = MAX(latest, excluded.latest)',
+            ((key, e[0], e[1], e[2].timestamp()) for key, e in self.entries.items())
+        )
+        if not self.persistent:
+            db.commit()
+        self.entries = {}
+        self.spills += 1
+    
+    def merge(self, other):
+        """合并另一个聚合器；对方的 SQLite 文件通过 ATTACH 在库内合并后删除"""
+        if other.db is not None:
+            other.spill()
+            other.db.commit()
+            other_path = other.db_path or other.db.execute('PRAGMA database_list').fetchone()[2]
+            if not other.persistent:
+                other.db.close()
+            other.db = None
+            if self.db is None and not self.entries and not other.persistent:
+                # 直接接管对方的溢出文件
+                self.db_path = other.db_path
+                self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+                self.spills += other.spills
+                other.db_path = None
+            else:
+                db = self._open()
+                db.execute('ATTACH DATABASE ? AS other', (other_path,))
+                db.execute(
+                    'INSERT INTO noncurrent SELECT key, count, total_size, latest FROM other.noncurrent WHERE true '
+                    'ON CONFLICT(key) DO UPDATE SET count = count + excluded.count, '
+                    'total_size = total_size + excluded.total_size, latest = MAX(latest, excluded.latest)'
+                )
+                db.commit()
+                db.execute('DETACH DATABASE other')
+                self.spills += other.spills
+                other.close()
+        for key, (count, size, latest_modified) in other.entries.items():
+            self.add(key, count, size, latest_modified)
+        other.entries = {}
+    
+    def summary(self, top_n):
+        """返回 (键总数, 非当前版本总字节数, 按字节数排序的前 top_n 个键)"""
+        if self.db is None:
+            items = self.entries.items()
+            top = heapq.nsmallest(top_n, items, key=lambda item: (-item[1][1], item[0]))
+            return (
+                len(self.entries),
+                sum(e[1] for e in self.entries.values()),
+                [{'key': key, 'count': e[0], 'total_size': e[1], 'latest_modified': e[2]} for key, e in top]
+            )
+        
+        self.spill()
+        keys, total_size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(total_size), 0) FROM noncurrent').fetchone()
+        top = [
+            {
+                'key': key,
+                'count': count,
+                'total_size': size,
+                'latest_modified': datetime.fromtimestamp(latest, timezone.utc)
+            }
+            for key, count, size, latest in self.db.execute(
+                'SELECT key, count, total_size, latest FROM noncurrent ORDER BY total_size DESC, key LIMIT ?', (top_n,)
+            )
+        ]
+        return keys, total_size, top
+    
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+        if not self.persistent and self.db_path and os.path.exists(self.db_path):
+            os.remove(self.db_path)
+        self.db_path = None
+
+
+class VersionAccumulator(ScanAccumulator):
+    """版本控制分析：时间范围内的删除标记、版本和非当前版本"""
+    
+    name = 'versioning'
+    
+    def __init__(self, analyzer, store=None):
+        super().__init__(analyzer, store)
+        self.start_time = analyzer.analysis_start_time
+        self.verbose = analyzer.verbose
+        self.print = analyzer._print
+        self.pages = 0
+        self.total_versions = 0
+        self.noncurrent_count = 0
+        self.delete_markers_count = 0
+        self.delete_markers = []
+        # 每个分片分摊内存预算，超出后溢出到磁盘
+        self.noncurrent = NoncurrentAggregator(
+            memory_keys=max(10000, NONCURRENT_MEMORY_KEYS // analyzer.workers),
+            db=store
+        )
+    
+    def add_page(self, page):
+        self.pages += 1
+        
+        # 处理删除标记：时间范围内的计数全部精确，详情只保留最新的 MAX_DELETE_MARKERS 条
+        for index, dm in enumerate(page.get('DeleteMarkers', []), 1):
+            is_latest = dm.get('IsLatest', False)
+            dm_time_raw = dm['LastModified']
+            dm_time = dm_time_raw.replace(tzinfo=None) if dm_time_raw.tzinfo else dm_time_raw
+            in_range = dm_time >= self.start_time
+            
+            if self.verbose and index <= 3 and self.pages <= 10:  # 前10页显示前3个用于调试
+                self.print(f"    🔍 [调试-DM{index}] IsLatest={is_latest}, Time={dm_time.strftime('%Y-%m-%d %H:%M:%S')}, InRange={in_range}")
+            
+            if is_latest and in_range:
+                self.delete_markers_count += 1
+                self._keep_delete_marker(dm['LastModified'], dm['Key'], dm['VersionId'])
+        
+        # 处理版本（只统计指定天数内的非当前版本）
+        for v in page.get('Versions', []):
+            if v['LastModified'].replace(tzinfo=None) >= self.start_time:
+                self.total_versions += 1
+                
+                if not v.get('IsLatest', False):
+                    self.noncurrent_count += 1
+                    self.noncurrent.add(v['Key'], 1, v['Size'], v['LastModified'])
+    
+    def _keep_delete_marker(self, last_modified, key, version_id):
+        # self.delete_markers 是按时间排序的最小堆，堆顶是已保留详情中最旧的一条
+        entry = (last_modified, key, version_id)
+        if len(self.delete_markers) < MAX_DELETE_MARKERS:
+            heapq.heappush(self.delete_markers, entry)
+        elif entry > self.delete_markers[0]:
+            heapq.heapreplace(self.delete_markers, entry)
+    
+    def add_table(self, table):
+        in_range = pc.greater_equal(
+            table['last_modified'],
+            pa.scalar(self.start_time.replace(tzinfo=timezone.utc), type=table['last_modified'].type)
+        )
+        is_dm = table['is_delete_marker']
+        
+        dm_mask = pc.and_(pc.and_(is_dm, table['is_latest']), in_range)
+        self.delete_markers_count += pc.sum(dm_mask).as_py() or 0
+        markers = table.filter(dm_mask)
+        if markers.num_rows:
+            # 先在本批中选出最新的 MAX_DELETE_MARKERS 条，再进入堆
+            newest = pc.select_k_unstable(
+                markers, k=min(MAX_DELETE_MARKERS, markers.num_rows),
+                sort_keys=[('last_modified', 'descending')]
+            )
+            for row in markers.take(newest).select(['last_modified', 'key', 'version_id']).to_pylist():
+                self._keep_delete_marker(row['last_modified'], row['key'], row['version_id'] or 'null')
+        
+        version_mask = pc.and_(pc.invert(is_dm), in_range)
+        self.total_versions += pc.sum(version_mask).as_py() or 0
+        noncurrent = table.filter(pc.and_(version_mask, pc.invert(table['is_latest'])))
+        self.noncurrent_count += noncurrent.num_rows
+        if noncurrent.num_rows:
+            # 先在本批内按键聚合，同一对象跨清单文件的版本由聚合器累加
+            grouped = noncurrent.group_by('key').aggregate([
+                ('size', 'count'), ('size', 'sum'), ('last_modified', 'max')
+            ])
+            for row in grouped.to_pylist():
+                self.noncurrent.add(row['key'], row['size_count'], row['size_sum'], row['last_modified_max'])
+    
+    def merge(self, other):
+        self.pages += other.pages
+        self.total_versions += other.total_versions
+        self.noncurrent_count += other.noncurrent_count
+        self.delete_markers_count += other.delete_markers_count
+        for entry in other.delete_markers:
+            self._keep_delete_marker(*entry)
+        self.noncurrent.merge(other.noncurrent)
+    
+    def state(self):
+        # 非当前版本聚合写入断点文件中的表，和扫描位置在同一事务中提交
+        self.noncurrent.spill()
+        return {
+            'pages': self.pages,
+            'total_versions': self.total_versions,
+            'noncurrent_count': self.noncurrent_count,
+            'delete_markers_count': self.delete_markers_count,
+            'noncurrent_spills': self.noncurrent.spills,
+            'delete_markers': [
+                [last_modified.isoformat(), key, version_id]
+                for last_modified, key, version_id in self.delete_markers
+            ]
+        }
+    
+    def load_state(self, state):
+        self.pages = state['pages']
+        self.total_versions = state['total_versions']
+        self.noncurrent_count = state['noncurrent_count']
+        self.delete_markers_count = state['delete_markers_count']
+        self.noncurrent.spills = state['noncurrent_spills']
+        self.delete_markers = [
+            (datetime.fromisoformat(last_modified), key, version_id)
+            for last_modified, key, version_id in state['delete_markers']
+        ]
+        heapq.heapify(self.delete_markers)
+    
+    def result(self):
+        # 堆中即为最新的 MAX_DELETE_MARKERS 条，按时间倒序输出
+        delete_markers = [{
+            'Key': key,
+            'VersionId': version_id,
+            'LastModified': last_modified,
+            'IsLatest': True
+        } for last_modified, key, version_id in sorted(self.delete_markers, reverse=True)]
+        noncurrent_keys, noncurrent_bytes, noncurrent_top = self.noncurrent.summary(MAX_NONCURRENT_KEYS)
+        spills = self.noncurrent.spills
+        self.noncurrent.close()
+        return {
+            'total_versions': self.total_versions,
+            'noncurrent_count': self.noncurrent_count,
+            'delete_markers_count': self.delete_markers_count,
+            'delete_markers': delete_markers,
+            'noncurrent_keys': noncurrent_keys,
+            'noncurrent_bytes': noncurrent_bytes,
+            'noncurrent_top': noncurrent_top,
+            'noncurrent_spills': spills
+        }
+
+
+class VerificationAccumulator(ScanAccumulator):
+    """删除标记统计验证：不限时间范围的当前对象、版本和删除标记总数"""
+    
+    name = 'verification'
+    
+    def __init__(self, analyzer, store=None):
+        super().__init__(analyzer, store)
+        self.current_objects_count = 0
+        self.total_versions_count = 0
+        self.delete_markers_count = 0
+    
+    def add_page(self, page):
+        versions = page.get('Versions', [])
+        self.current_objects_count += sum(1 for v in versions if v.get('IsLatest', False))
+        self.total_versions_count += len(versions)
+        self.delete_markers_count += len(page.get('DeleteMarkers', []))
+    
+    def add_table(self, table):
+        is_dm = table['is_delete_marker']
+        versions = pc.sum(pc.invert(is_dm)).as_py() or 0
+        self.current_objects_count += pc.sum(pc.and_(pc.invert(is_dm), table['is_latest'])).as_py() or 0
+        self.total_versions_count += versions
+        self.delete_markers_count += table.num_rows - versions
+    
+    def merge(self, other):
+        self.current_objects_count += other.current_objects_count
+        self.total_versions_count += other.total_versions_count
+        self.delete_markers_count += other.delete_markers_count
+    
+    def state(self):
+        return self.result()
+    
+    def load_state(self, state):
+        self.current_objects_count = state['current_objects_count']
+        self.total_versions_count = state['total_versions_count']
+        self.delete_markers_count = state['delete_markers_count']
+    
+    def result(self):
+        return {
+            'current_objects_count': self.current_objects_count,
+            'total_versions_count': self.total_versions_count,
+            'delete_markers_count': self.delete_markers_count
+        }
+
+
+class CurrentObjectsAccumulator(ScanAccumulator):
+    """当前对象统计：IsLatest 的版本即 list_objects_v2 会列出的对象"""
+    
+    name = 'current_objects'
+    
+    def __init__(self, analyzer, store=None):
+        super().__init__(analyzer, store)
+        self.total_objects = 0
+        self.total_size = 0
+        self.prefix_stats = {}
+    
+    def _add_prefix(self, prefix, count, size):
+        # 按前缀统计（限制数量）
+        if prefix not in self.prefix_stats:
+            if len(self.prefix_stats) >= MAX_PREFIXES:
+                return
+            self.prefix_stats[prefix] = {'count': 0, 'size': 0}
+        self.prefix_stats[prefix]['count'] += count
+        self.prefix_stats[prefix]['size'] += size
+    
+    def add_page(self, page):
+        for v in page.get('Versions', []):
+            if not v.get('IsLatest', False):
+                continue
+            self.total_objects += 1
+            self.total_size += v['Size']
+            prefix = v['Key'].split('/')[0] if '/' in v['Key'] else 'root'
+            self._add_prefix(prefix, 1, v['Size'])
+    
+    def add_table(self, table):
+        current = table.filter(pc.and_(pc.invert(table['is_delete_marker']), table['is_latest']))
+        if not current.num_rows:
+            return
+        self.total_objects += current.num_rows
+        self.total_size += pc.sum(current['size']).as_py() or 0
+        
+        keys = current['key']
+        first_segment = pc.list_element(pc.split_pattern(keys, '/', max_splits=1), 0)
+        prefixes = pc.if_else(pc.match_substring(keys, '/'), first_segment, 'root')
+        grouped = pa.table({'prefix': prefixes, 'size': current['size']}).group_by('prefix').aggregate([
+            ('size', 'count'), ('size', 'sum')
+        ])
+        for row in grouped.to_pylist():
+            self._add_prefix(row['prefix'], row['size_count'], row['size_sum'])
+    
+    def merge(self, other):
+        self.total_objects += other.total_objects
+        self.total_size += other.total_size
+        for prefix, data in other.prefix_stats.items():
+            self._add_prefix(prefix, data['count'], data['size'])
+    
+    def state(self):
+        return {
+            'total_objects': self.total_objects,
+            'total_size': self.total_size,
+            'prefix_stats': self.prefix_stats
+        }
+    
+    def load_state(self, state):
+        self.total_objects = state['total_objects']
+        self.total_size = state['total_size']
+        self.prefix_stats = state['prefix_stats']
+    
+    def result(self):
+        return {
+            'total_objects': self.total_objects,
+            'total_size_gb': self.total_size / (1024**3),
+            'prefix_stats': self.prefix_stats
+        }
+
+
+# 统一扫描可用的累加器，按名称注册；新的分析步骤只需注册一个累加器即可复用同一次扫描
+SCAN_ACCUMULATORS = {
+    acc.name: acc for acc in (VersionAccumulator, VerificationAccumulator, CurrentObjectsAccumulator)
+}
+SCAN_STEP_LABELS = {
+    'versioning': '版本控制',
+    'verification': '统计验证',
+    'current_objects': '当前对象'
+}
+
+
+def create_region_clients(region, max_pool_connections=10, ce_client=None):
+    """创建一个区域的 boto3 客户端；批量模式下同一区域的所有 bucket 共用这一组客户端
+
+    Cost Explorer 只在 us-east-1，批量模式下所有区域共用传入的 ce_client。
+    """
+    return {
+        's3': boto3.client('s3', region_name=region, config=Config(max_pool_connections=max_pool_connections)),
+        'cloudwatch': boto3.client('cloudwatch', region_name=region),
+        'cloudtrail': boto3.client('cloudtrail', region_name=region),
+        'ce': ce_client or boto3.client('ce', region_name='us-east-1')
+    }
+
+
+def current_memory_mb():
+    """当前进程的常驻内存 (MB)；没有 /proc 时退回峰值内存，都不可用时返回 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024**2)
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024**2) if sys.platform == 'darwin' else peak / 1024
+
+
+class ProgressReporter:
+    """限频的扫描进度：各线程随时更新计数，最多每 interval 秒输出一行，可同时写入 NDJSON 进度流
+    
+    total_objects 来自 CloudWatch NumberOfObjects（包含所有版本和删除标记），用于估算剩余时间；
+    CloudWatch 步骤与扫描并发执行，因此也可以传入在输出时才求值的函数。读取清单时改用
+    total_pages（清单文件数）估算。
+    """
+    
+    def __init__(self, bucket, phase, interval=DEFAULT_PROGRESS_INTERVAL, stream=None,
+                 total_objects=None, total_pages=None, unit='页', output=None):
+        self.bucket = bucket
+        self.output = output  # 进度行的输出流，None 表示终端
+        self.phase = phase
+        self.unit = unit
+        self.interval = interval
+        self.stream = stream  # NDJSON 输出路径，'-' 表示 stderr
+        self.total_objects = total_objects
+        self.total_pages = total_pages
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.objects = 0
+        self.delete_markers = 0
+        self.resumed_pages = 0  # 从断点恢复的部分不计入速率
+        self.resumed_objects = 0
+        self.started = time.monotonic()
+        self.last_emit = self.started
+    
+    def update(self, pages=1, objects=0, delete_markers=0, resumed=False):
+        with self.lock:
+            self.pages += pages
+            self.objects += objects
+            self.delete_markers += delete_markers
+            if resumed:
+                self.resumed_pages += pages
+                self.resumed_objects += objects
+            now = time.monotonic()
+            if now - self.last_emit >= self.interval:
+                self.last_emit = now
+                self._emit(now, done=False)
+    
+    def finish(self):
+        with self.lock:
+            self._emit(time.monotonic(), done=True)
+    
+    def _eta(self, pages_per_sec, objects_per_sec):
+        if self.total_pages and pages_per_sec > 0:
+            return max(0, self.total_pages - self.pages) / pages_per_sec
+        total_objects = self.total_objects() if callable(self.total_objects) else self.total_objects
+        if total_objects and objects_per_sec > 0:
+            return max(0, total_objects - self.objects) / objects_per_sec
+        return None
+    
+    def _emit(self, now, done):
+        elapsed = max(now - self.started, 1e-6)
+        pages_per_sec = (self.pages - self.resumed_pages) / elapsed
+        objects_per_sec = (self.objects - self.resumed_objects) / elapsed
+        eta = 0 if done else self._eta(pages_per_sec, objects_per_sec)
+        memory_mb = current_memory_mb()
+        
+        if not done:
+            eta_label = str(timedelta(seconds=int(eta))) if eta is not None else '未知'
+            memory_label = f"{memory_mb:,.0f} MB" if memory_mb is not None else 'N/A'
+            print(f"  📊 [进度] 已处理 {self.pages:,} {self.unit} ({pages_per_sec:,.1f} {self.unit}/秒), "
+                  f"对象 {self.objects:,} ({objects_per_sec:,.0f} 个/秒), 删除标记 {self.delete_markers:,}, "
+                  f"预计剩余 {eta_label}, 内存 {memory_label}", file=self.output or sys.stdout)
+        
+        if self.stream:
+            record = json.dumps({
+                'time': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'bucket': self.bucket,
+                'phase': self.phase,
+                'pages': self.pages,
+                'objects': self.objects,
+                'delete_markers': self.delete_markers,
+                'pages_per_sec': round(pages_per_sec, 2),
+                'objects_per_sec': round(objects_per_sec, 2),
+                'elapsed_seconds': round(elapsed, 1),
+                'eta_seconds': round(eta) if eta is not None else None,
+                'memory_mb': round(memory_mb, 1) if memory_mb is not None else None,
+                'done': done
+            }, ensure_ascii=False)
+            if self.stream == '-':
+                print(record, file=sys.stderr, flush=True)
+            else:
+                with open(self.stream, 'a', encoding='utf-8') as f:
+                    f.write(record + '\n')
+
+
+class ScanCheckpoint:
+    """版本扫描断点：logs/checkpoints/<bucket>/ 下的扫描计划 manifest.json 和每个分片一个 SQLite 文件
+    
+    分片文件中的 checkpoint 表保存 KeyMarker/VersionIdMarker 与累加器状态，noncurrent 表保存
+    非当前版本聚合；两者在同一事务中提交，中断后恢复的位置与统计始终一致。
+    """
+    
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+    
+    def load_plan(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def save_plan(self, plan):
+        """清除旧断点并保存新的扫描计划"""
+        self.remove()
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(plan, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+    
+    def open_shard(self, index):
+        # 分片线程中写入，扫描结束后在主线程合并
+        db = sqlite3.connect(os.path.join(self.directory, f'shard-{index:05d}.sqlite'), check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('CREATE TABLE IF NOT EXISTS checkpoint (id INTEGER PRIMARY KEY, state TEXT)')
+        db.commit()
+        return db
+    
+    def load_shard(self, db):
+        row = db.execute('SELECT state FROM checkpoint WHERE id = 1').fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def save_shard(self, db, state):
+        db.execute('INSERT OR REPLACE INTO checkpoint VALUES (1, ?)', (json.dumps(state, ensure_ascii=False),))
+        db.commit()
+    
+    def remove(self):
+        if not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, filename))
+        os.rmdir(self.directory)
+
+class KeyspaceSampler:
+    """--skip-listing 时估算删除标记和非当前版本的数量：在键空间的随机位置用 KeyMarker 取样
+    
+    先用 Delimiter 发现的前缀把键空间分层，每层从头列出至多 SAMPLE_CENSUS_PAGES 页：能列完的层直接
+    精确计数；其余的层用已见键逐位的字符分布（未见的同类字符分得少量概率）把键映射到 [0, 1) 上与
+    字典序一致的位置，在已列出部分之后的区间内按位置均匀生成随机 KeyMarker，取其后连续的一页作为
+    一个样本。样本覆盖的位置宽度越小说明该处键越密，条目数除以宽度即为该层总量的估计，各层大小由此得出。
+    各层分别估计后相加（分层估计），置信区间用分层方差；能取得 CloudWatch NumberOfObjects 时
+    按比率估计校准到该总数。样本先每层取少量估计方差，再按目标误差 margin 补足，按各层大小分配。
+    """
+    
+    MEASURES = ('delete_markers', 'recent_delete_markers', 'noncurrent', 'current')
+    
+    def __init__(self, analyzer, margin=DEFAULT_SAMPLE_MARGIN, rng=None):
+        self.analyzer = analyzer
+        self.margin = margin
+        self.rng = rng or random.Random()
+        self.start_time = analyzer.analysis_start_time
+        self.requests = 0
+    
+    def _list(self, prefix, delimiter, key_marker=None, version_id_marker=None):
+        params = {'Bucket': self.analyzer.bucket_name, 'Prefix': prefix, 'MaxKeys': SAMPLE_PROBE_KEYS}
+        if delimiter:
+            params['Delimiter'] = delimiter
+        if key_marker:
+            params['KeyMarker'] = key_marker
+            if version_id_marker:
+                params['VersionIdMarker'] = version_id_marker
+        self.requests += 1
+        return self.analyzer.s3_client.list_object_versions(**params)
+    
+    def _measure(self, page, end=None):
+        """统计一页中键小于 end 的条目（end 为 NextKeyMarker，该键的版本可能跨页，留给后续区间）"""
+        versions = [v for v in page.get('Versions', []) if end is None or v['Key'] < end]
+        markers = [dm for dm in page.get('DeleteMarkers', []) if end is None or dm['Key'] < end]
+        return {
+            'entries': len(versions) + len(markers),
+            'delete_markers': len(markers),
+            # 与版本控制分析口径一致：时间范围内、仍是最新版本的删除标记
+            'recent_delete_markers': sum(1 for dm in markers if dm.get('IsLatest', False)
+                                         and dm['LastModified'].replace(tzinfo=None) >= self.start_time),
+            'noncurrent': sum(1 for v in versions if not v.get('IsLatest', False)),
+            'current': sum(1 for v in versions if v.get('IsLatest', False))
+        }
+    
+    @staticmethod
+    def _char_class(ch):
+        for chars in (string.digits, string.ascii_lowercase, string.ascii_uppercase):
+            if ch in chars:
+                return chars
+        return ch
+    
+    def _learn(self, model, page):
+        """把一页中的键加入该层的键模型：逐位已见字符及其字符类别"""
+        for entry in page.get('Versions', []) + page.get('DeleteMarkers', []):
+            suffix = entry['Key'][len(model['prefix']):]
+            for j, ch in enumerate(suffix):
+                if j == len(model['seen']):
+                    model['seen'].append(set())
+                    model['classes'].append(set())
+                model['seen'][j].add(ch)
+                model['classes'][j].update(self._char_class(ch))
+        model['compiled'] = None
+    
+    @staticmethod
+    def _variable_positions(model):
+        """已见取值多于一个的位置，以及与其相连、字符类别相同的位置（同一个计数器 / ID 的高位）"""
+        classes = model['classes']
+        variable = set()
+        for j, seen in enumerate(model['seen']):
+            if len(seen) > 1 and j not in variable:
+                low = high = j
+                while low > 0 and classes[low - 1] == classes[j]:
+                    low -= 1
+                while high + 1 < len(classes) and classes[high + 1] == classes[j]:
+                    high += 1
+                variable.update(range(low, high + 1))
+        return variable
+    
+    def _compile(self, model):
+        """每一位的 (字符, 累计概率, 概率)：已见字符平分 1 - SAMPLE_EXPLORE，同类未见字符平分其余"""
+        if model['compiled'] is None:
+            compiled = []
+            variable = self._variable_positions(model)
+            for j, (seen, classes) in enumerate(zip(model['seen'], model['classes'])):
+                chars = sorted(classes)
+                unseen = len(chars) - len(seen)
+                explore = (SAMPLE_EXPLORE if j in variable else SAMPLE_EXPLORE_FIXED) if unseen else 0.0
+                probs = [(1 - explore) / len(seen) if ch in seen else explore / unseen for ch in chars]
+                lows = [0.0]
+                for p in probs[:-1]:
+                    lows.append(lows[-1] + p)
+                compiled.append((chars, lows, probs))
+            model['compiled'] = compiled
+        return model['compiled']
+    
+    def _position(self, model, key):
+        """键在该层键空间中的位置 [0, 1]，与字典序一致"""
+        position, scale = 0.0, 1.0
+        for (chars, lows, probs), ch in zip(self._compile(model), key[len(model['prefix']):]):
+            i = bisect.bisect_left(chars, ch)
+            if i < len(chars) and chars[i] == ch:
+                position += scale * lows[i]
+                scale *= probs[i]
+            else:
+                # 模型之外的字符落在相邻两个字符之间，更低的位不再区分
+                position += scale * (lows[i] if i < len(chars) else 1.0)
+                break
+        return position
+    
+    def _random_marker(self, model, low, high):
+        """在 [low, high) 内按位置均匀取一点，逐位解码为 KeyMarker，返回 (KeyMarker, 其位置)"""
+        u = low + (high - low) * self.rng.random()
+        chars, scale = [], 1.0
+        for alphabet, lows, probs in self._compile(model):
+            i = max(bisect.bisect_right(lows, u) - 1, 0)
+            chars.append(alphabet[i])
+            u = min(max((u - lows[i]) / probs[i], 0.0), 1.0)
+            scale *= probs[i]
+            if scale < 1e-12:
+                break
+        marker = model['prefix'] + ''.join(chars)
+        position = self._position(model, marker)
+        if position < low:
+            # 解码截断导致落到第一页之内时从第一页末尾开始
+            return model['first_end'], low
+        return marker, position
+    
+    def _probe(self, model):
+        """取一个样本：返回按位置宽度放大到第一页之后、已知末尾之前整个区间的各项数量
+
+        样本覆盖从 KeyMarker 到页中最后一个键（没列完时为 NextKeyMarker）之间的位置，只统计其中
+        键小于该边界的条目，条目数 / 宽度即该处的键密度。列完时也就知道了该层最后一个键，
+        之后的样本只在它之前取。
+        """
+        low = self._position(model, model['first_end'])
+        high = self._position(model, model['end']) if model['end'] else 1.0
+        marker, start = self._random_marker(model, low, high)
+        page = self._list(model['prefix'], model['delimiter'], marker)
+        keys = [entry['Key'] for entry in page.get('Versions', []) + page.get('DeleteMarkers', [])]
+        if page.get('IsTruncated'):
+            end = page['NextKeyMarker']
+        else:
+            end = max(keys) if keys else None
+            last = end + '\x00' if end else marker
+            model['end'] = min(model['end'], last) if model['end'] else last
+        counts = self._measure(page, end)
+        for name, value in self._measure(page).items():
+            model['listed'][name] += value
+        width = self._position(model, end) - start if end else None
+        self._learn(model, page)
+        if end is None:
+            return dict.fromkeys(counts, 0.0)  # KeyMarker 之后没有键
+        if width <= 0:
+            return None
+        return {name: value * (high - low) / width for name, value in counts.items()}
+    
+    def _stratum(self, model):
+        """层的估计：第一页的精确计数 + 样本均值，以及各样本（用于方差）"""
+        clusters = model['clusters']
+        return {name: model['first'][name] + (sum(c[name] for c in clusters) / len(clusters) if clusters else 0)
+                for name in ('entries',) + self.MEASURES}
+    
+    @staticmethod
+    def _stratum_variance(model, measure):
+        """层总量估计的方差 s² / k"""
+        values = [c[measure] for c in model['clusters']]
+        k = len(values)
+        mean = sum(values) / k
+        return sum((v - mean) ** 2 for v in values) / (k - 1) / k
+    
+    def _ratio_variance(self, sampled, totals, measure):
+        """比例 (measure / entries) 的分层方差（线性化）；样本不足时返回 None"""
+        rate = totals[measure] / totals['entries']
+        variance = 0.0
+        for model in sampled:
+            clusters = model['clusters']
+            k = len(clusters)
+            if k < 2:
+                return None
+            residuals = [c[measure] - rate * c['entries'] for c in clusters]
+            mean = sum(residuals) / k
+            variance += sum((r - mean) ** 2 for r in residuals) / (k - 1) / k
+        return variance / totals['entries'] ** 2
+    
+    def _totals(self, census, sampled):
+        totals = dict(census)
+        for model in sampled:
+            for name, value in self._stratum(model).items():
+                totals[name] += value
+        return totals
+    
+    def _required_probes(self, census, sampled):
+        """达到目标误差所需的样本数：方差与样本数成反比，n = n₀ · (z·se / margin)²"""
+        probes = sum(len(model['clusters']) for model in sampled)
+        totals = self._totals(census, sampled)
+        required = probes
+        for measure in ('delete_markers', 'noncurrent'):
+            variance = self._ratio_variance(sampled, totals, measure) if totals['entries'] else None
+            if variance:
+                required = max(required, math.ceil(probes * SAMPLE_CONFIDENCE_Z ** 2 * variance / self.margin ** 2))
+        return min(required, MAX_SAMPLE_PROBES)
+    
+    def _sample(self, model):
+        # 位置宽度为 0（键超出模型能区分的精度）的样本无法换算，重新取样
+        for _ in range(3):
+            cluster = self._probe(model)
+            if cluster is not None:
+                model['clusters'].append(cluster)
+                return
+    
+    def run(self, total_objects=None):
+        strata = self.analyzer._discover_version_shards()
+        census = dict.fromkeys(('entries',) + self.MEASURES, 0)
+        sampled = []  # SAMPLE_CENSUS_PAGES 页列不完、需要随机取样的层
+        for prefix, delimiter in strata:
+            first = dict.fromkeys(('entries',) + self.MEASURES, 0)
+            pages = []
+            markers = {}
+            while not pages or (pages[-1].get('IsTruncated') and len(pages) < SAMPLE_CENSUS_PAGES):
+                pages.append(self._list(prefix, delimiter, **markers))
+                for name, value in self._measure(pages[-1]).items():
+                    first[name] += value
+                markers = {'key_marker': pages[-1].get('NextKeyMarker'),
+                           'version_id_marker': pages[-1].get('NextVersionIdMarker')}
+            if pages[-1].get('IsTruncated'):
+                model = {'prefix': prefix, 'delimiter': delimiter, 'seen': [], 'classes': [], 'compiled': None,
+                         'first_end': pages[-1]['NextKeyMarker'], 'first': first, 'end': None,
+                         'clusters': [], 'listed': dict.fromkeys(('entries',) + self.MEASURES, 0)}
+                for page in pages:
+                    self._learn(model, page)
+                sampled.append(model)
+            else:
+                for name, value in first.items():
+                    census[name] += value
+        
+        stopped = self.analyzer.stop_event.is_set
+        if sampled:
+            # 每层先取少量样本估计大小和方差
+            pilot = max(2, math.ceil(SAMPLE_PILOT_PROBES / len(sampled)))
+            for _ in range(pilot):
+                for model in sampled:
+                    if not stopped():
+                        self._sample(model)
+            # 再按目标误差补足，样本按各层估计大小分配
+            target = self._required_probes(census, sampled)
+            probes = sum(len(model['clusters']) for model in sampled)
+            sizes = [self._stratum(model)['entries'] for model in sampled]
+            while probes < target and not stopped():
+                model = max(zip(sampled, sizes), key=lambda ms: ms[1] / len(ms[0]['clusters']))[0]
+                self._sample(model)
+                probes += 1
+        
+        return self._estimate(census, sampled, total_objects, len(strata))
+    
+    @staticmethod
+    def _critical_value(sampled):
+        """95% 置信区间的临界值：样本少时用 t 分布（Cornish-Fisher 展开近似），自由度取各层最少样本数 - 1"""
+        z = SAMPLE_CONFIDENCE_Z
+        df = min((len(model['clusters']) for model in sampled), default=0) - 1
+        if df < 1:
+            return z
+        return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+    
+    def _estimate(self, census, sampled, total_objects, strata):
+        totals = self._totals(census, sampled)
+        calibrated = bool(sampled) and bool(total_objects) and totals['entries'] > 0
+        critical = self._critical_value(sampled)
+        
+        estimates = {}
+        for measure in self.MEASURES:
+            estimate = {'rate': None, 'rate_ci': None, 'count': None, 'count_ci': None}
+            if totals['entries'] > 0:
+                rate = totals[measure] / totals['entries']
+                variance = self._ratio_variance(sampled, totals, measure) if sampled else 0.0
+                estimate['rate'] = rate
+                if variance is not None:
+                    half_width = critical * math.sqrt(variance)
+                    estimate['rate_ci'] = [max(0.0, rate - half_width), min(1.0, rate + half_width)]
+                if calibrated:
+                    # 按 CloudWatch 总数校准：数量 = 比例 × 总数
+                    estimate['count'] = round(rate * total_objects)
+                    if estimate['rate_ci']:
+                        estimate['count_ci'] = [round(r * total_objects) for r in estimate['rate_ci']]
+                else:
+                    estimate['count'] = round(totals[measure])
+                    if variance is not None:
+                        count_variance = sum(self._stratum_variance(model, measure) for model in sampled)
+                        half_width = critical * math.sqrt(count_variance)
+                        estimate['count_ci'] = [max(0, round(totals[measure] - half_width)),
+                                                round(totals[measure] + half_width)]
+            estimates[measure] = estimate
+        
+        clusters = [c for model in sampled for c in model['clusters']]
+        return {
+            'strata': strata,
+            'census_strata': strata - len(sampled),
+            'sampled_strata': len(sampled),
+            'probes': len(clusters),
+            'requests': self.requests,
+            'sampled_entries': sum(listed['entries'] for listed in (census, *(m['first'] for m in sampled),
+                                                                     *(m['listed'] for m in sampled))),
+            'census_entries': census['entries'],
+            'estimated_entries': round(totals['entries']),
+            'total_objects': total_objects,
+            'calibrated': calibrated,
+            # 实际列出的条目中的数量（无法估计时作为下限）
+            'sampled_counts': {measure: census[measure] + sum(m['first'][measure] + m['listed'][measure] for m in sampled)
+                               for measure in self.MEASURES},
+            'strata_estimates': [{
+                'prefix': model['prefix'],
+                'probes': len(model['clusters']),
+                'estimated_entries': round(self._stratum(model)['entries'])
+            } for model in sampled],
+            'margin': self.margin,
+            'confidence': 0.95,
+            'estimates': estimates
+        }
+
+
+# analyze() 的分析步骤：(名称, 说明, 方法, 依赖的步骤)。依赖都完成的步骤立即并发执行，
+# 其余都是互不相关的 API 调用，可以与耗时最长的版本扫描重叠
+ANALYSIS_STEPS = [
+    ('cloudwatch', '分析 CloudWatch 历史指标', '_analyze_cloudwatch_metrics', ()),
+    ('versioning', '检查版本控制和删除标记', '_check_versioning', ()),
+    ('verification', '验证删除标记统计准确性', '_verify_deletion_marker_count', ('versioning', 'cloudwatch')),
+    ('permanent_deletion', '分析永久删除迹象', '_analyze_permanent_deletion', ('cloudwatch', 'versioning')),
+    ('lifecycle', '检查生命周期策略', '_check_lifecycle_policy', ()),
+    ('cloudtrail', '检查 CloudTrail 管理事件', '_check_cloudtrail_events', ()),
+    ('bucket_policy', '检查 Bucket 策略', '_check_bucket_policy', ()),
+    ('costs', '分析 S3 成本变化', '_analyze_costs', ()),
+    ('current_objects', '统计当前对象', '_analyze_current_objects', ('versioning',))
+]
+
 
 class S3DeletionAnalyzer:
-    def __init__(self, bucket_name, region='us-east-1', skip_object_listing=False, days=90):
+    def __init__(self, bucket_name, region='us-east-1', skip_object_listing=False, days=90,
+                 workers=DEFAULT_SCAN_WORKERS, inventory=None, resume=False, verbose=False,
+                 progress_interval=DEFAULT_PROGRESS_INTERVAL, progress_file=None, clients=None,
+                 sample_margin=DEFAULT_SAMPLE_MARGIN, output=None):
         self.bucket_name = bucket_name
         self.region = region
         self.skip_object_listing = skip_object_listing
         self.days = days
-        self.s3_client = boto3.client('s3', region_name=region)
-        self.cloudwatch = boto3.client('cloudwatch', region_name=region)
-        self.cloudtrail = boto3.client('cloudtrail', region_name=region)
-        self.ce_client = boto3.client('ce', region_name='us-east-1')  # Cost Explorer 只在 us-east-1
+        self.workers = max(1, workers)
+        self.inventory = inventory  # S3 Inventory manifest.json 位置，设置后代替实时列出
+        self.resume = resume  # 从 logs/checkpoints 中上次中断的版本扫描继续
+        self.verbose = verbose  # 输出每页、每个删除标记的调试信息
+        self.progress_interval = progress_interval
+        self.progress_file = progress_file  # NDJSON 进度流，供外部工具读取
+        self.sample_margin = sample_margin  # --skip-listing 采样验证的目标误差
+        self.output = output  # 分析输出的写入对象，None 表示终端；批量模式下写入日志文件
+        # 连接池需容纳所有并发扫描线程；批量模式传入同一区域共用的客户端
+        if clients is None:
+            clients = create_region_clients(region, max_pool_connections=max(10, self.workers * 2))
+        self.s3_client = clients['s3']
+        self.cloudwatch = clients['cloudwatch']
+        self.cloudtrail = clients['cloudtrail']
+        self.ce_client = clients['ce']
         self.findings = []
+        self.step_timings = []
+        self.steps_total_seconds = 0
+        self._step_local = threading.local()  # 并发步骤各自记录发现，结束后按步骤顺序合并
+        # 版本数据的分析起点（所有累加器共用同一时间点）
+        self.analysis_start_time = (datetime.now(timezone.utc) - timedelta(days=days)).replace(tzinfo=None)
+        # 统一扫描：scan_plan 中的步骤共用一次 list_object_versions 扫描，结果缓存在 scan_results
+        self.scan_plan = []
+        self.scan_results = {}
+        self.scan_lock = threading.Lock()
+        # Ctrl+C 只在主线程抛出 KeyboardInterrupt，由主线程设置后各扫描线程保存断点并退出
+        self.stop_event = threading.Event()
         
         # 创建 logs 目录(在脚本所在目录)
         script_dir = os.path.dirname(os.path.abspath(__file__))
         self.logs_dir = os.path.join(script_dir, 'logs')
         os.makedirs(self.logs_dir, exist_ok=True)
+        self.checkpoint = ScanCheckpoint(os.path.join(self.logs_dir, 'checkpoints', self.bucket_name))
         
+    def _print(self, *args, **kwargs):
+        """输出到本分析器的输出流"""
+        kwargs.setdefault('file', self.output or sys.stdout)
+        print(*args, **kwargs)
+    
     def analyze(self):
         """执行完整分析"""
-        print(f"\n{'='*80}")
-        print(f"S3 数据丢失分析报告")
-        print(f"Bucket: {self.bucket_name}")
-        print(f"分析时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"分析周期: 过去 {self.days} 天")
-        print(f"{'='*80}\n")
-        
-        # 1. CloudWatch 指标分析
-        print("[1/7] 分析 CloudWatch 历史指标...")
-        self._analyze_cloudwatch_metrics()
-        
-        # 2. 版本控制检查
-        print("[2/8] 检查版本控制和删除标记...")
-        self._check_versioning()
+        self._print(f"\n{'='*80}")
+        self._print(f"S3 数据丢失分析报告")
+        self._print(f"Bucket: {self.bucket_name}")
+        self._print(f"分析时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        self._print(f"分析周期: 过去 {self.days} 天")
+        self._print(f"{'='*80}\n")
         
-        # 3. 删除标记统计验证
-        print("[3/8] 验证删除标记统计准确性...")
-        self._verify_deletion_marker_count()
-        
-        # 4. 永久删除分析
-        print("[4/8] 分析永久删除迹象...")
-        self._analyze_permanent_deletion()
+        # 版本控制、统计验证和当前对象统计共用一次版本列表扫描
+        # （--skip-listing 时统计验证改为采样，不需要完整扫描；使用清单时读取代价低，始终完整统计）
+        steps = ANALYSIS_STEPS
+        if self.skip_object_listing and not self.inventory:
+            self.scan_plan = ['versioning']
+            self._print("跳过对象统计(使用 --skip-listing 参数)...")
+            self.current_stats = {'skipped': True}
+            steps = [step for step in steps if step[0] != 'current_objects']
+        else:
+            self.scan_plan = ['versioning', 'verification', 'current_objects']
         
-        # 5. 生命周期策略检查
-        print("[5/9] 检查生命周期策略...")
-        self._check_lifecycle_policy()
+        # 各步骤按依赖关系并发执行
+        self._run_steps(steps)
         
-        # 6. CloudTrail 事件检查
-        print("[6/9] 检查 CloudTrail 管理事件...")
-        self._check_cloudtrail_events()
+        # 生成报告
+        self._print("\n生成分析报告...\n")
+        self._generate_report()
         
-        # 7. Bucket 策略检查
-        print("[7/9] 检查 Bucket 策略...")
-        self._check_bucket_policy()
+    def _run_steps(self, steps):
+        """按依赖关系并发执行分析步骤，记录每个步骤的开始时间和耗时"""
+        names = {name for name, _, _, _ in steps}
+        numbers = {name: index for index, (name, _, _, _) in enumerate(steps, 1)}
+        labels = {name: label for name, label, _, _ in steps}
+        pending = list(steps)
+        finished = set()
+        timings = {}
+        step_findings = {}
+        error = None
+        started = time.monotonic()
         
-        # 8. 成本分析
-        print("[8/9] 分析 S3 成本变化...")
-        self._analyze_costs()
+        def run(name, method):
+            self._step_local.findings = step_findings[name] = []
+            begin = time.monotonic()
+            try:
+                getattr(self, method)()
+            finally:
+                timings[name] = {'start': begin - started, 'duration': time.monotonic() - begin}
+                self._step_local.findings = None
         
-        # 9. 当前对象统计
-        if not self.skip_object_listing:
-            print("[9/9] 统计当前对象...")
-            self._analyze_current_objects()
-        else:
-            print("[9/9] 跳过对象统计(使用 --skip-listing 参数)...")
-            self.current_stats = {'skipped': True}
+        with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+            running = {}
+            try:
+                while pending or running:
+                    # 有步骤失败后不再启动新步骤，等待正在运行的步骤结束
+                    for step in ([] if error else list(pending)):
+                        name, label, method, depends = step
+                        if all(dep in finished or dep not in names for dep in depends):
+                            self._print(f"[{numbers[name]}/{len(steps)}] {label}...")
+                            running[executor.submit(run, name, method)] = name
+                            pending.remove(step)
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        try:
+                            future.result()
+                            timings[name]['status'] = '完成'
+                        except Exception as e:
+                            timings[name]['status'] = '失败'
+                            error = error or e
+                        finished.add(name)
+                        self._print(f"  ⏱️  [{numbers[name]}/{len(steps)}] {labels[name]}{timings[name]['status']}，"
+                                    f"耗时 {timings[name]['duration']:.1f} 秒")
+            except KeyboardInterrupt:
+                # 步骤都在工作线程中运行：通知扫描在当前页结束后保存断点，等它们退出后再中断
+                self._interrupt()
+                for future in running:
+                    future.cancel()
+                wait(running)
+                raise
         
-        # 生成报告
-        print("\n生成分析报告...\n")
-        self._generate_report()
+        # 发现按步骤顺序合并，报告顺序不受并发影响
+        for name, _, _, _ in steps:
+            self.findings.extend(step_findings.get(name, []))
+        total = time.monotonic() - started
+        self.step_timings = [{
+            'step': name,
+            'label': labels[name],
+            'depends_on': list(depends),
+            'status': timings[name]['status'] if name in timings else '未执行',
+            'start_seconds': round(timings[name]['start'], 2) if name in timings else None,
+            'duration_seconds': round(timings[name]['duration'], 2) if name in timings else None
+        } for name, _, _, depends in steps]
+        longest = max((t for t in self.step_timings if t['duration_seconds'] is not None),
+                      key=lambda t: t['duration_seconds'], default=None)
+        if longest:
+            self._print(f"\n  ⏱️  全部步骤耗时 {total:.1f} 秒，最长步骤: {longest['label']} ({longest['duration_seconds']:.1f} 秒)")
+        self.steps_total_seconds = round(total, 2)
         
+        if error is not None:
+            raise error
+    
+    def _interrupt(self):
+        """响应 Ctrl+C：通知所有扫描线程停止"""
+        if not self.stop_event.is_set():
+            self.stop_event.set()
+            self._print(f"\n  ⚠️  [扫描中断] 正在保存断点，稍后可使用 --resume 从中断处继续...")
+    
+    def _add_finding(self, finding):
+        """记录一项发现；在 _run_steps 的步骤中先记在该步骤自己的列表里"""
+        findings = getattr(self._step_local, 'findings', None)
+        (findings if findings is not None else self.findings).append(finding)
+    
     def _analyze_cloudwatch_metrics(self):
         """分析 CloudWatch 指标"""
         end_time = datetime.now(timezone.utc)
@@ -137,7 +1230,7 @@ class S3DeletionAnalyzer:
                         })
                 
                 if size_changes:
-                    self.findings.append({
+                    self._add_finding({
                         'severity': 'HIGH',
                         'category': 'CloudWatch 指标异常',
                         'title': f'检测到 {len(size_changes)} 次显著的存储量下降',
@@ -161,7 +1254,7 @@ class S3DeletionAnalyzer:
                         })
                 
                 if count_changes:
-                    self.findings.append({
+                    self._add_finding({
                         'severity': 'HIGH',
                         'category': 'CloudWatch 指标异常',
                         'title': f'检测到 {len(count_changes)} 次显著的对象数量减少',
@@ -173,7 +1266,7 @@ class S3DeletionAnalyzer:
             self.count_data = count_data
             
         except Exception as e:
-            self.findings.append({
+            self._add_finding({
                 'severity': 'INFO',
                 'category': 'CloudWatch 指标',
                 'title': '无法获取 CloudWatch 指标',
@@ -200,146 +1293,61 @@ class S3DeletionAnalyzer:
             status = versioning.get('Status', 'Disabled')
             
             if status == 'Enabled':
-                print("  ✓ 版本控制已启用，开始分析版本数据...")
-                print("  ℹ️  [内存优化] 使用流式处理，限制内存使用")
+                self._print("  ✓ 版本控制已启用，开始分析版本数据...")
+                self._print("  ℹ️  [内存优化] 使用流式处理，限制内存使用")
                 # 流式处理版本数据，避免内存溢出
-                try:
-                    # 计算指定天数前的时间
-                    analysis_start_time = (datetime.now(timezone.utc) - timedelta(days=self.days)).replace(tzinfo=None)
+                analysis_start_time = self.analysis_start_time
+                self._print(f"  ℹ️  [时间范围] 分析最近{self.days}天的版本数据 ({analysis_start_time.strftime('%Y-%m-%d')} 至今)")
+                if self.verbose:
                     current_time = datetime.now(timezone.utc)
-                    print(f"  ℹ️  [时间范围] 分析最近{self.days}天的版本数据 ({analysis_start_time.strftime('%Y-%m-%d')} 至今)")
-                    print(f"  🔍 [调试-时间] 当前UTC时间: {current_time.strftime('%Y-%m-%d %H:%M:%S')}")
-                    print(f"  🔍 [调试-时间] {self.days}天前时间: {analysis_start_time.strftime('%Y-%m-%d %H:%M:%S')}")
-                    
-                    delete_markers = []
-                    noncurrent_by_key = {}
-                    total_versions = 0
-                    noncurrent_count = 0
-                    total_delete_markers_count = 0  # 总删除标记数（包括未保存的）
-                    
-                    # 调整内存限制，确保能捕获足够的删除标记
-                    MAX_DELETE_MARKERS = 5000  # 保证5000条详细信息，确保稳定性
-                    MAX_NONCURRENT_KEYS = 5000  # 同步降低以节省内存
-                    
-                    # 使用分页器流式处理
-                    paginator = self.s3_client.get_paginator('list_object_versions')
-                    page_iterator = paginator.paginate(
-                        Bucket=self.bucket_name,
-                        PaginationConfig={'PageSize': 1000}
-                    )
-                    
-                    page_num = 0
-                    processing_failed = False
-                    error_message = None
-                    
-                    print(f"  ℹ️  [开始扫描] 开始分页扫描版本数据 (每页1000个对象)...")
-                    print(f"  🔍 [调试] 删除标记限制: {MAX_DELETE_MARKERS}, 非当前版本限制: {MAX_NONCURRENT_KEYS}")
-                    
-                    for page in page_iterator:
-                        page_num += 1
-                        
-                        # 调试：显示每页的原始数据
-                        page_dm_count = len(page.get('DeleteMarkers', []))
-                        page_versions_count = len(page.get('Versions', []))
-                        print(f"  🔍 [调试-第{page_num}页] 原始数据: DeleteMarkers={page_dm_count}, Versions={page_versions_count}")
-                        
-                        if page_num % 10 == 0:
-                            print(f"  📊 [进度] 已处理 {page_num} 页 (删除标记: {total_delete_markers_count}, 非当前版本: {noncurrent_count})")
-                        
-                        # 处理删除标记（只保留最近3个月的，且严格限制数量）
-                        page_dm_processed = 0
-                        page_dm_in_range = 0
-                        for dm in page.get('DeleteMarkers', []):
-                            page_dm_processed += 1
-                            is_latest = dm.get('IsLatest', False)
-                            dm_time_raw = dm['LastModified']
-                            dm_time = dm_time_raw.replace(tzinfo=None) if dm_time_raw.tzinfo else dm_time_raw
-                            in_range = dm_time >= analysis_start_time
-                            
-                            if page_dm_processed <= 3 and page_num <= 10:  # 前10页显示前3个用于调试
-                                print(f"    🔍 [调试-DM{page_dm_processed}] IsLatest={is_latest}, Time={dm_time.strftime('%Y-%m-%d %H:%M:%S')}, InRange={in_range}")
-                            
-                            if is_latest and in_range:
-                                page_dm_in_range += 1
-                                total_delete_markers_count += 1
-                                
-                                # 直接收集前5000个，不做复杂排序逻辑
-                                if len(delete_markers) < MAX_DELETE_MARKERS:
-                                    delete_markers.append(dm)
-                                    if len(delete_markers) % 500 == 0:
-                                        print(f"    ✓ [收集] 已保存 {len(delete_markers)} 个删除标记详细信息")
-                                    # 达到5000后可以提前退出
-                                    if len(delete_markers) == MAX_DELETE_MARKERS:
-                                        print(f"    ✓ [达到限制] 已收集{MAX_DELETE_MARKERS}条详细信息，提前结束扫描")
-                                        break
-                        
-                        if page_dm_in_range > 0:
-                            print(f"    ✓ [本页统计] 符合条件的删除标记: {page_dm_in_range}/{page_dm_count}")
-                        
-                        # 如果已经收集够了，提前退出
-                        if len(delete_markers) >= MAX_DELETE_MARKERS:
-                            print(f"  ✓ [提前结束] 已收集足够的删除标记样本，停止扫描")
-                            break
-                        
-                        # 处理版本（只统计指定天数内的非当前版本）
-                        for v in page.get('Versions', []):
-                            if v['LastModified'].replace(tzinfo=None) >= analysis_start_time:
-                                total_versions += 1
-                                
-                                if not v.get('IsLatest', False):
-                                    noncurrent_count += 1
-                                    key = v['Key']
-                                    
-                                    # 只跟踪前MAX_NONCURRENT_KEYS个对象
-                                    if len(noncurrent_by_key) < MAX_NONCURRENT_KEYS:
-                                        if key not in noncurrent_by_key:
-                                            noncurrent_by_key[key] = {
-                                                'count': 0,
-                                                'latest_modified': v['LastModified'],
-                                                'total_size': 0
-                                            }
-                                        
-                                        noncurrent_by_key[key]['count'] += 1
-                                        noncurrent_by_key[key]['total_size'] += v['Size']
-                                        
-                                        if v['LastModified'] > noncurrent_by_key[key]['latest_modified']:
-                                            noncurrent_by_key[key]['latest_modified'] = v['LastModified']
-                    
+                    self._print(f"  🔍 [调试-时间] 当前UTC时间: {current_time.strftime('%Y-%m-%d %H:%M:%S')}")
+                    self._print(f"  🔍 [调试-时间] {self.days}天前时间: {analysis_start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+                    self._print(f"  🔍 [调试] 删除标记详情: 最新{MAX_DELETE_MARKERS}条, 非当前版本明细: 字节数前{MAX_NONCURRENT_KEYS}个对象")
+                
+                scan = self._shared_scan('versioning')
+                analysis_start_time = self.analysis_start_time  # --resume 时沿用断点中的时间起点
+                merged = scan['versioning']
+                delete_markers = merged['delete_markers']
+                noncurrent_keys = merged['noncurrent_keys']
+                total_versions = merged['total_versions']
+                noncurrent_count = merged['noncurrent_count']
+                total_delete_markers_count = merged['delete_markers_count']  # 总删除标记数（包括未保存的）
+                page_num = scan['pages']
+                processing_failed = bool(scan['errors'])
+                error_message = self._scan_error_summary(scan)
+                
+                if not processing_failed:
                     scan_end_time = datetime.now(timezone.utc).replace(tzinfo=None)
                     scan_duration = (scan_end_time - analysis_start_time).total_seconds()
-                    print(f"  ✓ [处理完成] 版本数据处理成功")
-                    print(f"    - 扫描开始时间: {analysis_start_time.strftime('%Y-%m-%d %H:%M:%S')} UTC")
-                    print(f"    - 扫描结束时间: {scan_end_time.strftime('%Y-%m-%d %H:%M:%S')} UTC")
-                    print(f"    - 扫描页数: {page_num:,}")
-                    print(f"    - 总版本数({self.days}天内): {total_versions:,}")
-                    print(f"    - 删除标记总数(所有): {total_delete_markers_count:,}")
-                    print(f"    - 非当前版本({self.days}天内): {noncurrent_count:,}")
-                    print(f"    - 已保存详细信息: 删除标记={len(delete_markers):,}, 非当前版本对象={len(noncurrent_by_key):,}")
+                    self._print(f"  ✓ [处理完成] 版本数据处理成功")
+                    self._print(f"    - 扫描开始时间: {analysis_start_time.strftime('%Y-%m-%d %H:%M:%S')} UTC")
+                    self._print(f"    - 扫描结束时间: {scan_end_time.strftime('%Y-%m-%d %H:%M:%S')} UTC")
+                    self._print(f"    - 扫描页数: {page_num:,}")
+                    self._print(f"    - 总版本数({self.days}天内): {total_versions:,}")
+                    self._print(f"    - 删除标记总数(所有): {total_delete_markers_count:,}")
+                    self._print(f"    - 非当前版本({self.days}天内): {noncurrent_count:,}")
+                    self._print(f"    - 有非当前版本的对象: {noncurrent_keys:,} 个，共 {merged['noncurrent_bytes'] / (1024**3):.2f} GB"
+                                + (f"（内存不足部分已溢出到磁盘 {merged['noncurrent_spills']} 次）" if merged['noncurrent_spills'] else ''))
+                    self._print(f"    - 已保存详细信息: 删除标记={len(delete_markers):,}, 非当前版本对象={len(merged['noncurrent_top']):,}")
                     
-                    # 最终按时间排序（只有最多5000条）
+                    # 累加器已按时间倒序输出最新的删除标记
                     if delete_markers:
-                        delete_markers.sort(key=lambda x: x['LastModified'], reverse=True)
-                        print(f"    - 删除标记已按时间排序（最新的{len(delete_markers)}条）")
-                    
-                    # 构建非当前版本分析
-                    noncurrent_analysis = []
-                    for key, data in noncurrent_by_key.items():
-                        noncurrent_analysis.append({
-                            'key': key,
-                            'noncurrent_count': data['count'],
-                            'latest_noncurrent': data['latest_modified'].strftime('%Y-%m-%d %H:%M:%S'),
-                            'total_size': data['total_size']
-                        })
+                        self._print(f"    - 删除标记详情为最新的{len(delete_markers)}条（已按时间排序）")
                     
-                    # 按最近修改时间排序
-                    noncurrent_analysis.sort(key=lambda x: x['latest_noncurrent'], reverse=True)
+                    # 构建非当前版本分析（已按非当前版本字节数从大到小排序）
+                    noncurrent_analysis = [{
+                        'key': item['key'],
+                        'noncurrent_count': item['count'],
+                        'latest_noncurrent': item['latest_modified'].strftime('%Y-%m-%d %H:%M:%S'),
+                        'total_size': item['total_size']
+                    } for item in merged['noncurrent_top']]
                     
                     version_info = {
                         'status': 'Enabled',
                         'total_versions': total_versions,
                         'noncurrent_versions': noncurrent_count,
                         'delete_markers': total_delete_markers_count,  # 使用实际总数
-                        'objects_with_noncurrent': len(noncurrent_analysis)
+                        'objects_with_noncurrent': noncurrent_keys
                     }
                     
                     # 保存供报告使用（已经被限制数量）
@@ -349,16 +1357,22 @@ class S3DeletionAnalyzer:
                             'last_modified': dm['LastModified'].strftime('%Y-%m-%d %H:%M:%S'),
                             'version_id': dm['VersionId']
                         } for dm in delete_markers],  # 已经限制在MAX_DELETE_MARKERS内
-                        'noncurrent_analysis': noncurrent_analysis,  # 已经限制在MAX_NONCURRENT_KEYS内
+                        'noncurrent_analysis': noncurrent_analysis,  # 字节数前 MAX_NONCURRENT_KEYS 个对象
                         'total_delete_markers': total_delete_markers_count,
-                        'total_noncurrent_objects': len(noncurrent_analysis),
+                        'total_noncurrent_objects': noncurrent_keys,
+                        'total_noncurrent_bytes': merged['noncurrent_bytes'],
                         'time_range': f'最近{self.days}天 ({analysis_start_time.strftime("%Y-%m-%d")} 至 {datetime.now(timezone.utc).strftime("%Y-%m-%d")})',
                         'scan_start_time': analysis_start_time.strftime('%Y-%m-%d %H:%M:%S'),
                         'scan_end_time': scan_end_time.strftime('%Y-%m-%d %H:%M:%S'),
                         'processing_status': '正常完成',
-                        'memory_optimization': f'已启用（流式处理，保证最多{MAX_DELETE_MARKERS}条详情，确保稳定性）',
+                        'memory_optimization': f'已启用（计数精确，最小堆保留最新的{MAX_DELETE_MARKERS}条删除标记详情）',
                         'pages_scanned': page_num,
-                        'version': 'v2.0-stable'
+                        'shards_scanned': scan['shards'],
+                        'shared_steps': [SCAN_STEP_LABELS[n] for n in scan['steps']],
+                        'scan_source': scan['source'],
+                        'data_source': scan['source_label'],
+                        'scan_workers': self.workers,
+                        'version': 'v2.2-exact'
                     }
                     
                     if total_delete_markers_count > 0:
@@ -372,7 +1386,7 @@ class S3DeletionAnalyzer:
                         
                         title_msg = f'发现 {total_delete_markers_count:,} 个删除标记'
                         if total_delete_markers_count > len(delete_markers):
-                            title_msg += f' (报告中显示前 {len(delete_markers):,} 个)'
+                            title_msg += f' (报告中显示最新的 {len(delete_markers):,} 个)'
                         
                         details_msg = f'扫描了 {page_num:,} 页数据，发现 {total_delete_markers_count:,} 个删除标记。'
                         if dm_in_range > 0:
@@ -382,7 +1396,7 @@ class S3DeletionAnalyzer:
                         if non_latest_dm_count > 0:
                             details_msg += f' {non_latest_dm_count:,} 个不是当前版本（IsLatest=False）。'
                         
-                        self.findings.append({
+                        self._add_finding({
                             'severity': 'MEDIUM',
                             'category': '版本控制',
                             'title': title_msg,
@@ -399,7 +1413,7 @@ class S3DeletionAnalyzer:
                         })
                     elif total_versions > 0 and noncurrent_count == 0 and total_delete_markers_count == 0:
                         # 有版本但没有非当前版本和删除标记，说明可能有问题
-                        self.findings.append({
+                        self._add_finding({
                             'severity': 'HIGH',
                             'category': '版本控制',
                             'title': '⚠️ 版本控制已启用但未发现任何删除标记或历史版本',
@@ -420,11 +1434,11 @@ class S3DeletionAnalyzer:
                             }
                         })
                     
-                    if len(noncurrent_analysis) > 0:
-                        self.findings.append({
+                    if noncurrent_keys > 0:
+                        self._add_finding({
                             'severity': 'INFO',
                             'category': '版本控制',
-                            'title': f'最近{self.days}天发现 {len(noncurrent_analysis)} 个对象有非当前版本',
+                            'title': f'最近{self.days}天发现 {noncurrent_keys:,} 个对象有非当前版本',
                             'details': {
                                 'message': f'最近{self.days}天内共 {noncurrent_count} 个非当前版本,可能包含被覆盖或删除的数据',
                                 'time_range': f'{analysis_start_time.strftime("%Y-%m-%d")} 至 {datetime.now(timezone.utc).strftime("%Y-%m-%d")}',
@@ -433,43 +1447,18 @@ class S3DeletionAnalyzer:
                         })
                     else:
                         # 即使没有删除标记，也要记录版本控制信息
-                        self.findings.append({
+                        self._add_finding({
                             'severity': 'INFO',
                             'category': '版本控制',
                             'title': '版本控制已启用（无删除标记）',
                             'details': version_info
                         })
-                except Exception as e:
-                    processing_failed = True
-                    error_message = str(e)
-                    print(f"\n  ❌ [异常发生] 版本数据处理时发生异常")
-                    print(f"  ❌ [异常类型] {type(e).__name__}")
-                    print(f"  ❌ [异常详情] {error_message}")
-                    print(f"  ℹ️  [已处理数据] 已扫描 {page_num} 页")
-                    print(f"  ℹ️  [已保存数据] 删除标记={len(delete_markers)}, 非当前版本对象={len(noncurrent_by_key)}")
-                    print(f"  ℹ️  [继续处理] 尝试继续统计剩余删除标记总数...")
-                    
-                    # 继续统计剩余的删除标记数量（不保存详细信息）
-                    remaining_dm_count = 0
-                    try:
-                        print(f"  ℹ️  [继续扫描] 尝试统计剩余删除标记（不保存详细信息）...")
-                        # 从当前位置继续扫描
-                        for page in page_iterator:
-                            remaining_dm_count += len([dm for dm in page.get('DeleteMarkers', []) if dm.get('IsLatest', False)])
-                            if remaining_dm_count % 1000 == 0:
-                                print(f"    ℹ️  继续扫描中... 已发现额外 {remaining_dm_count:,} 个删除标记")
-                    except Exception as e2:
-                        print(f"  ⚠️  [继续扫描失败] 无法完成剩余扫描: {str(e2)}")
-                    
-                    total_delete_markers_count += remaining_dm_count
-                    print(f"  ✓ [统计完成] 总删除标记={total_delete_markers_count:,} (详细信息={len(delete_markers):,})")
                 
                 # 处理结果（无论是否出错）
                 if processing_failed:
-                    print(f"\n  ℹ️  [生成报告] 处理异常情况，生成部分数据报告...")
+                    self._print(f"\n  ℹ️  [生成报告] 处理异常情况，生成部分数据报告...")
                     # 保存已收集的部分数据
                     if delete_markers:
-                        delete_markers.sort(key=lambda x: x['LastModified'], reverse=True)
                         self.version_analysis = {
                             'delete_markers': [{
                                 'key': dm['Key'],
@@ -483,50 +1472,57 @@ class S3DeletionAnalyzer:
                             'scan_start_time': analysis_start_time.strftime('%Y-%m-%d %H:%M:%S'),
                             'scan_end_time': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
                             'processing_status': '异常终止（已保存部分数据）',
-                            'memory_optimization': f'已启用（流式处理，保证最多{MAX_DELETE_MARKERS}条详情，确保稳定性）',
+                            'memory_optimization': f'已启用（计数精确，最小堆保留最新的{MAX_DELETE_MARKERS}条删除标记详情）',
                             'pages_scanned': page_num,
-                            'version': 'v2.0-stable'
+                            'shards_scanned': scan['shards'],
+                            'shared_steps': [SCAN_STEP_LABELS[n] for n in scan['steps']],
+                            'scan_source': scan['source'],
+                            'data_source': scan['source_label'],
+                            'scan_workers': self.workers,
+                            'version': 'v2.2-exact'
                         }
                         
-                        print(f"  ✓ [报告生成] 已添加部分数据到报告 (删除标记: {len(delete_markers):,}/{total_delete_markers_count:,})")
-                        self.findings.append({
+                        self._print(f"  ✓ [报告生成] 已添加部分数据到报告 (删除标记: {len(delete_markers):,}/{total_delete_markers_count:,})")
+                        self._add_finding({
                             'severity': 'HIGH',
                             'category': '版本控制',
                             'title': f'⚠️ 发现 {total_delete_markers_count:,} 个删除标记（处理时发生异常，部分详细信息可用）',
                             'details': {
                                 'message': f'❌ 版本数据处理时发生异常，但已成功保存 {len(delete_markers):,} 个删除标记的详细信息',
                                 'processing_status': '异常终止',
-                                'exception_type': type(Exception).__name__,
+                                'exception_type': self._scan_error_types(scan),
                                 'exception_message': error_message[:200],
                                 'total_delete_markers': total_delete_markers_count,
                                 'detailed_info_available': len(delete_markers),
                                 'pages_processed': page_num,
-                                'note': f'报告中显示前 {len(delete_markers):,} 个删除标记的详细信息',
+                                'note': f'报告中显示最新的 {len(delete_markers):,} 个删除标记的详细信息',
                                 'suggestion': '建议: 1) 在内存更大的机器上重新运行以获取完整信息 2) 使用 S3 Inventory 进行离线分析 3) 配置生命周期策略清理删除标记'
                             }
                         })
                     else:
-                        print(f"  ⚠️  [报告生成] 无详细数据可用，添加异常信息到报告")
-                        self.findings.append({
+                        self._print(f"  ⚠️  [报告生成] 无详细数据可用，添加异常信息到报告")
+                        self._add_finding({
                             'severity': 'MEDIUM',
                             'category': '版本控制',
                             'title': '⚠️ 版本控制已启用，但处理版本数据时发生异常',
                             'details': {
                                 'message': f'❌ 处理版本数据时发生异常，总删除标记数: {total_delete_markers_count:,}',
                                 'processing_status': '异常终止',
-                                'exception_type': type(Exception).__name__,
+                                'exception_type': self._scan_error_types(scan),
                                 'exception_message': error_message[:200],
                                 'total_delete_markers': total_delete_markers_count,
                                 'pages_processed': page_num,
                                 'suggestion': '建议: 1) 在内存更大的机器上运行 2) 使用 S3 Inventory 进行离线分析'
                             }
                         })
-                    print(f"  ℹ️  [处理完成] 异常处理完成，继续后续分析...\n")
+                    self._print(f"  ℹ️  [处理完成] 异常处理完成，继续后续分析...\n")
                     return  # 提前返回，不执行后续的正常处理逻辑
             else:
                 # 版本控制未启用，更新状态
                 self.version_analysis['processing_status'] = '版本控制未启用'
-                self.findings.append({
+                # 不再需要版本控制分析，统一扫描只服务剩余步骤
+                self.scan_plan = [n for n in self.scan_plan if n != 'versioning']
+                self._add_finding({
                     'severity': 'INFO',
                     'category': '版本控制',
                     'title': '版本控制未启用',
@@ -536,18 +1532,474 @@ class S3DeletionAnalyzer:
         except Exception as e:
             # 获取版本控制状态失败，更新状态
             self.version_analysis['processing_status'] = f'获取失败: {str(e)[:100]}'
+            self.scan_plan = [n for n in self.scan_plan if n != 'versioning']
             if 'AccessDenied' not in str(e):
-                print(f"  ⚠️  无法获取版本控制状态: {str(e)}")
-                self.findings.append({
+                self._print(f"  ⚠️  无法获取版本控制状态: {str(e)}")
+                self._add_finding({
                     'severity': 'INFO',
                     'category': '版本控制',
                     'title': '无法获取版本控制状态',
                     'details': str(e)
                 })
     
+    def _discover_version_shards(self):
+        """用 Delimiter 发现前缀分片，按广度优先递归拆分热点前缀"""
+        target = self.workers * SHARDS_PER_WORKER
+        shards = []  # (prefix, delimiter): delimiter='/' 表示只列该前缀下的直接对象
+        pending = deque([('', 0)])
+        paginator = self.s3_client.get_paginator('list_object_versions')
+        
+        while pending:
+            prefix, depth = pending.popleft()
+            # 分片数量已够或层级过深时，不再拆分，整个前缀作为一个分片
+            if depth >= MAX_SHARD_DEPTH or len(shards) + len(pending) + 1 >= target:
+                shards.append((prefix, None))
+                continue
+            
+            children = []
+            has_direct = False
+            too_wide = False
+            page_iterator = paginator.paginate(
+                Bucket=self.bucket_name,
+                Prefix=prefix,
+                Delimiter='/',
+                PaginationConfig={'PageSize': 1000}
+            )
+            for page_no, page in enumerate(page_iterator, 1):
+                children.extend(cp['Prefix'] for cp in page.get('CommonPrefixes', []))
+                if page.get('Versions') or page.get('DeleteMarkers'):
+                    has_direct = True
+                # 直接对象过多的前缀不适合用 Delimiter 拆分，避免发现阶段本身变成全量扫描
+                if page_no >= SHARD_PROBE_PAGES and page.get('IsTruncated'):
+                    too_wide = True
+                    break
+            
+            if too_wide or not children:
+                shards.append((prefix, None))
+                continue
+            
+            if has_direct:
+                shards.append((prefix, '/'))
+            pending.extend((child, depth + 1) for child in children)
+        
+        return shards
+    
+    def _scan_shard(self, index, prefix, delimiter, names, progress, stop, checkpoint=None):
+        """扫描单个前缀分片，把每页结果喂给所有累加器；启用断点时定期保存扫描位置"""
+        store = checkpoint.open_shard(index) if checkpoint else None
+        
+        def restore():
+            accumulators = {name: SCAN_ACCUMULATORS[name](self, store=store) for name in names}
+            saved = checkpoint.load_shard(store) if store else None
+            if saved:
+                for name, acc in accumulators.items():
+                    acc.load_state(saved['accumulators'][name])
+            return accumulators, saved
+        
+        shard_accumulators, saved = restore()
+        shard = {
+            'prefix': prefix,
+            'pages': saved['pages'] if saved else 0,
+            'objects': saved.get('objects', 0) if saved else 0,
+            'delete_markers': saved.get('delete_markers', 0) if saved else 0,
+            'accumulators': shard_accumulators,
+            'error': None,
+            'error_type': None,  # 异常类名，扫描被中断时为 None
+            'resumed': False,
+            'store': store
+        }
+        accumulators = list(shard_accumulators.values())
+        label = f"{prefix or '<root>'}{' (仅当前层)' if delimiter else ''}"
+        markers = {}
+        done = False
+        
+        if saved:
+            shard['resumed'] = True
+            markers = saved['markers']
+            done = saved['done']
+            progress.update(shard['pages'], shard['objects'], shard['delete_markers'], resumed=True)
+            if done:
+                return shard
+            self._print(f"  ℹ️  [断点续扫] 分片 {label} 从第{saved['pages'] + 1}页继续 (KeyMarker={markers.get('KeyMarker', '')})")
+        
+        def save_checkpoint():
+            if store is not None:
+                checkpoint.save_shard(store, {
+                    'pages': shard['pages'],
+                    'objects': shard['objects'],
+                    'delete_markers': shard['delete_markers'],
+                    'markers': markers,
+                    'done': done,
+                    'accumulators': {name: acc.state() for name, acc in shard['accumulators'].items()}
+                })
+        
+        params = {'Bucket': self.bucket_name, 'Prefix': prefix, 'PaginationConfig': {'PageSize': 1000}}
+        if delimiter:
+            params['Delimiter'] = delimiter
+        paginator = self.s3_client.get_paginator('list_object_versions')
+        last_saved = time.monotonic()
+        failures = 0
+        
+        while not done and not stop.is_set():
+            # 从上一页的 NextKeyMarker/NextVersionIdMarker 开始列出，重试时不会重复统计已处理的页
+            page_iterator = iter(paginator.paginate(**params, **markers))
+            fetch_error = None
+            try:
+                while not stop.is_set():
+                    try:
+                        page = next(page_iterator)
+                    except StopIteration:
+                        done = True
+                        break
+                    except Exception as e:
+                        fetch_error = e
+                        break
+                    shard['pages'] += 1
+                    
+                    page_dm_count = len(page.get('DeleteMarkers', []))
+                    page_versions_count = len(page.get('Versions', []))
+                    shard['objects'] += page_dm_count + page_versions_count
+                    shard['delete_markers'] += page_dm_count
+                    if self.verbose:
+                        # 调试：显示每页的原始数据
+                        self._print(f"  🔍 [调试-{label} 第{shard['pages']}页] 原始数据: DeleteMarkers={page_dm_count}, Versions={page_versions_count}")
+                    
+                    for acc in accumulators:
+                        acc.add_page(page)
+                    
+                    if page.get('IsTruncated'):
+                        markers = {'KeyMarker': page['NextKeyMarker']}
+                        if page.get('NextVersionIdMarker'):
+                            markers['VersionIdMarker'] = page['NextVersionIdMarker']
+                    else:
+                        done = True
+                    failures = 0
+                    
+                    progress.update(1, page_dm_count + page_versions_count, page_dm_count)
+                    
+                    if time.monotonic() - last_saved >= CHECKPOINT_INTERVAL:
+                        save_checkpoint()
+                        last_saved = time.monotonic()
+            except Exception as e:
+                # 处理页面时出错：不重试，丢弃未保存的部分，分片结果回到上一个断点
+                shard['error'] = f"{type(e).__name__}: {e}"
+                shard['error_type'] = type(e).__name__
+                self._print(f"\n  ❌ [异常发生] 分片 {label} 处理时发生异常: {shard['error']}")
+                if store is not None:
+                    store.rollback()
+                    shard['accumulators'], saved = restore()
+                    shard['pages'] = saved['pages'] if saved else 0
+                return shard
+            
+            if fetch_error is not None:
+                failures += 1
+                error = f"{type(fetch_error).__name__}: {fetch_error}"
+                self._print(f"\n  ❌ [异常发生] 分片 {label} 列出时发生异常: {error}")
+                if failures > SHARD_RETRIES:
+                    shard['error'] = error
+                    shard['error_type'] = type(fetch_error).__name__
+                    break
+                self._print(f"  ℹ️  [继续扫描] 从第{shard['pages'] + 1}页重试 ({failures}/{SHARD_RETRIES})...")
+                time.sleep(2 ** failures)
+        
+        if not done and not shard['error']:
+            shard['error'] = '扫描被中断'
+        save_checkpoint()
+        return shard
+    
+    def _scan_bucket(self, names):
+        """单次按前缀分片并发扫描 list_object_versions，同时驱动多个累加器；中断后可用 --resume 继续"""
+        step_labels = '、'.join(SCAN_STEP_LABELS.get(name, name) for name in names)
+        plan = self.checkpoint.load_plan() if self.resume else None
+        if plan and plan['names'] == list(names) and plan['days'] == self.days:
+            # 沿用上次的分片和时间起点，已完成的分片不再扫描
+            shards = [tuple(shard) for shard in plan['shards']]
+            self.analysis_start_time = datetime.fromisoformat(plan['analysis_start_time'])
+            self._print(f"  ℹ️  [断点续扫] 继续 {plan['created_at']} 开始的扫描，"
+                        f"时间起点 {self.analysis_start_time.strftime('%Y-%m-%d %H:%M:%S')} UTC")
+        else:
+            if self.resume:
+                self._print(f"  ⚠️  [断点续扫] 没有可用的断点（或扫描步骤、天数不同），重新开始扫描")
+            try:
+                shards = self._discover_version_shards()
+            except Exception as e:
+                # 分片发现失败时退回整个 bucket 单分片扫描
+                self._print(f"  ⚠️  [分片发现失败] {str(e)}，改为单分片扫描")
+                shards = [('', None)]
+            self.checkpoint.save_plan({
+                'bucket': self.bucket_name,
+                'names': list(names),
+                'days': self.days,
+                'analysis_start_time': self.analysis_start_time.isoformat(),
+                'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+                'shards': [list(shard) for shard in shards]
+            })
+        self._print(f"  ℹ️  [开始扫描] 共 {len(shards)} 个前缀分片，{self.workers} 个并发线程 (每页1000个对象)，"
+                    f"本次扫描同时用于: {step_labels}")
+        
+        progress = self._progress_reporter('listing')
+        stop = self.stop_event
+        # 合并目标不使用断点文件，分片合并完即可删除断点
+        merged = {name: SCAN_ACCUMULATORS[name](self) for name in names}
+        scan = {
+            'pages': 0,
+            'shards': len(shards),
+            'resumed_shards': 0,
+            'steps': list(names),
+            'errors': [],
+            'source': 'listing',
+            'source_label': f'list_object_versions 实时列出（{len(shards)} 个前缀分片）'
+        }
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(self._scan_shard, index, prefix, delimiter, names, progress, stop, self.checkpoint)
+                for index, (prefix, delimiter) in enumerate(shards)
+            ]
+            try:
+                for future in as_completed(futures):
+                    shard = future.result()
+                    scan['pages'] += shard['pages']
+                    scan['resumed_shards'] += shard['resumed']
+                    for name, acc in shard['accumulators'].items():
+                        merged[name].merge(acc)
+                    if shard['store'] is not None:
+                        shard['store'].close()
+                    if shard['error']:
+                        scan['errors'].append({'prefix': shard['prefix'], 'error': shard['error'],
+                                               'type': shard['error_type']})
+            except KeyboardInterrupt:
+                # 在主线程中直接扫描时（如 --verify-only）：通知所有分片在当前页结束后保存断点并退出
+                self._interrupt()
+                raise
+        
+        progress.finish()
+        if scan['resumed_shards']:
+            scan['source_label'] += f"，其中 {scan['resumed_shards']} 个分片沿用断点"
+        if scan['errors']:
+            self._print(f"  ℹ️  [断点已保存] {self.checkpoint.directory}，使用 --resume 可从中断处继续扫描")
+        else:
+            self.checkpoint.remove()
+        
+        for name, acc in merged.items():
+            scan[name] = acc.result()
+        return scan
+    
+    def _cloudwatch_object_count(self):
+        """最近一天的 CloudWatch NumberOfObjects（包含所有版本和删除标记），没有数据时返回 None"""
+        count_data = getattr(self, 'count_data', None)
+        return int(count_data[-1]['Average']) if count_data else None
+    
+    def _progress_reporter(self, phase, total_pages=None, unit='页'):
+        """创建扫描进度报告器；列出版本时用最近一次 CloudWatch NumberOfObjects 估算剩余时间"""
+        return ProgressReporter(
+            self.bucket_name, phase,
+            interval=self.progress_interval,
+            stream=self.progress_file,
+            total_objects=self._cloudwatch_object_count if total_pages is None else None,
+            total_pages=total_pages,
+            unit=unit,
+            output=self.output
+        )
+    
+    def _shared_scan(self, name):
+        """返回包含指定累加器结果的扫描；首次调用时一次扫描覆盖 scan_plan 中所有尚未完成的步骤"""
+        with self.scan_lock:
+            return self._shared_scan_locked(name)
+    
+    def _shared_scan_locked(self, name):
+        if name not in self.scan_results:
+            names = [n for n in self.scan_plan if n not in self.scan_results]
+            if name not in names:
+                names.append(name)
+            if self.inventory:
+                scan = self._scan_inventory(names)
+            else:
+                scan = self._scan_bucket(names)
+            for n in names:
+                self.scan_results[n] = scan
+        return self.scan_results[name]
+    
+    def _scan_error_summary(self, scan):
+        """把扫描中失败分片的错误合并为一行"""
+        return '; '.join(f"{e['prefix'] or '<root>'}: {e['error']}" for e in scan['errors'])
+    
+    def _scan_error_types(self, scan):
+        """扫描中失败分片的异常类名（去重），中断的分片不计入"""
+        return ', '.join(sorted({e['type'] for e in scan['errors'] if e.get('type')})) or 'N/A'
+    
+    def _load_inventory_manifest(self):
+        """读取 S3 Inventory 的 manifest.json（s3://bucket/path/manifest.json 或本地文件/目录）"""
+        location = self.inventory
+        if location.startswith('s3://'):
+            bucket, _, key = location[len('s3://'):].partition('/')
+            if not key.endswith('.json'):
+                key = f"{key.rstrip('/')}/manifest.json".lstrip('/')
+            body = self.s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+            manifest = json.loads(body)
+            manifest['_base_dir'] = None
+        else:
+            path = os.path.join(location, 'manifest.json') if os.path.isdir(location) else location
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            manifest['_base_dir'] = os.path.dirname(os.path.abspath(path))
+        
+        # destinationBucket 形如 arn:aws:s3:::bucket-name
+        manifest['_data_bucket'] = manifest.get('destinationBucket', '').split(':::')[-1]
+        return manifest
+    
+    def _inventory_local_path(self, base_dir, key):
+        """本地目录中的清单文件：按原始 key、data/ 子目录、文件名依次查找"""
+        candidates = [
+            os.path.join(base_dir, key),
+            os.path.join(base_dir, 'data', os.path.basename(key)),
+            os.path.join(base_dir, os.path.basename(key))
+        ]
+        for candidate in candidates:
+            if os.path.exists(candidate):
+                return candidate
+        raise FileNotFoundError(f'找不到清单数据文件: {key}')
+    
+    def _read_inventory_file(self, manifest, entry):
+        """读取一个清单数据文件（CSV/ORC/Parquet），返回规范化后的 Arrow 表"""
+        if manifest['_base_dir'] is None:
+            body = self.s3_client.get_object(Bucket=manifest['_data_bucket'], Key=entry['key'])['Body'].read()
+            source = pa.BufferReader(body)
+        else:
+            source = self._inventory_local_path(manifest['_base_dir'], entry['key'])
+        
+        file_format = manifest.get('fileFormat', 'CSV').upper()
+        if file_format == 'CSV':
+            import pyarrow.csv as pacsv
+            # CSV 没有表头，列顺序由 fileSchema 给出，数据文件为 gzip 压缩
+            columns = [c.strip() for c in manifest['fileSchema'].split(',')]
+            wanted = [c for c in columns if c in INVENTORY_FIELDS]
+            table = pacsv.read_csv(
+                pa.input_stream(source, compression='gzip'),
+                read_options=pacsv.ReadOptions(column_names=columns),
+                convert_options=pacsv.ConvertOptions(
+                    include_columns=wanted,
+                    column_types={
+                        'Key': pa.string(),
+                        'VersionId': pa.string(),
+                        'IsLatest': pa.bool_(),
+                        'IsDeleteMarker': pa.bool_(),
+                        'Size': pa.int64(),
+                        'LastModifiedDate': pa.timestamp('ms', tz='UTC')
+                    },
+                    strings_can_be_null=True
+                )
+            )
+            table = table.rename_columns([INVENTORY_FIELDS[c] for c in table.column_names])
+            # CSV 中的对象键经过 URL 编码，只在确实含有编码字符时逐个解码
+            keys = table['key']
+            if pc.any(pc.match_substring_regex(keys, r'[%+]')).as_py():
+                decoded = pa.array([unquote_plus(k) for k in keys.to_pylist()], type=pa.string())
+                table = table.set_column(table.column_names.index('key'), 'key', decoded)
+        elif file_format == 'ORC':
+            import pyarrow.orc as paorc
+            orc_file = paorc.ORCFile(source)
+            table = orc_file.read(columns=[c for c in orc_file.schema.names if c in INVENTORY_FIELDS.values()])
+        elif file_format == 'PARQUET':
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(source)
+            table = parquet_file.read(
+                columns=[c for c in parquet_file.schema_arrow.names if c in INVENTORY_FIELDS.values()]
+            )
+        else:
+            raise ValueError(f'不支持的清单格式: {file_format}')
+        
+        return self._normalize_inventory_table(table)
+    
+    def _normalize_inventory_table(self, table):
+        """统一清单列：key, version_id, is_latest, is_delete_marker, size, last_modified
+        
+        只包含当前版本的清单没有版本相关列，此时所有记录视为当前版本
+        """
+        rows = table.num_rows
+        names = table.column_names
+        
+        def column(name, default, type_):
+            if name in names:
+                return pc.fill_null(table[name].cast(type_), default)
+            return pa.repeat(pa.scalar(default, type=type_), rows)
+        
+        version_id = table['version_id'].cast(pa.string()) if 'version_id' in names else pa.nulls(rows, pa.string())
+        return pa.table({
+            'key': table['key'].cast(pa.string()),
+            'version_id': version_id,
+            'is_latest': column('is_latest', True, pa.bool_()),
+            'is_delete_marker': column('is_delete_marker', False, pa.bool_()),
+            'size': column('size', 0, pa.int64()),
+            'last_modified': table['last_modified_date'].cast(pa.timestamp('ms', tz='UTC'))
+        })
+    
+    def _scan_inventory(self, names):
+        """用 S3 Inventory 清单代替实时列出：并发读取数据文件，向量化地喂给累加器"""
+        if pa is None:
+            raise RuntimeError('使用 --inventory 需要安装 pyarrow (pip install pyarrow)')
+        
+        manifest = self._load_inventory_manifest()
+        files = manifest.get('files', [])
+        step_labels = '、'.join(SCAN_STEP_LABELS.get(name, name) for name in names)
+        source_bucket = manifest.get('sourceBucket')
+        if source_bucket and source_bucket != self.bucket_name:
+            self._print(f"  ⚠️  [清单] 清单来源 bucket 为 {source_bucket}，与分析目标 {self.bucket_name} 不一致")
+        self._print(f"  ℹ️  [开始读取清单] 格式 {manifest.get('fileFormat', 'CSV')}，共 {len(files)} 个数据文件，"
+                    f"{self.workers} 个并发线程，本次读取同时用于: {step_labels}")
+        
+        def process(entry):
+            table = self._read_inventory_file(manifest, entry)
+            accumulators = {name: SCAN_ACCUMULATORS[name](self) for name in names}
+            for acc in accumulators.values():
+                acc.add_table(table)
+            return table.num_rows, pc.sum(table['is_delete_marker']).as_py() or 0, accumulators
+        
+        merged = {name: SCAN_ACCUMULATORS[name](self) for name in names}
+        created = manifest.get('creationTimestamp')
+        created_label = (datetime.fromtimestamp(int(created) / 1000, timezone.utc).strftime('%Y-%m-%d %H:%M')
+                         if created else 'N/A')
+        scan = {
+            'pages': 0,
+            'rows': 0,
+            'shards': len(files),
+            'steps': list(names),
+            'errors': [],
+            'source': 'inventory'
+        }
+        
+        progress = self._progress_reporter('inventory', total_pages=len(files), unit='个清单文件')
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(process, entry): entry for entry in files}
+            for future in as_completed(futures):
+                if self.stop_event.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                entry = futures[future]
+                try:
+                    rows, delete_markers, accumulators = future.result()
+                except Exception as e:
+                    scan['errors'].append({'prefix': entry['key'], 'error': f"{type(e).__name__}: {e}",
+                                           'type': type(e).__name__})
+                    self._print(f"  ❌ [清单文件失败] {entry['key']}: {str(e)}")
+                    continue
+                scan['pages'] += 1
+                scan['rows'] += rows
+                for name, acc in accumulators.items():
+                    merged[name].merge(acc)
+                progress.update(1, rows, delete_markers)
+        
+        progress.finish()
+        self._print(f"  📊 [进度] 已读取 {scan['pages']}/{len(files)} 个清单文件 ({scan['rows']:,} 条记录)")
+        scan['source_label'] = f"S3 Inventory 清单（{created_label} UTC 生成，{len(files)} 个文件，{scan['rows']:,} 条记录）"
+        for name, acc in merged.items():
+            scan[name] = acc.result()
+        return scan
+    
     def _verify_deletion_marker_count(self):
         """验证删除标记统计的准确性"""
-        print("  正在验证删除标记统计...")
+        self._print("  正在验证删除标记统计...")
         
         verification_result = {
             'verification_performed': False,
@@ -562,90 +2014,49 @@ class S3DeletionAnalyzer:
         
         try:
             # 如果跳过对象列表，进行采样验证
-            if self.skip_object_listing:
-                print("    使用采样验证方法（因为启用了--skip-listing）...")
+            if self.skip_object_listing and not self.inventory:
+                self._print("    使用采样验证方法（因为启用了--skip-listing）...")
                 verification_result['sample_verification'] = True
                 
-                # 采样验证：随机检查一些前缀
-                sample_prefixes = ['backup/', 'data/', 'logs/', 'archive/', '']  # 常见前缀
-                total_sample_objects = 0
-                total_sample_versions = 0
-                total_sample_delete_markers = 0
+                # 在键空间的随机位置取样，外推删除标记和非当前版本的数量
+                sample = KeyspaceSampler(self, margin=self.sample_margin).run(total_objects=self._cloudwatch_object_count())
+                verification_result['sample'] = sample
+                estimates = sample['estimates']
                 
-                for prefix in sample_prefixes:
-                    try:
-                        print(f"      检查前缀: '{prefix}'...")
-                        
-                        # 列出当前对象（最多1000个）
-                        current_response = self.s3_client.list_objects_v2(
-                            Bucket=self.bucket_name,
-                            Prefix=prefix,
-                            MaxKeys=1000
-                        )
-                        current_count = len(current_response.get('Contents', []))
-                        total_sample_objects += current_count
-                        
-                        # 列出所有版本（最多1000个）
-                        versions_response = self.s3_client.list_object_versions(
-                            Bucket=self.bucket_name,
-                            Prefix=prefix,
-                            MaxKeys=1000
-                        )
-                        
-                        versions_count = len(versions_response.get('Versions', []))
-                        delete_markers_count = len(versions_response.get('DeleteMarkers', []))
-                        
-                        total_sample_versions += versions_count
-                        total_sample_delete_markers += delete_markers_count
-                        
-                        print(f"        当前对象: {current_count}, 版本: {versions_count}, 删除标记: {delete_markers_count}")
-                        
-                    except Exception as e:
-                        print(f"        跳过前缀 '{prefix}': {str(e)}")
-                        continue
+                def estimated(measure):
+                    count = estimates[measure]['count']
+                    return count if count is not None else sample['sampled_counts'][measure]
                 
-                verification_result['current_objects_count'] = total_sample_objects
-                verification_result['total_versions_count'] = total_sample_versions
-                verification_result['delete_markers_count'] = total_sample_delete_markers
+                verification_result['current_objects_count'] = estimated('current')
+                verification_result['total_versions_count'] = estimated('current') + estimated('noncurrent')
+                verification_result['delete_markers_count'] = estimated('delete_markers')
                 verification_result['verification_performed'] = True
                 
-                print(f"    采样结果: 当前对象={total_sample_objects}, 版本={total_sample_versions}, 删除标记={total_sample_delete_markers}")
+                self._print(f"    采样: {sample['strata']} 个前缀分层（{sample['census_strata']} 个完整计数），"
+                            f"{sample['probes']} 个随机样本，共 {sample['requests']} 次请求，{sample['sampled_entries']:,} 个条目")
+                for measure, label in (('delete_markers', '删除标记'), ('recent_delete_markers', f'{self.days}天内的最新删除标记'),
+                                       ('noncurrent', '非当前版本')):
+                    self._print(f"    {label}: {self._format_sample_estimate(estimates[measure])}")
+                if not sample['calibrated'] and sample['sampled_strata']:
+                    self._print("    ⚠️  无法获取 CloudWatch NumberOfObjects，数量按各层键密度直接估计，置信区间较宽")
                 
             else:
-                print("    使用完整验证方法...")
-                # 完整验证：统计所有对象和版本
-                
-                # 统计当前对象
-                current_objects = 0
-                paginator = self.s3_client.get_paginator('list_objects_v2')
-                for page in paginator.paginate(Bucket=self.bucket_name):
-                    current_objects += len(page.get('Contents', []))
-                    if current_objects % 10000 == 0:
-                        print(f"      已统计当前对象: {current_objects:,}")
-                
-                # 统计所有版本和删除标记
-                total_versions = 0
-                total_delete_markers = 0
-                paginator = self.s3_client.get_paginator('list_object_versions')
-                page_count = 0
+                self._print("    使用完整验证方法（复用统一版本扫描结果）...")
+                scan = self._shared_scan('verification')
+                if scan['errors']:
+                    raise RuntimeError(f"版本扫描未完整完成: {self._scan_error_summary(scan)}")
                 
-                for page in paginator.paginate(Bucket=self.bucket_name):
-                    page_count += 1
-                    versions = page.get('Versions', [])
-                    delete_markers = page.get('DeleteMarkers', [])
-                    
-                    total_versions += len(versions)
-                    total_delete_markers += len(delete_markers)
-                    
-                    if page_count % 100 == 0:
-                        print(f"      已处理 {page_count} 页, 版本: {total_versions:,}, 删除标记: {total_delete_markers:,}")
+                counts = scan['verification']
+                current_objects = counts['current_objects_count']
+                total_versions = counts['total_versions_count']
+                total_delete_markers = counts['delete_markers_count']
                 
                 verification_result['current_objects_count'] = current_objects
                 verification_result['total_versions_count'] = total_versions
                 verification_result['delete_markers_count'] = total_delete_markers
                 verification_result['verification_performed'] = True
                 
-                print(f"    完整统计结果: 当前对象={current_objects:,}, 版本={total_versions:,}, 删除标记={total_delete_markers:,}")
+                self._print(f"    完整统计结果: 当前对象={current_objects:,}, 版本={total_versions:,}, 删除标记={total_delete_markers:,}")
             
             # 对比验证结果与之前的统计
             if hasattr(self, 'version_analysis'):
@@ -669,19 +2080,26 @@ class S3DeletionAnalyzer:
                         verification_result['verification_conclusion'] = f'独立验证发现{verification_result["delete_markers_count"]}个删除标记'
                         verification_result['confidence_in_stats'] = '高'
                 elif verification_result['sample_verification']:
-                    # 采样验证的容错度更高
-                    if verification_result['delete_markers_count'] == 0 and reported_delete_markers == 0:
+                    # 与版本控制分析同口径（时间范围内的最新删除标记）比较，以置信区间作为容差
+                    recent = verification_result['sample']['estimates']['recent_delete_markers']
+                    verified = recent['count'] if recent['count'] is not None else verification_result['sample']['sampled_counts']['recent_delete_markers']
+                    low, high = recent['count_ci'] or (verified, verified)
+                    verification_result['expected_vs_actual'].update({
+                        'verified_delete_markers': verified,
+                        'difference': abs(reported_delete_markers - verified),
+                        'confidence_interval': [low, high]
+                    })
+                    if verified == 0 and reported_delete_markers == 0:
                         verification_result['verification_conclusion'] = '采样验证确认：删除标记统计正确（均为0）'
                         verification_result['confidence_in_stats'] = '高'
-                    elif verification_result['delete_markers_count'] > 0 and reported_delete_markers == 0:
-                        verification_result['verification_conclusion'] = f'采样验证发现{verification_result["delete_markers_count"]}个删除标记，但原统计为0，可能存在统计遗漏'
+                    elif low > 0 and reported_delete_markers == 0:
+                        verification_result['verification_conclusion'] = f'采样估计有{verified:,}个删除标记（95%置信区间 {low:,}~{high:,}），但原统计为0，可能存在统计遗漏'
                         verification_result['confidence_in_stats'] = '低'
-                    elif abs(verification_result['delete_markers_count'] - reported_delete_markers) <= max(reported_delete_markers * 0.1, 5):
-                        # 采样验证允许10%的误差或最多5个差异
-                        verification_result['verification_conclusion'] = f'采样验证基本一致：原统计{reported_delete_markers}个，验证{verification_result["delete_markers_count"]}个（采样误差范围内）'
+                    elif low <= reported_delete_markers <= high or abs(verified - reported_delete_markers) <= 5:
+                        verification_result['verification_conclusion'] = f'采样验证一致：原统计{reported_delete_markers:,}个，采样估计{verified:,}个（95%置信区间 {low:,}~{high:,}）'
                         verification_result['confidence_in_stats'] = '高'
                     else:
-                        verification_result['verification_conclusion'] = f'采样验证发现差异：原统计{reported_delete_markers}个，验证{verification_result["delete_markers_count"]}个'
+                        verification_result['verification_conclusion'] = f'采样验证发现差异：原统计{reported_delete_markers:,}个，采样估计{verified:,}个（95%置信区间 {low:,}~{high:,}）'
                         verification_result['confidence_in_stats'] = '中'
                 else:
                     # 完整验证的准确度更高
@@ -698,7 +2116,7 @@ class S3DeletionAnalyzer:
                 
                 # 添加发现到报告
                 if verification_result['confidence_in_stats'] == '低':
-                    self.findings.append({
+                    self._add_finding({
                         'severity': 'HIGH',
                         'category': '统计验证',
                         'title': '⚠️ 删除标记统计可能不准确',
@@ -712,7 +2130,7 @@ class S3DeletionAnalyzer:
                         }
                     })
                 elif verification_result['confidence_in_stats'] == '高':
-                    self.findings.append({
+                    self._add_finding({
                         'severity': 'INFO',
                         'category': '统计验证',
                         'title': '✅ 删除标记统计验证通过',
@@ -727,9 +2145,9 @@ class S3DeletionAnalyzer:
         except Exception as e:
             verification_result['verification_conclusion'] = f'验证过程出错: {str(e)}'
             verification_result['confidence_in_stats'] = '未知'
-            print(f"    验证过程出错: {str(e)}")
+            self._print(f"    验证过程出错: {str(e)}")
             
-            self.findings.append({
+            self._add_finding({
                 'severity': 'MEDIUM',
                 'category': '统计验证',
                 'title': '⚠️ 无法验证删除标记统计',
@@ -742,13 +2160,28 @@ class S3DeletionAnalyzer:
         # 保存验证结果
         self.verification_result = verification_result
         
-        print(f"  ✓ 删除标记统计验证完成")
-        print(f"    - 结论: {verification_result['verification_conclusion']}")
-        print(f"    - 统计可信度: {verification_result['confidence_in_stats']}")
+        self._print(f"  ✓ 删除标记统计验证完成")
+        self._print(f"    - 结论: {verification_result['verification_conclusion']}")
+        self._print(f"    - 统计可信度: {verification_result['confidence_in_stats']}")
+    
+    def _format_sample_estimate(self, estimate):
+        """采样估计的一行说明：数量、比例和 95% 置信区间"""
+        if estimate['rate'] is None:
+            return '无法估计（样本中没有条目）'
+        parts = []
+        if estimate['count'] is not None:
+            parts.append(f"约 {estimate['count']:,} 个")
+            if estimate['count_ci']:
+                parts.append(f"95%置信区间 {estimate['count_ci'][0]:,}~{estimate['count_ci'][1]:,}")
+        rate = f"占条目 {estimate['rate']:.2%}"
+        if estimate['rate_ci']:
+            rate += f" ({estimate['rate_ci'][0]:.2%}~{estimate['rate_ci'][1]:.2%})"
+        parts.append(rate)
+        return '，'.join(parts)
     
     def _analyze_permanent_deletion(self):
         """分析永久删除迹象"""
-        print("  正在分析永久删除迹象...")
+        self._print("  正在分析永久删除迹象...")
         
         # 初始化分析结果
         permanent_deletion_analysis = {
@@ -843,7 +2276,7 @@ class S3DeletionAnalyzer:
                 "原因：CloudWatch显示大量对象删除，但未发现删除标记，且无自动删除策略"
             )
             
-            self.findings.append({
+            self._add_finding({
                 'severity': 'HIGH',
                 'category': '永久删除分析',
                 'title': '⚠️ 检测到永久删除迹象（高置信度）',
@@ -872,7 +2305,7 @@ class S3DeletionAnalyzer:
                 "结论：对象被软删除，可以通过删除删除标记来恢复"
             )
             
-            self.findings.append({
+            self._add_finding({
                 'severity': 'MEDIUM',
                 'category': '永久删除分析',
                 'title': '✅ 检测到软删除（可恢复）',
@@ -898,7 +2331,7 @@ class S3DeletionAnalyzer:
                 "结论：对象被生命周期策略自动删除"
             )
             
-            self.findings.append({
+            self._add_finding({
                 'severity': 'MEDIUM',
                 'category': '永久删除分析',
                 'title': '🔄 检测到生命周期自动删除',
@@ -920,7 +2353,7 @@ class S3DeletionAnalyzer:
             permanent_deletion_analysis['analysis_conclusion'] = '无明显删除迹象'
             permanent_deletion_analysis['confidence_level'] = '高'
             
-            self.findings.append({
+            self._add_finding({
                 'severity': 'INFO',
                 'category': '永久删除分析',
                 'title': '✅ 未检测到明显的删除迹象',
@@ -935,7 +2368,7 @@ class S3DeletionAnalyzer:
             permanent_deletion_analysis['analysis_conclusion'] = '需要进一步分析'
             permanent_deletion_analysis['confidence_level'] = '中'
             
-            self.findings.append({
+            self._add_finding({
                 'severity': 'INFO',
                 'category': '永久删除分析',
                 'title': '❓ 删除模式需要进一步分析',
@@ -954,11 +2387,11 @@ class S3DeletionAnalyzer:
         # 保存分析结果供报告使用
         self.permanent_deletion_analysis = permanent_deletion_analysis
         
-        print(f"  ✓ 永久删除分析完成")
-        print(f"    - 结论: {permanent_deletion_analysis['analysis_conclusion']}")
-        print(f"    - 置信度: {permanent_deletion_analysis['confidence_level']}")
+        self._print(f"  ✓ 永久删除分析完成")
+        self._print(f"    - 结论: {permanent_deletion_analysis['analysis_conclusion']}")
+        self._print(f"    - 置信度: {permanent_deletion_analysis['confidence_level']}")
         if permanent_deletion_analysis['evidence']:
-            print(f"    - 证据数量: {len(permanent_deletion_analysis['evidence'])}")
+            self._print(f"    - 证据数量: {len(permanent_deletion_analysis['evidence'])}")
     
     def _check_lifecycle_policy(self):
         """检查生命周期策略"""
@@ -981,7 +2414,7 @@ class S3DeletionAnalyzer:
                         })
                 
                 if deletion_rules:
-                    self.findings.append({
+                    self._add_finding({
                         'severity': 'HIGH',
                         'category': '生命周期策略',
                         'title': f'发现 {len(deletion_rules)} 条自动删除规则',
@@ -993,7 +2426,7 @@ class S3DeletionAnalyzer:
         except Exception as e:
             error_code = e.response.get('Error', {}).get('Code', '') if hasattr(e, 'response') else ''
             if error_code == 'NoSuchLifecycleConfiguration':
-                self.findings.append({
+                self._add_finding({
                     'severity': 'INFO',
                     'category': '生命周期策略',
                     'title': '未配置生命周期策略',
@@ -1054,7 +2487,7 @@ class S3DeletionAnalyzer:
             }
             
             if lifecycle_events:
-                self.findings.append({
+                self._add_finding({
                     'severity': 'MEDIUM',
                     'category': 'CloudTrail 事件',
                     'title': f'发现 {len(lifecycle_events)} 次生命周期策略变更',
@@ -1062,7 +2495,7 @@ class S3DeletionAnalyzer:
                 })
             
             if policy_events:
-                self.findings.append({
+                self._add_finding({
                     'severity': 'MEDIUM',
                     'category': 'CloudTrail 事件',
                     'title': f'发现 {len(policy_events)} 次策略变更',
@@ -1070,7 +2503,7 @@ class S3DeletionAnalyzer:
                 })
             
             if versioning_events:
-                self.findings.append({
+                self._add_finding({
                     'severity': 'MEDIUM',
                     'category': 'CloudTrail 事件',
                     'title': f'发现 {len(versioning_events)} 次版本控制变更',
@@ -1078,7 +2511,7 @@ class S3DeletionAnalyzer:
                 })
             
             if delete_events:
-                self.findings.append({
+                self._add_finding({
                     'severity': 'HIGH',
                     'category': 'CloudTrail 事件',
                     'title': f'发现 {len(delete_events)} 次删除相关操作',
@@ -1088,14 +2521,14 @@ class S3DeletionAnalyzer:
             # 如果没有任何关键事件,添加信息说明
             if not (lifecycle_events or policy_events or versioning_events or delete_events):
                 if events:
-                    self.findings.append({
+                    self._add_finding({
                         'severity': 'INFO',
                         'category': 'CloudTrail 事件',
                         'title': f'过去 {self.days} 天有 {len(events)} 个管理事件',
                         'details': '未发现关键的配置变更或删除操作'
                     })
                 else:
-                    self.findings.append({
+                    self._add_finding({
                         'severity': 'INFO',
                         'category': 'CloudTrail 事件',
                         'title': f'过去 {self.days} 天无管理事件',
@@ -1103,7 +2536,7 @@ class S3DeletionAnalyzer:
                     })
                 
         except Exception as e:
-            self.findings.append({
+            self._add_finding({
                 'severity': 'INFO',
                 'category': 'CloudTrail 事件',
                 'title': '无法获取 CloudTrail 事件',
@@ -1132,7 +2565,7 @@ class S3DeletionAnalyzer:
                         })
             
             if delete_permissions:
-                self.findings.append({
+                self._add_finding({
                     'severity': 'MEDIUM',
                     'category': 'Bucket 策略',
                     'title': '发现允许删除操作的策略',
@@ -1223,7 +2656,7 @@ class S3DeletionAnalyzer:
                             })
                 
                 if cost_changes:
-                    self.findings.append({
+                    self._add_finding({
                         'severity': 'HIGH',
                         'category': '成本异常',
                         'title': f'检测到 {len(cost_changes)} 次显著的成本下降',
@@ -1238,7 +2671,7 @@ class S3DeletionAnalyzer:
             # 如果是权限问题或 Cost Explorer 未启用，静默处理
             if 'AccessDenied' in error_msg or 'not subscribed' in error_msg:
                 self.cost_data = []
-                self.findings.append({
+                self._add_finding({
                     'severity': 'INFO',
                     'category': '成本分析',
                     'title': '无法获取成本数据',
@@ -1246,7 +2679,7 @@ class S3DeletionAnalyzer:
                 })
             else:
                 self.cost_data = []
-                self.findings.append({
+                self._add_finding({
                     'severity': 'INFO',
                     'category': '成本分析',
                     'title': '无法获取成本数据',
@@ -1254,59 +2687,24 @@ class S3DeletionAnalyzer:
                 })
     
     def _analyze_current_objects(self):
-        """分析当前对象(优化版 - 限制内存使用)"""
+        """分析当前对象（复用统一版本扫描，IsLatest 的版本即当前对象）"""
         try:
-            print("  正在列出对象(可能需要一些时间)...")
-            paginator = self.s3_client.get_paginator('list_objects_v2')
-            pages = paginator.paginate(
-                Bucket=self.bucket_name,
-                PaginationConfig={'PageSize': 1000}  # 每页1000个对象
-            )
+            self._print("  正在统计当前对象(复用统一版本扫描结果)...")
+            scan = self._shared_scan('current_objects')
+            if scan['errors']:
+                raise RuntimeError(f"版本扫描未完整完成: {self._scan_error_summary(scan)}")
             
-            total_objects = 0
-            total_size = 0
-            prefix_stats = defaultdict(lambda: {'count': 0, 'size': 0})
-            
-            page_count = 0
-            MAX_PREFIXES = 1000  # 限制前缀数量以节省内存
-            MAX_OBJECTS = 10000000  # 最多处理1000万个对象
-            
-            for page in pages:
-                page_count += 1
-                if page_count % 10 == 0:
-                    print(f"  已处理 {total_objects:,} 个对象...")
-                
-                for obj in page.get('Contents', []):
-                    total_objects += 1
-                    total_size += obj['Size']
-                    
-                    # 按前缀统计（限制数量）
-                    if len(prefix_stats) < MAX_PREFIXES:
-                        prefix = obj['Key'].split('/')[0] if '/' in obj['Key'] else 'root'
-                        prefix_stats[prefix]['count'] += 1
-                        prefix_stats[prefix]['size'] += obj['Size']
-                
-                # 如果对象数量过多，提前结束（防止内存溢出）
-                if total_objects >= MAX_OBJECTS:
-                    print(f"  对象数量过多，停止详细统计...")
-                    break
-            
-            print(f"  完成! 共 {total_objects:,} 个对象")
-            
-            self.current_stats = {
-                'total_objects': total_objects,
-                'total_size_gb': total_size / (1024**3),
-                'prefix_stats': dict(prefix_stats)
-            }
+            self.current_stats = scan['current_objects']
+            self._print(f"  完成! 共 {self.current_stats['total_objects']:,} 个对象")
             
         except Exception as e:
             self.current_stats = {'error': str(e)}
     
     def _generate_report(self):
         """生成分析报告"""
-        print(f"\n{'='*80}")
-        print("分析结果汇总")
-        print(f"{'='*80}\n")
+        self._print(f"\n{'='*80}")
+        self._print("分析结果汇总")
+        self._print(f"{'='*80}\n")
         
         # 按严重程度分组
         high_findings = [f for f in self.findings if f['severity'] == 'HIGH']
@@ -1315,63 +2713,64 @@ class S3DeletionAnalyzer:
         
         # 显示高危发现
         if high_findings:
-            print(f"🔴 高危发现 ({len(high_findings)} 项):")
-            print("-" * 80)
+            self._print(f"🔴 高危发现 ({len(high_findings)} 项):")
+            self._print("-" * 80)
             for finding in high_findings:
-                print(f"\n  [{finding['category']}] {finding['title']}")
+                self._print(f"\n  [{finding['category']}] {finding['title']}")
                 self._print_details(finding['details'], indent=4)
         
         # 显示中危发现
         if medium_findings:
-            print(f"\n🟡 中危发现 ({len(medium_findings)} 项):")
-            print("-" * 80)
+            self._print(f"\n🟡 中危发现 ({len(medium_findings)} 项):")
+            self._print("-" * 80)
             for finding in medium_findings:
-                print(f"\n  [{finding['category']}] {finding['title']}")
+                self._print(f"\n  [{finding['category']}] {finding['title']}")
                 self._print_details(finding['details'], indent=4)
         
         # 显示信息
         if info_findings:
-            print(f"\n🔵 信息 ({len(info_findings)} 项):")
-            print("-" * 80)
+            self._print(f"\n🔵 信息 ({len(info_findings)} 项):")
+            self._print("-" * 80)
             for finding in info_findings:
-                print(f"\n  [{finding['category']}] {finding['title']}")
+                self._print(f"\n  [{finding['category']}] {finding['title']}")
                 self._print_details(finding['details'], indent=4)
         
         # 当前状态
-        print(f"\n{'='*80}")
-        print("当前 Bucket 状态")
-        print(f"{'='*80}\n")
+        self._print(f"\n{'='*80}")
+        self._print("当前 Bucket 状态")
+        self._print(f"{'='*80}\n")
         if hasattr(self, 'current_stats'):
             if self.current_stats.get('skipped'):
-                print("  ⏭️  跳过对象统计 (使用了 --skip-listing 参数)")
+                self._print("  ⏭️  跳过对象统计 (使用了 --skip-listing 参数)")
             elif 'error' not in self.current_stats:
-                print(f"  对象总数: {self.current_stats.get('total_objects', 0):,}")
-                print(f"  总大小: {self.current_stats.get('total_size_gb', 0):.2f} GB")
+                self._print(f"  对象总数: {self.current_stats.get('total_objects', 0):,}")
+                self._print(f"  总大小: {self.current_stats.get('total_size_gb', 0):.2f} GB")
         
         # 结论和建议
-        print(f"\n{'='*80}")
-        print("结论和建议")
-        print(f"{'='*80}\n")
+        self._print(f"\n{'='*80}")
+        self._print("结论和建议")
+        self._print(f"{'='*80}\n")
         
         if high_findings:
-            print("  ⚠️  发现可能导致数据丢失的问题!")
-            print("\n  建议立即采取以下措施:")
-            print("  1. 检查生命周期策略,确认是否符合预期")
-            print("  2. 审查 CloudTrail 事件,确定删除操作的来源")
-            print("  3. 如果启用了版本控制,检查是否可以恢复删除的对象")
-            print("  4. 启用 CloudTrail 数据事件和 S3 Server Access Logging")
-            print("  5. 配置 S3 Inventory 以便未来追踪")
+            self._print("  ⚠️  发现可能导致数据丢失的问题!")
+            self._print("\n  建议立即采取以下措施:")
+            self._print("  1. 检查生命周期策略,确认是否符合预期")
+            self._print("  2. 审查 CloudTrail 事件,确定删除操作的来源")
+            self._print("  3. 如果启用了版本控制,检查是否可以恢复删除的对象")
+            self._print("  4. 启用 CloudTrail 数据事件和 S3 Server Access Logging")
+            self._print("  5. 配置 S3 Inventory 以便未来追踪")
         else:
-            print("  ✅ 未发现明显的数据丢失迹象")
-            print("\n  建议:")
-            print("  1. 启用版本控制以防止意外删除")
-            print("  2. 启用 CloudTrail 数据事件监控")
-            print("  3. 配置 S3 Inventory 定期生成对象清单")
+            self._print("  ✅ 未发现明显的数据丢失迹象")
+            self._print("\n  建议:")
+            self._print("  1. 启用版本控制以防止意外删除")
+            self._print("  2. 启用 CloudTrail 数据事件监控")
+            self._print("  3. 配置 S3 Inventory 定期生成对象清单")
         
         # 保存报告到 logs 目录
         timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
         json_file = os.path.join(self.logs_dir, f"s3-analysis-{self.bucket_name}-{timestamp}.json")
         md_file = os.path.join(self.logs_dir, f"s3-analysis-{self.bucket_name}-{timestamp}.md")
+        self.report_files = {'json': json_file, 'md': md_file}
         
         report_data = {
             'bucket': self.bucket_name,
@@ -1384,7 +2783,8 @@ class S3DeletionAnalyzer:
                 'count_data': [{'timestamp': d['Timestamp'].isoformat(), 'count': d['Average']} 
                               for d in getattr(self, 'count_data', [])]
             },
-            'cost_data': getattr(self, 'cost_data', [])
+            'cost_data': getattr(self, 'cost_data', []),
+            'step_timings': self.step_timings
         }
         
         # 保存 JSON
@@ -1394,9 +2794,9 @@ class S3DeletionAnalyzer:
         # 生成 Markdown 报告
         self._generate_markdown_report(md_file, report_data)
         
-        print(f"\n  JSON 报告已保存至: {json_file}")
-        print(f"  Markdown 报告已保存至: {md_file}")
-        print(f"\n{'='*80}\n")
+        self._print(f"\n  JSON 报告已保存至: {json_file}")
+        self._print(f"  Markdown 报告已保存至: {md_file}")
+        self._print(f"\n{'='*80}\n")
     
     def _generate_markdown_report(self, filename, report_data):
         """生成 Markdown 格式报告"""
@@ -1638,6 +3038,12 @@ class S3DeletionAnalyzer:
             f.write(f"- **处理状态**: {va.get('processing_status', 'N/A')}\n")
             f.write(f"- **内存优化**: {va.get('memory_optimization', 'N/A')}\n")
             f.write(f"- **已扫描页数**: {va.get('pages_scanned', 'N/A')}\n")
+            if va.get('data_source'):
+                f.write(f"- **数据来源**: {va['data_source']}\n")
+            if 'shards_scanned' in va and va.get('scan_source') != 'inventory':
+                f.write(f"- **前缀分片**: {va['shards_scanned']:,} 个（{va.get('scan_workers', 1)} 个并发线程）\n")
+            if va.get('shared_steps'):
+                f.write(f"- **共享扫描**: {' / '.join(va['shared_steps'])}（单次 list_object_versions 扫描）\n")
             f.write(f"- **时间范围**: {va.get('time_range', 'N/A')}\n\n")
                 
             # 版本控制启用时，始终显示删除标记和非当前版本章节
@@ -1650,7 +3056,7 @@ class S3DeletionAnalyzer:
                         f.write(f"### 删除标记\n\n")
                         f.write(f"**总数**: {total_dm:,} 个")
                         if shown_dm < total_dm:
-                            f.write(f" | **报告中显示**: {shown_dm:,} 个（内存优化）")
+                            f.write(f" | **报告中显示**: 最新的 {shown_dm:,} 个（内存优化）")
                         f.write("\n\n")
                         f.write("⚠️ 这些对象被标记为删除,但可以恢复\n\n")
                         f.write("| 对象键 | 删除时间 | 版本 ID |\n")
@@ -1677,10 +3083,12 @@ class S3DeletionAnalyzer:
                         total_nc = va.get('total_noncurrent_objects', len(va['noncurrent_analysis']))
                         shown_nc = len(va['noncurrent_analysis'])
                         
-                        f.write(f"### 非当前版本分析 (共 {total_nc} 个对象")
+                        f.write(f"### 非当前版本分析 (共 {total_nc:,} 个对象")
                         if shown_nc < total_nc:
-                            f.write(f"，显示前 {shown_nc} 个")
+                            f.write(f"，显示非当前版本字节数最大的 {shown_nc:,} 个")
                         f.write(")\n\n")
+                        if 'total_noncurrent_bytes' in va:
+                            f.write(f"**非当前版本总大小**: {va['total_noncurrent_bytes'] / (1024**3):.2f} GB\n\n")
                         f.write("📄 这些对象有非当前版本,可能包含被覆盖或删除的数据\n\n")
                         
                         f.write("| 对象键 | 非当前版本数 | 最近修改时间 | 总大小 (MB) |\n")
@@ -1758,11 +3166,27 @@ class S3DeletionAnalyzer:
                             f.write(f"⚠️ **发现差异**：验证发现 {eva['difference']:,} 个差异，建议进一步检查。\n\n")
                     
                     if vr['sample_verification']:
+                        sample = vr['sample']
                         f.write("### 采样说明\n\n")
-                        f.write("由于启用了 `--skip-listing` 参数，使用采样验证方法：\n")
-                        f.write("- 检查常见前缀：backup/, data/, logs/, archive/, 根目录\n")
-                        f.write("- 每个前缀最多检查1000个对象\n")
-                        f.write("- 采样结果可能不完整，建议完整验证以获得准确结果\n\n")
+                        f.write("由于启用了 `--skip-listing` 参数，使用键空间随机采样验证：\n")
+                        f.write(f"- 按前缀分为 {sample['strata']} 层，其中 {sample['census_strata']} 层不超过 {SAMPLE_CENSUS_PAGES} 页即可列完，直接精确计数\n")
+                        f.write(f"- 其余 {sample['sampled_strata']} 层按已见键的字符分布在键空间中均匀生成随机 KeyMarker，"
+                                f"共取 {sample['probes']} 个样本（每个样本连续 {SAMPLE_PROBE_KEYS} 个条目），"
+                                f"按样本的键密度估计各层大小后分层汇总（估计共 {sample['estimated_entries']:,} 个条目）\n")
+                        f.write(f"- 样本数按目标误差 ±{sample['margin']:.2%}（95% 置信水平）确定，上限 {MAX_SAMPLE_PROBES} 个；"
+                                f"共 {sample['requests']} 次请求，列出 {sample['sampled_entries']:,} 个条目\n")
+                        if sample['calibrated']:
+                            f.write(f"- 数量按 CloudWatch NumberOfObjects（{sample['total_objects']:,}）校准\n\n")
+                        elif sample['sampled_strata']:
+                            f.write("- 无法获取 CloudWatch NumberOfObjects，下表数量按各层键密度直接估计\n\n")
+                        else:
+                            f.write("\n")
+                        f.write("| 项目 | 估计 |\n")
+                        f.write("|------|------|\n")
+                        for measure, label in (('delete_markers', '删除标记'), ('recent_delete_markers', f'{self.days}天内的最新删除标记'),
+                                               ('noncurrent', '非当前版本'), ('current', '当前对象')):
+                            f.write(f"| {label} | {self._format_sample_estimate(sample['estimates'][measure])} |\n")
+                        f.write("\n采样估计假设随机 KeyMarker 的分布与对象分布相近，建议完整验证以获得准确结果\n\n")
                         f.write("**完整验证命令**：\n")
                         f.write(f"```bash\n")
                         f.write(f"python s3_deletion_analyzer.py --bucket {self.bucket_name} --days {self.days}\n")
@@ -1898,6 +3322,20 @@ class S3DeletionAnalyzer:
                 f.write("4. 设置 CloudWatch 告警监控存储量和对象数量变化\n")
                 f.write("5. 定期审查 Bucket 策略和生命周期配置\n")
             
+            # 步骤耗时
+            if self.step_timings:
+                f.write("\n---\n\n")
+                f.write("## ⏱️ 分析步骤耗时\n\n")
+                f.write("| 步骤 | 依赖 | 状态 | 开始 (秒) | 耗时 (秒) |\n")
+                f.write("|------|------|------|----------|----------|\n")
+                labels = {t['step']: t['label'] for t in self.step_timings}
+                for t in self.step_timings:
+                    depends = '、'.join(labels.get(dep, dep) for dep in t['depends_on']) or '-'
+                    start = f"{t['start_seconds']:.1f}" if t['start_seconds'] is not None else '-'
+                    duration = f"{t['duration_seconds']:.1f}" if t['duration_seconds'] is not None else '-'
+                    f.write(f"| {t['label']} | {depends} | {t['status']} | {start} | {duration} |\n")
+                f.write(f"\n*无依赖关系的步骤并发执行，总耗时 {self.steps_total_seconds:.1f} 秒*\n")
+            
             f.write("\n---\n\n")
             f.write("## 📚 参考文档\n\n")
             f.write("- [S3 CloudWatch Metrics](https://docs.aws.amazon.com/AmazonS3/latest/userguide/cloudwatch-monitoring.html)\n")
@@ -1966,22 +3404,251 @@ class S3DeletionAnalyzer:
         if isinstance(details, dict):
             for key, value in details.items():
                 if isinstance(value, (list, dict)):
-                    print(f"{prefix}{key}:")
+                    self._print(f"{prefix}{key}:")
                     self._print_details(value, indent + 2)
                 else:
-                    print(f"{prefix}{key}: {value}")
+                    self._print(f"{prefix}{key}: {value}")
         elif isinstance(details, list):
             for item in details[:5]:  # 只显示前 5 项
                 if isinstance(item, dict):
                     for key, value in item.items():
-                        print(f"{prefix}{key}: {value}")
-                    print()
+                        self._print(f"{prefix}{key}: {value}")
+                    self._print()
                 else:
-                    print(f"{prefix}- {item}")
+                    self._print(f"{prefix}- {item}")
             if len(details) > 5:
-                print(f"{prefix}... (还有 {len(details) - 5} 项)")
+                self._print(f"{prefix}... (还有 {len(details) - 5} 项)")
         else:
-            print(f"{prefix}{details}")
+            self._print(f"{prefix}{details}")
+
+
+class BucketLogWriter:
+    """批量模式下单个 bucket 的输出：按整行加上 [bucket] 前缀写入共享的日志文件
+    
+    并发分析的 bucket 共用一个文件和一把锁，每行在锁内一次写入，不同 bucket 的输出不会在行内交错。
+    """
+    
+    def __init__(self, stream, bucket, lock):
+        self.stream = stream
+        self.prefix = f"[{bucket}] "
+        self.lock = lock
+        self.pending = ''
+    
+    def write(self, text):
+        with self.lock:
+            lines = (self.pending + text).split('\n')
+            self.pending = lines.pop()
+            for line in lines:
+                self.stream.write(self.prefix + line + '\n')
+        return len(text)
+    
+    def flush(self):
+        with self.lock:
+            self.stream.flush()
+    
+    def close(self):
+        """写出最后一行不完整的输出"""
+        if self.pending:
+            self.write('\n')
+
+
+class FleetAnalyzer:
+    """批量分析多个 bucket：全局并发上限，同一区域的 bucket 共用一组 boto3 客户端
+    
+    每个 bucket 仍生成自己的 JSON/Markdown 报告，另外生成一份按删除严重程度排序的汇总报告。
+    各 bucket 的详细输出按行加上 [bucket] 前缀写入 logs/s3-fleet-<时间>.log，终端只显示每个 bucket 的完成情况。
+    """
+    
+    def __init__(self, buckets=None, region='us-east-1', max_concurrent=DEFAULT_FLEET_CONCURRENCY,
+                 workers=DEFAULT_SCAN_WORKERS, **analyzer_options):
+        self.buckets = buckets  # None 表示通过 list_buckets 发现所有 bucket
+        self.region = region  # list_buckets / get_bucket_location 使用的区域，也是无法获取位置时的默认区域
+        self.max_concurrent = max(1, max_concurrent)
+        self.workers = max(1, workers)
+        self.analyzer_options = analyzer_options
+        self.s3_client = boto3.client('s3', region_name=region)
+        self.ce_client = boto3.client('ce', region_name='us-east-1')  # Cost Explorer 只在 us-east-1，所有区域共用
+        self.clients = {}
+        self.clients_lock = threading.Lock()
+        self.log_lock = threading.Lock()
+        
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.logs_dir = os.path.join(script_dir, 'logs')
+        os.makedirs(self.logs_dir, exist_ok=True)
+    
+    def discover_buckets(self):
+        """列出账号下的所有 bucket"""
+        return [bucket['Name'] for bucket in self.s3_client.list_buckets().get('Buckets', [])]
+    
+    def bucket_region(self, bucket):
+        location = self.s3_client.get_bucket_location(Bucket=bucket).get('LocationConstraint')
+        # us-east-1 的 LocationConstraint 为空，早期的 eu-west-1 bucket 返回 EU
+        if not location:
+            return 'us-east-1'
+        return 'eu-west-1' if location == 'EU' else location
+    
+    def region_clients(self, region):
+        with self.clients_lock:
+            if region not in self.clients:
+                # 连接池需容纳该区域所有同时分析的 bucket 的扫描线程
+                self.clients[region] = create_region_clients(
+                    region, max_pool_connections=max(10, self.workers * 2 * self.max_concurrent),
+                    ce_client=self.ce_client
+                )
+            return self.clients[region]
+    
+    def _analyze_bucket(self, bucket, log):
+        summary = {
+            'bucket': bucket,
+            'region': None,
+            'status': '失败',
+            'error': None,
+            'high': 0,
+            'medium': 0,
+            'info': 0,
+            'delete_markers': 0,
+            'noncurrent_objects': 0,
+            'cloudwatch_deleted_objects': 0,
+            'conclusion': 'N/A',
+            'top_findings': [],
+            'duration_seconds': 0,
+            'reports': {}
+        }
+        started = time.monotonic()
+        output = BucketLogWriter(log, bucket, self.log_lock)
+        try:
+            try:
+                summary['region'] = self.bucket_region(bucket)
+            except Exception as e:
+                print(f"⚠️  无法获取 bucket 位置 ({str(e)})，使用 {self.region}", file=output)
+                summary['region'] = self.region
+            
+            analyzer = S3DeletionAnalyzer(
+                bucket, summary['region'], workers=self.workers,
+                clients=self.region_clients(summary['region']), output=output, **self.analyzer_options
+            )
+            analyzer.analyze()
+            
+            severities = [f['severity'] for f in analyzer.findings]
+            version_analysis = getattr(analyzer, 'version_analysis', {})
+            permanent = getattr(analyzer, 'permanent_deletion_analysis', {})
+            summary.update({
+                'status': '完成',
+                'high': severities.count('HIGH'),
+                'medium': severities.count('MEDIUM'),
+                'info': severities.count('INFO'),
+                'delete_markers': version_analysis.get('total_delete_markers', 0),
+                'noncurrent_objects': version_analysis.get('total_noncurrent_objects', 0),
+                'cloudwatch_deleted_objects': permanent.get('cloudwatch_deletion_count', 0),
+                'conclusion': permanent.get('analysis_conclusion') or 'N/A',
+                'top_findings': [f"[{f['category']}] {f['title']}" for f in analyzer.findings
+                                 if f['severity'] == 'HIGH'][:5],
+                'reports': getattr(analyzer, 'report_files', {})
+            })
+        except Exception as e:
+            summary['error'] = f"{type(e).__name__}: {e}"
+        output.close()
+        summary['duration_seconds'] = round(time.monotonic() - started, 1)
+        return summary
+    
+    @staticmethod
+    def severity_key(summary):
+        """排序键：分析失败的排最后，其余按高危、中危发现数和删除规模从重到轻"""
+        return (
+            summary['status'] == '完成',
+            summary['high'],
+            summary['medium'],
+            summary['cloudwatch_deleted_objects'],
+            summary['delete_markers']
+        )
+    
+    def analyze(self):
+        """分析所有 bucket，返回按严重程度排序的汇总"""
+        buckets = self.buckets if self.buckets is not None else self.discover_buckets()
+        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        log_file = os.path.join(self.logs_dir, f"s3-fleet-{timestamp}.log")
+        
+        print(f"\n{'='*80}")
+        print(f"S3 数据丢失批量分析")
+        print(f"Bucket 数量: {len(buckets)}，同时分析: {self.max_concurrent} 个")
+        print(f"详细输出: {log_file}")
+        print(f"{'='*80}\n")
+        
+        summaries = []
+        # 各 bucket 的详细输出按行加前缀写入日志文件，终端只显示完成情况
+        with open(log_file, 'w', encoding='utf-8') as log:
+            with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
+                futures = {executor.submit(self._analyze_bucket, bucket, log): bucket for bucket in buckets}
+                for future in as_completed(futures):
+                    summary = future.result()
+                    summaries.append(summary)
+                    if summary['status'] == '完成':
+                        message = (f"✓ [{len(summaries)}/{len(buckets)}] {summary['bucket']} ({summary['region']}): "
+                                   f"高危 {summary['high']}，中危 {summary['medium']}，"
+                                   f"删除标记 {summary['delete_markers']:,}，耗时 {summary['duration_seconds']:.0f} 秒")
+                    else:
+                        message = f"✗ [{len(summaries)}/{len(buckets)}] {summary['bucket']}: {summary['error']}"
+                    print(message, flush=True)
+        
+        summaries.sort(key=self.severity_key, reverse=True)
+        self._generate_report(summaries, timestamp)
+        return summaries
+    
+    def _generate_report(self, summaries, timestamp):
+        json_file = os.path.join(self.logs_dir, f"s3-fleet-{timestamp}.json")
+        md_file = os.path.join(self.logs_dir, f"s3-fleet-{timestamp}.md")
+        
+        print(f"\n{'='*80}")
+        print("批量分析结果（按严重程度排序）")
+        print(f"{'='*80}\n")
+        for rank, s in enumerate(summaries, 1):
+            if s['status'] == '完成':
+                print(f"  {rank}. {s['bucket']} ({s['region']}): 🔴 {s['high']} 🟡 {s['medium']}，"
+                      f"删除标记 {s['delete_markers']:,}，结论: {s['conclusion']}")
+            else:
+                print(f"  {rank}. {s['bucket']}: 分析失败 - {s['error']}")
+        
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'analysis_time': datetime.now().isoformat(),
+                'bucket_count': len(summaries),
+                'buckets': summaries
+            }, f, indent=2, ensure_ascii=False)
+        
+        with open(md_file, 'w', encoding='utf-8') as f:
+            f.write("# S3 数据丢失批量分析报告\n\n")
+            f.write(f"**分析时间**: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}  \n")
+            f.write(f"**Bucket 数量**: {len(summaries)}  \n")
+            f.write(f"**高危 Bucket**: {sum(1 for s in summaries if s['high'])}\n\n")
+            f.write("---\n\n")
+            
+            f.write("## 📊 按严重程度排序\n\n")
+            f.write("| # | Bucket | 区域 | 高危 | 中危 | 删除标记 | 非当前版本对象 | CloudWatch 删除对象 | 结论 | 报告 |\n")
+            f.write("|---|--------|------|------|------|----------|----------------|---------------------|------|------|\n")
+            for rank, s in enumerate(summaries, 1):
+                if s['status'] != '完成':
+                    f.write(f"| {rank} | `{s['bucket']}` | {s['region'] or '-'} | - | - | - | - | - | ❌ 分析失败: {s['error']} | - |\n")
+                    continue
+                report = os.path.basename(s['reports']['md']) if s['reports'].get('md') else None
+                report_link = f"[报告]({report})" if report else '-'
+                f.write(f"| {rank} | `{s['bucket']}` | {s['region']} | {s['high']} | {s['medium']} | "
+                        f"{s['delete_markers']:,} | {s['noncurrent_objects']:,} | {s['cloudwatch_deleted_objects']:,} | "
+                        f"{s['conclusion']} | {report_link} |\n")
+            f.write("\n")
+            
+            high_buckets = [s for s in summaries if s['top_findings']]
+            if high_buckets:
+                f.write("---\n\n")
+                f.write("## 🔴 高危发现\n\n")
+                for s in high_buckets:
+                    f.write(f"### `{s['bucket']}`\n\n")
+                    for title in s['top_findings']:
+                        f.write(f"- {title}\n")
+                    f.write("\n")
+        
+        print(f"\n  JSON 汇总已保存至: {json_file}")
+        print(f"  Markdown 汇总已保存至: {md_file}")
+        print(f"\n{'='*80}\n")
 
 
 def main():
@@ -2002,18 +3669,43 @@ def main():
   # 跳过对象列表(适用于大型 bucket)
   python s3_deletion_analyzer.py --bucket large-bucket --skip-listing
   
+  # 提高版本扫描并发度（按前缀分片并发列出版本）
+  python s3_deletion_analyzer.py --bucket large-bucket --workers 32
+  
+  # 使用 S3 Inventory 清单代替实时列出（需包含所有版本，支持 CSV/ORC/Parquet）
+  python s3_deletion_analyzer.py --bucket large-bucket --inventory s3://inventory-bucket/large-bucket/all-versions/2025-11-18T01-00Z/manifest.json
+  python s3_deletion_analyzer.py --bucket large-bucket --inventory ./inventory/2025-11-18T01-00Z/
+  
+  # 版本扫描中断（Ctrl+C、网络错误等）后，从 logs/checkpoints/ 中的断点继续
+  python s3_deletion_analyzer.py --bucket large-bucket --resume
+  
+  # 每30秒输出一次扫描进度，同时写入 NDJSON 进度流供其他工具读取
+  python s3_deletion_analyzer.py --bucket large-bucket --progress-interval 30 --progress-file logs/progress.ndjson
+  
+  # 批量分析多个 bucket（自动识别每个 bucket 的区域），生成按严重程度排序的汇总报告
+  python s3_deletion_analyzer.py --buckets backup-1,backup-2,backup-3 --skip-listing
+  python s3_deletion_analyzer.py --bucket-file buckets.txt --max-concurrent-buckets 8
+  python s3_deletion_analyzer.py --all-buckets --skip-listing
+  
   # 仅验证删除标记统计（快速验证）
   python s3_deletion_analyzer.py --bucket my-bucket --verify-only
   
   # 采样验证删除标记统计
   python s3_deletion_analyzer.py --bucket my-bucket --verify-only --skip-listing
   
+  # 采样验证的目标误差收紧到 ±0.2 个百分点（样本数随之增加）
+  python s3_deletion_analyzer.py --bucket large-bucket --skip-listing --sample-margin 0.002
+  
 注意:
   - 报告将保存在当前目录的 logs/ 子目录下
   - 对于包含数百万对象的 bucket,建议使用 --skip-listing 参数
         """
     )
-    parser.add_argument('--bucket', required=True, help='S3 bucket 名称')
+    targets = parser.add_mutually_exclusive_group(required=True)
+    targets.add_argument('--bucket', help='S3 bucket 名称')
+    targets.add_argument('--buckets', metavar='LIST', help='批量模式：逗号分隔的 bucket 名称')
+    targets.add_argument('--bucket-file', metavar='FILE', help='批量模式：每行一个 bucket 名称的文件 (# 开头为注释)')
+    targets.add_argument('--all-buckets', action='store_true', help='批量模式：分析账号下的所有 bucket')
     parser.add_argument('--region', default='us-east-1', help='AWS 区域 (默认: us-east-1)')
     parser.add_argument('--days', type=int, default=90, help='分析天数 (默认: 90天)')
     parser.add_argument('--skip-listing', action='store_true', 
@@ -2022,10 +3714,46 @@ def main():
                        help='调试模式：测试永久删除分析逻辑（不需要真实bucket）')
     parser.add_argument('--verify-only', action='store_true',
                        help='仅执行删除标记统计验证（快速验证模式）')
+    parser.add_argument('--workers', type=int, default=DEFAULT_SCAN_WORKERS,
+                       help=f'版本扫描的并发线程数，按前缀分片并发列出 (默认: {DEFAULT_SCAN_WORKERS})')
+    parser.add_argument('--inventory', metavar='MANIFEST',
+                       help='S3 Inventory manifest.json 位置 (s3://... 或本地文件/目录)，用清单代替实时列出版本')
+    parser.add_argument('--resume', action='store_true',
+                       help='从上次中断的版本扫描断点继续 (需使用相同的 --days 和扫描模式)')
+    parser.add_argument('--progress-interval', type=float, default=DEFAULT_PROGRESS_INTERVAL,
+                       help=f'扫描进度的最短输出间隔，单位秒 (默认: {DEFAULT_PROGRESS_INTERVAL})')
+    parser.add_argument('--progress-file', metavar='PATH',
+                       help='把扫描进度以 NDJSON 格式追加写入该文件，"-" 表示写到 stderr')
+    parser.add_argument('--verbose', action='store_true',
+                       help='输出每页和删除标记的调试信息 (大型 bucket 会产生大量输出)')
+    parser.add_argument('--max-concurrent-buckets', type=int, default=DEFAULT_FLEET_CONCURRENCY,
+                       help=f'批量模式下同时分析的 bucket 数 (默认: {DEFAULT_FLEET_CONCURRENCY})')
+    parser.add_argument('--sample-margin', type=float, default=DEFAULT_SAMPLE_MARGIN,
+                       help=f'--skip-listing 采样验证的目标误差，比例的 95%% 置信区间半宽 (默认: {DEFAULT_SAMPLE_MARGIN})')
     
     args = parser.parse_args()
+    fleet = args.buckets or args.bucket_file or args.all_buckets
+    if fleet and (args.verify_only or args.inventory or args.debug_permanent_deletion):
+        parser.error('批量模式不支持 --verify-only、--inventory 和 --debug-permanent-deletion')
     
     try:
+        if fleet:
+            if args.buckets:
+                buckets = [b.strip() for b in args.buckets.split(',') if b.strip()]
+            elif args.bucket_file:
+                with open(args.bucket_file, 'r', encoding='utf-8') as f:
+                    buckets = [name for name in (line.strip() for line in f) if name and not name.startswith('#')]
+            else:
+                buckets = None
+            fleet_analyzer = FleetAnalyzer(
+                buckets, args.region, max_concurrent=args.max_concurrent_buckets, workers=args.workers,
+                skip_object_listing=args.skip_listing, days=args.days, resume=args.resume,
+                verbose=args.verbose, progress_interval=args.progress_interval, progress_file=args.progress_file,
+                sample_margin=args.sample_margin
+            )
+            summaries = fleet_analyzer.analyze()
+            return 1 if any(s['status'] != '完成' for s in summaries) else 0
+        
         if args.debug_permanent_deletion:
             # 调试模式：测试永久删除分析逻辑
             analyzer = S3DeletionAnalyzer('test-bucket', args.region, True, args.days)
@@ -2052,7 +3780,10 @@ def main():
             print(f"Bucket: {args.bucket}")
             print(f"{'='*80}\n")
             
-            analyzer = S3DeletionAnalyzer(args.bucket, args.region, args.skip_listing, args.days)
+            analyzer = S3DeletionAnalyzer(args.bucket, args.region, args.skip_listing, args.days,
+                                          workers=args.workers, inventory=args.inventory, resume=args.resume,
+                                          verbose=args.verbose, progress_interval=args.progress_interval,
+                                          progress_file=args.progress_file, sample_margin=args.sample_margin)
             
             # 先快速获取版本控制状态
             try:
@@ -2064,6 +3795,10 @@ def main():
                 print(f"❌ 无法检查版本控制状态: {e}")
                 return 1
             
+            # 采样验证按 CloudWatch 对象总数外推
+            if args.skip_listing:
+                analyzer._analyze_cloudwatch_metrics()
+            
             # 标记这是仅验证模式，没有原始统计可对比
             analyzer.version_analysis = {'total_delete_markers': 0, 'total_noncurrent_objects': 0, 'verify_only_mode': True}
             
@@ -2090,7 +3825,10 @@ def main():
             
             return 0
         
-        analyzer = S3DeletionAnalyzer(args.bucket, args.region, args.skip_listing, args.days)
+        analyzer = S3DeletionAnalyzer(args.bucket, args.region, args.skip_listing, args.days,
+                                      workers=args.workers, inventory=args.inventory, resume=args.resume,
+                                      verbose=args.verbose, progress_interval=args.progress_interval,
+                                      progress_file=args.progress_file, sample_margin=args.sample_margin)
         analyzer.analyze()
     except Exception as e:
         print(f"\n错误: {str(e)}\n")
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+测试 S3 数据丢失分析工具的版本扫描
+"""
+
+import bisect
+import concurrent.futures
+import gzip
+import io
+import contextlib
+import json
+import os
+import random
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pyarrow as pa
+import pyarrow.orc as paorc
+import pyarrow.parquet as pq
+import pytest
+from moto import mock_aws
+
+import s3_deletion_analyzer as analyzer_module
+from s3_deletion_analyzer import (
+    FleetAnalyzer, KeyspaceSampler, NoncurrentAggregator, S3DeletionAnalyzer, ScanCheckpoint, VersionAccumulator
+)
+
+BUCKET = 'test-versioned-bucket'
+NO_CLIENTS = {'s3': None, 'cloudwatch': None, 'cloudtrail': None, 'ce': None}
+
+
+def build_bucket(s3_client, n_dirs=6, per=300, deleted=120):
+    """创建带非当前版本和删除标记的版本化 bucket"""
+    s3_client.create_bucket(Bucket=BUCKET)
+    s3_client.put_bucket_versioning(Bucket=BUCKET, VersioningConfiguration={'Status': 'Enabled'})
+    for d in range(n_dirs):
+        for i in range(per):
+            key = f'd{d}/sub{i % 3}/obj{i}' if d % 2 else f'd{d}/obj{i}'
+            s3_client.put_object(Bucket=BUCKET, Key=key, Body=b'x' * 10)
+            if i % 4 == 0:
+                s3_client.put_object(Bucket=BUCKET, Key=key, Body=b'y' * 20)
+    for i in range(deleted):
+        d = i % n_dirs
+        s3_client.delete_object(Bucket=BUCKET, Key=f'd{d}/sub{i % 3}/obj{i}' if d % 2 else f'd{d}/obj{i}')
+
+
+@pytest.fixture
+def versioned_bucket():
+    with mock_aws():
+        build_bucket(boto3.client('s3', region_name='us-east-1'))
+        yield BUCKET
+
+
+@pytest.fixture
+def make_analyzer(tmp_path):
+    """创建输出写到临时目录的分析器（断点目录在多次创建之间共用）"""
+    logs_dir = os.path.join(os.path.dirname(os.path.abspath(analyzer_module.__file__)), 'logs')
+    created_logs = not os.path.exists(logs_dir)
+
+    def make(**options):
+        analyzer = S3DeletionAnalyzer(BUCKET, workers=2, **options)
+        analyzer.logs_dir = str(tmp_path)
+        analyzer.checkpoint = ScanCheckpoint(str(tmp_path / 'checkpoints' / BUCKET))
+        return analyzer
+
+    yield make
+    if created_logs:
+        shutil.rmtree(logs_dir, ignore_errors=True)
+
+
+def scan_totals(analyzer):
+    """版本扫描得到的统计，用于比较两次扫描"""
+    versions = analyzer.version_analysis
+    return (versions['total_delete_markers'], versions['total_noncurrent_objects'],
+            versions['total_noncurrent_bytes'], analyzer.verification_result['total_versions_count'],
+            analyzer.current_stats['total_objects'])
+
+
+def slow_paginator(analyzer, first_page, delay):
+    """列出版本的每一页都延迟 delay 秒，第一次取到分片的页面时设置 first_page"""
+    original = analyzer.s3_client.get_paginator
+
+    class Paginator:
+        def __init__(self, paginator):
+            self.paginator = paginator
+
+        def paginate(self, **params):
+            for page in self.paginator.paginate(**params):
+                if 'Delimiter' not in params:
+                    first_page.set()
+                    time.sleep(delay)
+                yield page
+
+    analyzer.s3_client.get_paginator = lambda name: Paginator(original(name))
+
+
+def interrupt_scan(make_analyzer, monkeypatch, **options):
+    """在版本扫描取到第一页后模拟 Ctrl+C，返回 (被中断的分析器, 输出, 耗时)"""
+    first_page = threading.Event()
+    real_wait = analyzer_module.wait
+
+    def interrupting_wait(futures, timeout=None, return_when=concurrent.futures.ALL_COMPLETED):
+        if return_when == concurrent.futures.FIRST_COMPLETED:
+            first_page.wait(10)
+            raise KeyboardInterrupt
+        return real_wait(futures, timeout, return_when)
+
+    interrupted = make_analyzer(**options)
+    slow_paginator(interrupted, first_page, delay=0.5)
+    monkeypatch.setattr(analyzer_module, 'wait', interrupting_wait)
+    started = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        with pytest.raises(KeyboardInterrupt):
+            interrupted.analyze()
+    elapsed = time.monotonic() - started
+    monkeypatch.setattr(analyzer_module, 'wait', real_wait)
+    return interrupted, output.getvalue(), elapsed
+
+
+def count_version_pages(analyzer):
+    """统计分析器列出版本的页数"""
+    pages = []
+    original = analyzer.s3_client.get_paginator
+
+    class Paginator:
+        def __init__(self, paginator):
+            self.paginator = paginator
+
+        def paginate(self, **params):
+            for page in self.paginator.paginate(**params):
+                pages.append(params.get('Prefix'))
+                yield page
+
+    analyzer.s3_client.get_paginator = lambda name: Paginator(original(name)) if name == 'list_object_versions' \
+        else original(name)
+    return pages
+
+
+def test_interrupt_saves_checkpoint_and_resumes(versioned_bucket, make_analyzer, monkeypatch):
+    """Ctrl+C 在主线程抛出：扫描线程保存断点后退出，--resume 的结果与完整扫描一致"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = make_analyzer()
+        full_pages = count_version_pages(expected)
+        expected.analyze()
+    # build_bucket 删除了 120 个对象，每个对象留下一个最新的删除标记
+    assert scan_totals(expected)[0] == 120
+    assert len(expected.version_analysis['delete_markers']) == 120
+
+    interrupted, output, elapsed = interrupt_scan(make_analyzer, monkeypatch)
+    assert interrupted.stop_event.is_set()
+    assert '[扫描中断]' in output
+    # 两个线程各自处理完当前页就退出，没有继续扫描剩余的分片
+    assert elapsed < 3
+    plan = interrupted.checkpoint.load_plan()
+    assert plan is not None and plan['names'] == ['versioning', 'verification', 'current_objects']
+
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        resumed = make_analyzer(resume=True)
+        resumed_pages = count_version_pages(resumed)
+        resumed.analyze()
+    assert '[断点续扫]' in output.getvalue()
+    # 调试信息只在 --verbose 时输出
+    assert '[调试' not in output.getvalue()
+    assert scan_totals(resumed) == scan_totals(expected)
+    # 已完成的分片和页不再列出
+    assert len(resumed_pages) < len(full_pages)
+    assert not os.path.exists(resumed.checkpoint.directory)
+
+
+def test_failed_shard_reports_exception_type(versioned_bucket, make_analyzer, monkeypatch):
+    """分片列出失败时报告中记录实际的异常类名"""
+    monkeypatch.setattr(analyzer_module, 'SHARD_RETRIES', 0)
+    monkeypatch.setattr(analyzer_module.time, 'sleep', lambda seconds: None)
+    analyzer = make_analyzer()
+    original = analyzer.s3_client.get_paginator
+
+    class Paginator:
+        def __init__(self, paginator):
+            self.paginator = paginator
+
+        def paginate(self, **params):
+            if params.get('Prefix') == 'd3/':
+                raise ConnectionResetError('connection reset by peer')
+            yield from self.paginator.paginate(**params)
+
+    analyzer.s3_client.get_paginator = lambda name: Paginator(original(name)) if name == 'list_object_versions' \
+        else original(name)
+    with contextlib.redirect_stdout(io.StringIO()):
+        analyzer.analyze()
+
+    details = [f['details'] for f in analyzer.findings
+               if f['category'] == '版本控制' and isinstance(f['details'], dict) and 'exception_type' in f['details']]
+    assert len(details) == 1
+    assert details[0]['exception_type'] == 'ConnectionResetError'
+    assert 'd3/: ConnectionResetError' in details[0]['exception_message']
+
+
+def test_resume_with_different_days_rescans(versioned_bucket, make_analyzer, monkeypatch):
+    """断点的分析天数与本次不同时丢弃断点，重新扫描的结果与完整扫描一致"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = make_analyzer(days=30)
+        expected.analyze()
+
+    interrupt_scan(make_analyzer, monkeypatch)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        resumed = make_analyzer(resume=True, days=30)
+        resumed.analyze()
+    assert '没有可用的断点' in output.getvalue()
+    assert scan_totals(resumed) == scan_totals(expected)
+    assert not os.path.exists(resumed.checkpoint.directory)
+
+
+class FakeVersionsClient:
+    """内存中的 list_object_versions，用于大 bucket 的采样测试（moto 逐个 KeyMarker 请求太慢）
+
+    keys 为 [(键, [是否删除标记, ...])]，同一个键的版本从新到旧排列。
+    """
+
+    def __init__(self, keys):
+        now = datetime.now(timezone.utc)
+        self.entries = sorted((key, index, is_delete_marker, index == 0, now)
+                              for key, history in keys for index, is_delete_marker in enumerate(history))
+        self.keys = [entry[0] for entry in self.entries]
+
+    def list_object_versions(self, Bucket, Prefix='', MaxKeys=1000, Delimiter=None, KeyMarker=None,
+                             VersionIdMarker=None):
+        i = bisect.bisect_left(self.keys, Prefix)
+        if KeyMarker:
+            i = max(i, bisect.bisect_right(self.keys, KeyMarker))
+            if VersionIdMarker:
+                i = bisect.bisect_left(self.entries, (KeyMarker, int(VersionIdMarker) + 1))
+        page = {'Versions': [], 'DeleteMarkers': [], 'CommonPrefixes': [], 'IsTruncated': False}
+        count = 0
+        while i < len(self.entries) and self.keys[i].startswith(Prefix):
+            if count == MaxKeys:
+                page['IsTruncated'] = True
+                break
+            key, index, is_delete_marker, is_latest, modified = self.entries[i]
+            if Delimiter and Delimiter in key[len(Prefix):]:
+                common_prefix = key[:key.index(Delimiter, len(Prefix)) + 1]
+                page['CommonPrefixes'].append({'Prefix': common_prefix})
+                page['NextKeyMarker'], version_id = common_prefix, None
+                i = bisect.bisect_left(self.keys, common_prefix + '\U0010ffff')
+            else:
+                entry = {'Key': key, 'VersionId': str(index), 'IsLatest': is_latest, 'LastModified': modified}
+                page['DeleteMarkers' if is_delete_marker else 'Versions'].append(entry)
+                page['NextKeyMarker'], version_id = key, str(index)
+                i += 1
+            count += 1
+        if page['IsTruncated'] and version_id is not None:
+            page['NextVersionIdMarker'] = version_id
+        return page
+
+    def get_paginator(self, name):
+        client = self
+
+        class Paginator:
+            def paginate(self, PaginationConfig=None, **params):
+                params['MaxKeys'] = (PaginationConfig or {}).get('PageSize', 1000)
+                while True:
+                    page = client.list_object_versions(**params)
+                    yield page
+                    if not page['IsTruncated']:
+                        return
+                    params['KeyMarker'] = page['NextKeyMarker']
+                    params.pop('VersionIdMarker', None)
+                    if page.get('NextVersionIdMarker'):
+                        params['VersionIdMarker'] = page['NextVersionIdMarker']
+
+        return Paginator()
+
+
+def test_keyspace_sampler_covers_skewed_strata(make_analyzer):
+    """大小悬殊的两层：20 万个干净的键 + 6000 个一半带删除标记的键，置信区间应覆盖真实的 3000 个"""
+    keys = [(f'clean/obj{i:06d}', [False]) for i in range(200000)]
+    keys += [(f'dirty/obj{i:05d}', [True, False] if i % 2 else [False]) for i in range(6000)]
+    client = FakeVersionsClient(keys)
+    analyzer = make_analyzer(clients={'s3': client, 'cloudwatch': None, 'cloudtrail': None, 'ce': None})
+    total_objects = len(client.entries)
+
+    for calibrate in (True, False):
+        covered = 0
+        for seed in range(20):
+            sample = KeyspaceSampler(analyzer, rng=random.Random(seed)).run(
+                total_objects=total_objects if calibrate else None)
+            assert sample['sampled_strata'] == 2 and sample['calibrated'] == calibrate
+            estimate = sample['estimates']['delete_markers']
+            low, high = estimate['count_ci']
+            covered += low <= 3000 <= high
+            # 各层按大小加权：小而"脏"的层不会把整体数量放大
+            assert estimate['count'] < 6000
+        assert covered >= 17, (calibrate, covered)
+
+
+def test_fleet_writes_bucket_output_to_log(versioned_bucket, make_analyzer, tmp_path, capsys):
+    """批量模式下各 bucket 的输出按行加前缀写入日志文件，不重定向进程的 stdout；Cost Explorer 客户端只创建一个"""
+    s3_client = boto3.client('s3', region_name='us-east-1')
+    s3_client.create_bucket(Bucket='second-bucket')
+    s3_client.put_object(Bucket='second-bucket', Key='a.txt', Body=b'x')
+
+    fleet = FleetAnalyzer([versioned_bucket, 'second-bucket'], max_concurrent=2, workers=2)
+    fleet.logs_dir = str(tmp_path)
+    summaries = fleet.analyze()
+
+    assert sorted(s['bucket'] for s in summaries) == sorted([versioned_bucket, 'second-bucket'])
+    assert all(s['status'] == '完成' for s in summaries), summaries
+    assert len({id(clients['ce']) for clients in fleet.clients.values()} | {id(fleet.ce_client)}) == 1
+
+    console = capsys.readouterr().out
+    assert 'S3 数据丢失分析报告' not in console
+    assert console.count('✓ [') == 2
+    with open(next(tmp_path.glob('s3-fleet-*.log')), encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines and all(line.startswith((f'[{versioned_bucket}] ', '[second-bucket] ')) for line in lines)
+    assert f'[second-bucket] Bucket: second-bucket' in lines
+
+
+def test_delete_marker_details_keep_newest(make_analyzer, monkeypatch):
+    """删除标记计数精确，详情按时间只保留最新的 MAX_DELETE_MARKERS 条，与各分片的处理顺序无关"""
+    monkeypatch.setattr(analyzer_module, 'MAX_DELETE_MARKERS', 10)
+    analyzer = make_analyzer(clients=NO_CLIENTS)
+    base = datetime.now(timezone.utc) - timedelta(days=1)
+    markers = [{'Key': f'obj{i:03d}', 'VersionId': f'v{i}', 'IsLatest': True,
+                'LastModified': base + timedelta(minutes=i)} for i in range(50)]
+    random.Random(3).shuffle(markers)
+    # 非最新的删除标记和分析时间范围之外的删除标记不计入
+    markers += [{'Key': 'old', 'VersionId': 'v-old', 'IsLatest': True, 'LastModified': base - timedelta(days=365)},
+                {'Key': 'shadowed', 'VersionId': 'v-s', 'IsLatest': False, 'LastModified': base + timedelta(hours=2)}]
+
+    shards = [VersionAccumulator(analyzer) for _ in range(3)]
+    for page, start in enumerate(range(0, len(markers), 7)):
+        shards[page % 3].add_page({'DeleteMarkers': markers[start:start + 7]})
+    merged = shards[0]
+    for shard in shards[1:]:
+        merged.merge(shard)
+    result = merged.result()
+
+    assert merged.delete_markers_count == 50
+    newest = [f'obj{i:03d}' for i in range(49, 39, -1)]
+    assert [dm['Key'] for dm in result['delete_markers']] == newest
+
+    # 清单路径同样只保留最新的 10 条
+    table = pa.table({
+        'key': [dm['Key'] for dm in markers],
+        'version_id': [dm['VersionId'] for dm in markers],
+        'is_latest': [dm['IsLatest'] for dm in markers],
+        'is_delete_marker': [True] * len(markers),
+        'size': pa.array([0] * len(markers), type=pa.int64()),
+        'last_modified': pa.array([dm['LastModified'] for dm in markers], type=pa.timestamp('ms', tz='UTC')),
+    })
+    accumulator = VersionAccumulator(analyzer)
+    accumulator.add_table(table.slice(0, 25))
+    accumulator.add_table(table.slice(25))
+    assert accumulator.delete_markers_count == 50
+    assert [dm['Key'] for dm in accumulator.result()['delete_markers']] == newest
+
+
+def aggregate_shards(memory_keys, spill_dir, rng_seed=7):
+    """四个分片各自聚合随机的非当前版本后合并，返回汇总"""
+    rng = random.Random(rng_seed)
+    base = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    shards = [NoncurrentAggregator(memory_keys, str(spill_dir)) for _ in range(4)]
+    for _ in range(20000):
+        shard = rng.choice(shards)
+        modified = base + timedelta(seconds=rng.randrange(10**6))
+        shard.add(f'obj{rng.randrange(3000):05d}', 1, rng.randrange(1, 10**6), modified)
+    merged = shards[0]
+    for shard in shards[1:]:
+        merged.merge(shard)
+    result = merged.summary(50)
+    spills = merged.spills
+    merged.close()
+    return result, spills
+
+
+def test_noncurrent_spill_matches_in_memory(tmp_path):
+    """超出内存预算溢出到 SQLite 后合并的结果与全部在内存中聚合完全一致，临时文件被删除"""
+    in_memory, spills = aggregate_shards(10**6, tmp_path)
+    assert spills == 0
+    spilled, spills = aggregate_shards(100, tmp_path)
+    assert spills > 4
+    assert spilled == in_memory
+    assert list(tmp_path.iterdir()) == []
+
+
+INVENTORY_SUFFIXES = {'CSV': 'csv.gz', 'ORC': 'orc', 'Parquet': 'parquet'}
+
+
+def write_inventory(directory, file_format, write_data, **manifest):
+    """在本地目录写入 manifest.json 和 data/ 下的一个数据文件，返回 manifest 路径"""
+    name = f'data/part-0.{INVENTORY_SUFFIXES[file_format]}'
+    os.makedirs(directory / 'data')
+    write_data(str(directory / name))
+    manifest.update(sourceBucket=BUCKET, destinationBucket='arn:aws:s3:::inventory-bucket',
+                    fileFormat=file_format, files=[{'key': f'inventory/{BUCKET}/{name}'}])
+    (directory / 'manifest.json').write_text(json.dumps(manifest), encoding='utf-8')
+    return str(directory / 'manifest.json')
+
+
+def read_inventory(make_analyzer, location):
+    """按 --inventory 的方式读取清单中的唯一数据文件，返回列名和按行的字典"""
+    analyzer = make_analyzer(inventory=location, clients=NO_CLIENTS)
+    manifest = analyzer._load_inventory_manifest()
+    table = analyzer._read_inventory_file(manifest, manifest['files'][0])
+    return table.column_names, table.to_pylist()
+
+
+def test_inventory_csv_follows_file_schema(make_analyzer, tmp_path):
+    """无表头的 gzip CSV 按 fileSchema 的列顺序读取，对象键做 URL 解码，删除标记的空大小记为 0"""
+    rows = [
+        '"src","dir%20a/file+1.txt","v2","true","false","10","2026-10-18T00:00:00.000Z","etag1"',
+        '"src","dir%20a/file+1.txt","v1","false","false","20","2026-10-17T00:00:00.000Z","etag2"',
+        '"src","100%25+done%2Bmore","v3","true","true","","2026-10-18T12:00:00.000Z",""',
+    ]
+
+    def write_csv(path):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write('\n'.join(rows) + '\n')
+
+    location = write_inventory(tmp_path, 'CSV', write_csv, fileSchema=(
+        'Bucket, Key, VersionId, IsLatest, IsDeleteMarker, Size, LastModifiedDate, ETag'))
+    columns, records = read_inventory(make_analyzer, str(tmp_path))
+
+    assert columns == ['key', 'version_id', 'is_latest', 'is_delete_marker', 'size', 'last_modified']
+    assert [r['key'] for r in records] == ['dir a/file 1.txt', 'dir a/file 1.txt', '100% done+more']
+    assert [(r['version_id'], r['is_latest'], r['is_delete_marker'], r['size']) for r in records] == [
+        ('v2', True, False, 10), ('v1', False, False, 20), ('v3', True, True, 0)]
+    assert records[2]['last_modified'] == datetime(2026, 10, 18, 12, tzinfo=timezone.utc)
+    assert read_inventory(make_analyzer, location)[1] == records
+
+
+@pytest.mark.parametrize('file_format', ['ORC', 'Parquet'])
+def test_inventory_columnar_selects_fields(make_analyzer, tmp_path, file_format):
+    """ORC/Parquet 只读取需要的列，多余的列（bucket、e_tag 等）不出现在结果中"""
+    table = pa.table({
+        'bucket': ['src', 'src'],
+        'key': ['a/b c.txt', 'a/d.txt'],
+        'version_id': ['v1', 'v2'],
+        'is_latest': [True, False],
+        'is_delete_marker': [False, True],
+        'size': pa.array([5, None], type=pa.int64()),
+        'last_modified_date': pa.array([datetime(2026, 10, 18, tzinfo=timezone.utc)] * 2,
+                                       type=pa.timestamp('ms', tz='UTC')),
+        'e_tag': ['etag', None],
+    })
+    write = paorc.write_table if file_format == 'ORC' else pq.write_table
+    write_inventory(tmp_path, file_format, lambda path: write(table, path))
+    columns, records = read_inventory(make_analyzer, str(tmp_path))
+
+    assert columns == ['key', 'version_id', 'is_latest', 'is_delete_marker', 'size', 'last_modified']
+    # 列式格式的对象键不做 URL 编码，原样保留
+    assert [(r['key'], r['version_id'], r['is_latest'], r['is_delete_marker'], r['size']) for r in records] == [
+        ('a/b c.txt', 'v1', True, False, 5), ('a/d.txt', 'v2', False, True, 0)]
+
+
+def test_inventory_current_versions_only(make_analyzer, tmp_path):
+    """只包含当前版本的清单没有版本列，所有记录视为当前版本、非删除标记"""
+    table = pa.table({
+        'key': ['x.txt', 'y.txt'],
+        'size': pa.array([1, 2], type=pa.int64()),
+        'last_modified_date': pa.array([datetime(2026, 10, 18, tzinfo=timezone.utc)] * 2,
+                                       type=pa.timestamp('ms', tz='UTC')),
+    })
+    write_inventory(tmp_path, 'Parquet', lambda path: pq.write_table(table, path))
+    _, records = read_inventory(make_analyzer, str(tmp_path))
+
+    assert [(r['key'], r['version_id'], r['is_latest'], r['is_delete_marker'], r['size']) for r in records] == [
+        ('x.txt', None, True, False, 1), ('y.txt', None, True, False, 2)]